@@ -9,9 +9,10 @@ trigger should be pressed.
 from __future__ import unicode_literals
 from scc.tools import _
 
-from scc.tools import ensure_size, quat2euler, anglediff
+from scc.tools import ensure_size
 from scc.tools import circle_to_square, clamp, nameof
 from scc.uinput import Keys, Axes, Rels
+from scc.gyro import GyroAbsState, AXIS_MOUSE, AXIS_NONE
 from scc.lib import xwrappers as X
 from scc.constants import STICK_PAD_MIN, STICK_PAD_MAX, STICK_PAD_MIN_HALF
 from scc.constants import STICK_PAD_MAX_HALF, TRIGGER_MIN, TRIGGER_HALF
@@ -1225,20 +1226,28 @@ class GyroAction(Action):
 
 
 class GyroAbsAction(HapticEnabledAction, GyroAction):
-	""" Uses *absolute* gyroscope position as input for emulated axes """
+	"""
+	Uses *absolute* gyroscope position as input for emulated axes.
+	Math is done by libgyro, see scc.gyro.
+	"""
 	COMMAND = "gyroabs"
-	MOUSE_FACTOR = 0.01	# Just random number to put default sensitivity into sane range
 	
 	def __init__(self, *blah):
 		GyroAction.__init__(self, *blah)
 		HapticEnabledAction.__init__(self)
-		self.ir = [ 0, 0, None, 0 ]	# Initial rotation, last has to be determined
 		self._was_oor = False
-		self._deadzone_fn = None
+		self._deadzone = None	# Set by DeadzoneModifier.compress
+		self._state = None		# Created on first use, see _get_state
 	
 	
 	def reset(self):
-		self.ir = [ None, None, None, None ]	# Determine everything
+		if self._state is not None:
+			self._state.reset()	# Determine initial rotation again
+	
+	
+	def set_speed(self, x, y, z):
+		GyroAction.set_speed(self, x, y, z)
+		self._state = None
 	
 	
 	def get_compatible_modifiers(self):
@@ -1250,47 +1259,37 @@ class GyroAbsAction(HapticEnabledAction, GyroAction):
 	def get_previewable(self):
 		return True
 	
-	GYROAXES = (0, 1, 2)
+	
+	def _get_state(self):
+		if self._state is None:
+			self._state = GyroAbsState(self.axes, self.speed, self._deadzone)
+			self._mouse_axes = [ (i, self.axes[i]) for i in (0, 1, 2)
+					if self._state.kind[i] == AXIS_MOUSE ]
+			self._gamepad_axes = [ (i, self.axes[i]) for i in (0, 1, 2)
+					if self._state.kind[i] not in (AXIS_MOUSE, AXIS_NONE) ]
+		return self._state
+	
+	
 	def gyro(self, mapper, pitch, yaw, roll, q1, q2, q3, q4):
-		if mapper.get_controller().flags & ControllerFlags.EUREL_GYROS:
-			pyr = [q1 / 10430.37, q2 / 10430.37, q3 / 10430.37]	# 2**15 / PI
-		else:
-			pyr = list(quat2euler(q1 / 32768.0, q2 / 32768.0, q3 / 32768.0, q4 / 32768.0))
-		for i in self.GYROAXES:
-			self.ir[i] = self.ir[i] or pyr[i]
-			pyr[i] = anglediff(self.ir[i], pyr[i]) * (2**15) * self.speed[2] * 2 / PI
+		state = self._get_state()
+		eurel = mapper.get_controller().flags & ControllerFlags.EUREL_GYROS
+		mapper.gyro_report.decode(q1, q2, q3, q4, eurel)
+		out = state.compute(mapper.gyro_report)
 		if self.haptic:
-			oor = False # oor - Out Of Range
-			for i in self.GYROAXES:
-				pyr[i] = int(pyr[i])
-				if pyr[i] > STICK_PAD_MAX:
-					pyr[i] = STICK_PAD_MAX
-					oor = True
-				elif pyr[i] < STICK_PAD_MIN:
-					pyr[i] = STICK_PAD_MIN
-					oor = True
-			if oor:
+			if state.oor:	# oor - Out Of Range
 				if not self._was_oor:
 					mapper.send_feedback(self.haptic)
 					self._was_oor = True
 			else:
 				self._was_oor = False
-		else:
-			for i in self.GYROAXES:
-				pyr[i] = int(clamp(STICK_PAD_MIN, pyr[i], STICK_PAD_MAX))
-		for i in self.GYROAXES:
-			axis = self.axes[i]
-			if axis in Axes or type(axis) == int:
-				val = AxisAction.clamp_axis(axis, pyr[i] * self.speed[i])
-				if self._deadzone_fn:
-					val, trash = self._deadzone_fn(val, 0, STICK_PAD_MAX)
-					val = int(val)
-				mapper.gamepad.axisEvent(axis, val)
-				mapper.syn_list.add(mapper.gamepad)
-			elif axis == Rels.REL_X:
-				mapper.mouse_move(AxisAction.clamp_axis(axis, pyr[i] * GyroAbsAction.MOUSE_FACTOR * self.speed[i]), 0)
-			elif axis == Rels.REL_Y:
-				mapper.mouse_move(0, AxisAction.clamp_axis(axis, pyr[i] * GyroAbsAction.MOUSE_FACTOR * self.speed[i]))
+		for i, axis in self._gamepad_axes:
+			mapper.gamepad.axisEvent(axis, out[i])
+			mapper.syn_list.add(mapper.gamepad)
+		for i, axis in self._mouse_axes:
+			if axis == Rels.REL_X:
+				mapper.mouse_move(out[i], 0)
+			else:
+				mapper.mouse_move(0, out[i])
 
 
 class ResetGyroAction(Action):
@@ -1381,7 +1380,7 @@ class TiltAction(MultichildAction):
 	
 	def gyro(self, mapper, *pyr):
 		q1, q2, q3, q4 = pyr[-4:]
-		pyr = quat2euler(q1 / 32768.0, q2 / 32768.0, q3 / 32768.0, q4 / 32768.0)
+		pyr = mapper.gyro_report.decode(q1, q2, q3, q4)
 		for j in (0, 1, 2):
 			i = j * 2
 			if self.actions[i]:
@@ -1443,7 +1442,7 @@ class ButtonAction(HapticEnabledAction, Action):
 		Keys.BTN_RIGHT	: "Mouse Right",
 		Keys.BTN_SIDE	: "Mouse 8",
 		Keys.BTN_EXTRA	: "Mouse 9",
-
+		
 		Keys.BTN_TR		: "Right Bumper",
 		Keys.BTN_TL		: "Left Bumper",
 		Keys.BTN_THUMBL	: "LStick Click",
@@ -2329,7 +2328,7 @@ class XYAction(WholeHapticAction, Action):
 	
 	def __str__(self):
 		return "<%s %s >" % (self.COMMAND, ", ".join([ str(x) for x in self.actions ]), )
-
+	
 	__repr__ = __str__
 
 
@@ -2471,7 +2470,7 @@ class HipfireAction(Action, HapticEnabledAction):
 	Hip fire style trigger setting the two ranges for two different actions
 	allowing activating the fully pressed action without activating partially pressed one
 	"""
-
+	
 	COMMAND = "hipfire"
 	PROFILE_KEYS = "levels",
 	DEFAULT_TIMEOUT = 0.15
@@ -2489,7 +2488,7 @@ class HipfireAction(Action, HapticEnabledAction):
 		self.fullpress_level = HipfireAction.DEFAULT_FULLPRESS_LEVEL
 		self.mode = HipfireAction.DEFAULT_MODE
 		self.timeout = HipfireAction.DEFAULT_TIMEOUT
-
+		
 		if len(params) >= 2:
 			if type(params[0]) in (int, float):
 				self.partialpress_level = int(params[0])
@@ -2498,7 +2497,7 @@ class HipfireAction(Action, HapticEnabledAction):
 					params = params[2:]
 				else:
 					params = params[1:]
-
+			
 			self.partialpress_action = params[0]
 			self.fullpress_action = params[1]
 			if len(params) >= 3:
@@ -2507,15 +2506,16 @@ class HipfireAction(Action, HapticEnabledAction):
 				self.timeout = params[3]
 		else:
 			raise TypeError("Invalid number of parameters")
-
+		
 		if self.mode not in (HIPFIRE_NORMAL, HIPFIRE_EXCLUSIVE, HIPFIRE_SENSIBLE):
 			raise ValueError("Invalid hipfire mode")
 		self.partialpress_active = False
 		self.range = "None"
 		self.waiting_task = None
+		self.release_task = None
 		self.sensible_state = "READY"
 		self._partialpress_level = self.partialpress_level
-
+	
 	
 	@staticmethod
 	def decode(data, a, parser, *b):
@@ -2524,7 +2524,7 @@ class HipfireAction(Action, HapticEnabledAction):
 		if HipfireAction.TIMEOUT_KEY in data:
 			a.timeout = data[HipfireAction.TIMEOUT_KEY]
 		return a
-
+	
 			
 	def get_compatible_modifiers(self):
 		return Action.MOD_FEEDBACK
@@ -2552,6 +2552,7 @@ class HipfireAction(Action, HapticEnabledAction):
 	
 	
 	def _partial_release(self, mapper):
+		self.release_task = None
 		self.partialpress_active = False
 		if self.haptic:
 			mapper.send_feedback(self.haptic)
@@ -2570,7 +2571,7 @@ class HipfireAction(Action, HapticEnabledAction):
 	
 	def trigger(self, mapper, position, old_position):
 		# Checks the current position of the trigger and apply the action based on three possible range: [None, PARTIALPRESS, FULLPRESS]
-
+		
 		# Checks full press first to prevent unnecessary conditional evaluation
 		if position >= self.fullpress_level and old_position < self.fullpress_level:
 			self.range = "FULLPRESS"
@@ -2578,7 +2579,7 @@ class HipfireAction(Action, HapticEnabledAction):
 			
 			# Checks if it's in exclusive mode and if partial press is active before activating
 			if (self.mode == HIPFIRE_EXCLUSIVE) and self.partialpress_active: return
-
+			
 			self._full_press(mapper)
 			# Cancel any pending timer to prevent partially pressed action from activating
 			if self.waiting_task:
@@ -2601,7 +2602,7 @@ class HipfireAction(Action, HapticEnabledAction):
 					self.waiting_task = None
 				# Start the timer to execute the action if the full press range is not reached before timeout
 				self.waiting_task = mapper.schedule(self.timeout, self.on_timeout)
-
+			
 			# Spliting conditional for treating the sensible mode
 			# in this mode after reaching the partial press level, releasing the trigger a little will cause it to deactivate the action
 			# allowing fast repeatly presses without needing to release the trigger the all the way back
@@ -2617,10 +2618,10 @@ class HipfireAction(Action, HapticEnabledAction):
 						mapper.cancel_task(self.waiting_task)
 						self.waiting_task = None
 						self._partial_press(mapper)
-						mapper.schedule(0.02, self._partial_release)
+						self.release_task = mapper.schedule(0.02, self._partial_release)
 					else:
 						self._partial_release(mapper)
-
+				
 				elif self.sensible_state != "PRESSED" and position >= self.new_partialpress_level and old_position < self.new_partialpress_level:
 					# Activate the action (schedule) again without needed to release the action until the partial press level
 					self.sensible_state = "PRESSED"
@@ -2629,7 +2630,7 @@ class HipfireAction(Action, HapticEnabledAction):
 						self.waiting_task = None
 					#start the timer to execute the action if the full press is not reached before timeout
 					self.waiting_task = mapper.schedule(self.timeout, self.on_timeout)
-
+		
 		## Normal release of the partial press, deactivates the partially pressed action if it was active or if the time was still going schedule a short press 
 		elif position < self.partialpress_level and old_position >= self.partialpress_level:
 			self.range = "NONE"
@@ -2637,14 +2638,34 @@ class HipfireAction(Action, HapticEnabledAction):
 				mapper.cancel_task(self.waiting_task)
 				self.waiting_task = None
 				self._partial_press(mapper)
-				mapper.schedule(0.02, self._partial_release)
+				self.release_task = mapper.schedule(0.02, self._partial_release)
 			else:
 				self._partial_release(mapper)
-
+			
 			# reset the sensible state
 			self.sensible_state = "READY"
 			self.new_partialpress_level = self.partialpress_level
-
+	
+	
+	def cancel(self, mapper):
+		# Releases whatever is pressed and resets trigger to initial range
+		if self.waiting_task:
+			mapper.cancel_task(self.waiting_task)
+			self.waiting_task = None
+		if self.release_task:
+			mapper.cancel_task(self.release_task)
+			self.release_task = None
+		if self.partialpress_active:
+			self.partialpress_active = False
+			self.partialpress_action.button_release(mapper)
+		if self.range == "FULLPRESS":
+			self.fullpress_action.button_release(mapper)
+		self.range = "NONE"
+		self.sensible_state = "READY"
+		self.new_partialpress_level = self.partialpress_level
+		self.partialpress_action.cancel(mapper)
+		self.fullpress_action.cancel(mapper)
+	
 	
 	def describe(self, context):
 		l = [ ]
@@ -2678,7 +2699,7 @@ class NoAction(Action):
 	
 	def __bool__(self):
 		return False
-
+	
 	__nonzero__ = __bool__
 	
 	
@@ -2712,7 +2733,7 @@ class NoAction(Action):
 	
 	def __str__(self):
 		return "NoAction"
-
+	
 	__repr__ = __str__
 
 
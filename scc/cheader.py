@@ -25,6 +25,7 @@
 
 import ast
 import os
+import json
 import shlex
 from collections import OrderedDict
 import operator as op
@@ -74,11 +75,15 @@ def eval_expr(expr):
 	return _eval(ast.parse(expr, mode='eval').body)
 
 
-def defines(base, include):
+def defines(base, include, parsed=None):
 
-	""" Extract #define from base/include following #includes """
+	"""
+	Extract #define from base/include following #includes.
+	If 'parsed' set is passed, it's filled with names of all parsed files.
+	"""
 
-	parsed = set()
+	if parsed is None:
+		parsed = set()
 	fname = os.path.normpath(os.path.abspath(os.path.join(base, include)))
 	parsed.add(fname)
 
@@ -186,6 +191,51 @@ def defines(base, include):
 	return out
 
 
+def _stamp(fname):
+	st = os.stat(fname)
+	return [ st.st_mtime_ns, st.st_size ]
+
+
+def cached_defines(base, include, cache_file):
+
+	"""
+	Same as defines, but result is stored in cache_file and reused for
+	as long as none of parsed files is changed. Parsing headers takes
+	tens of milliseconds, what's way too much to do in every process.
+	"""
+
+	fname = os.path.join(base, include)
+	try:
+		with open(cache_file, "r") as f:
+			data = json.loads(f.read())
+		if data["include"] == fname:
+			if all([ _stamp(x) == stamp for x, stamp in data["files"] ]):
+				return OrderedDict([ (k, v) for k, v in data["defines"] ])
+	except (IOError, OSError, ValueError, KeyError, TypeError):
+		# Missing, broken or outdated cache
+		pass
+
+	parsed = set()
+	out = defines(base, include, parsed)
+	try:
+		data = {
+			"include": fname,
+			"files": [ (x, _stamp(x)) for x in sorted(parsed) ],
+			"defines": list(out.items()),
+		}
+		if not os.path.exists(os.path.dirname(cache_file)):
+			os.makedirs(os.path.dirname(cache_file))
+		# Written into temporary file first, so other process
+		# can't read half-written cache
+		tmp = "%s.%s.tmp" % (cache_file, os.getpid())
+		with open(tmp, "w") as f:
+			f.write(json.dumps(data))
+		os.rename(tmp, cache_file)
+	except (IOError, OSError):
+		pass
+	return out
+
+
 if __name__ == '__main__':
 	import sys
 	definesDict = defines(sys.argv[1], sys.argv[2])
@@ -2,15 +2,18 @@
 """
 SC-Controller - Config
 
-Handles loading, storing and querying config file
+Handles loading, storing and querying config file.
+
+Config() returns instance shared by whole process and has no side effects
+once config file is loaded. Changes on disk are picked up only by explicit
+call to check() or reload(), so subscribers are never called from places that
+just read configuration.
 """
 from __future__ import unicode_literals
 
 from scc.paths import get_config_path
-from scc.profile import Encoder
-from scc.special_actions import ChangeProfileAction
 
-import os, json, logging
+import os, json, threading, logging
 log = logging.getLogger("Config")
 
 
@@ -76,7 +79,17 @@ class Config(object):
 		# ~/.config/scc can ask daemon to send notifications about all
 		# (or only some) inputs.
 		# This enables GUI to display which physical button was pressed to user.
+		# Daemon also keeps state of every controller in $XDG_RUNTIME_DIR/scc/state-*
+		# files, see scc/state_page.py
 		"enable_sniffing" : False,
+		# latency_tracing - If enabled, daemon measures how long it takes
+		# to turn input from controller into emulated events.
+		# Results are available using 'scc stats' command.
+		"latency_tracing" : False,
+		# mapper_workers - If enabled, input from every controller is
+		# processed by separate process. See mapper_worker.py.
+		# Takes effect after daemon is restarted.
+		"mapper_workers" : False,
 		# Style and colors used by OSD
 		"osd_style": "Classic.gtkstyle.css",
 		"osd_colors": {
@@ -120,19 +133,38 @@ class Config(object):
 		"osd_alignment":		0,		# not used yet
 		"input_rotation_l":		20,		# range -180 to 180
 		"input_rotation_r":		-20,	# range -180 to 180
+		"input_rate":			0,		# max. inputs processed per second, 0 for no limit
 		"menu_control":			"STICK",
 		"menu_confirm":			"A",
 		"menu_cancel":			"B",
 	}
 	
 	
-	def __init__(self):
-		self.filename = os.path.join(get_config_path(), "config.json")
-		self.reload()
+	_instance = None
+	_lock = threading.RLock()
 	
+	def __new__(cls):
+		with Config._lock:
+			filename = os.path.join(get_config_path(), "config.json")
+			if cls._instance is None or cls._instance.filename != filename:
+				instance = object.__new__(cls)
+				instance.filename = filename
+				instance._stat = None
+				instance._subscribers = []
+				instance._load_or_create()
+				cls._instance = instance
+			return cls._instance
 	
-	def reload(self):
-		""" (Re)loads configuration. Works as load(), but handles exceptions """
+	
+	def _get_stat(self):
+		try:
+			st = os.stat(self.filename)
+			return st.st_mtime_ns, st.st_size
+		except OSError:
+			return None
+	
+	
+	def _load_or_create(self):
 		try:
 			self.load()
 		except Exception as e:
@@ -143,6 +175,47 @@ class Config(object):
 			self.save()
 	
 	
+	def reload(self):
+		"""
+		(Re)loads configuration. Works as load(), but handles exceptions
+		and notifies subscribers.
+		"""
+		with Config._lock:
+			self._load_or_create()
+			for callback in list(self._subscribers):
+				try:
+					callback(self)
+				except Exception as e:
+					log.exception(e)
+	
+	
+	def check(self):
+		"""
+		Reloads configuration if file was changed since it was loaded
+		or saved. Returns True if it was.
+		"""
+		with Config._lock:
+			if self._get_stat() == self._stat:
+				return False
+			log.debug("Configuration file changed")
+			self.reload()
+			return True
+	
+	
+	def subscribe(self, callback):
+		"""
+		Registers callback(config) called every time after configuration
+		is reloaded.
+		"""
+		if callback not in self._subscribers:
+			self._subscribers.append(callback)
+	
+	
+	def unsubscribe(self, callback):
+		if callback in self._subscribers:
+			self._subscribers.remove(callback)
+	
+	
 	def _check_dict(self, values, defaults):
 		"""
 		Recursivelly checks if 'config' contains all keys in 'defaults'.
@@ -172,6 +245,7 @@ class Config(object):
 		if "autoswitch" in self.values:
 			for a in self.values["autoswitch"]:
 				if "profile" in a:
+					from scc.special_actions import ChangeProfileAction
 					a["action"] = ChangeProfileAction(str(a["profile"])).to_string()
 					del a["profile"]
 					rv = True
@@ -203,7 +277,10 @@ class Config(object):
 	
 	
 	def load(self):
-		self.values = json.loads(open(self.filename, "r").read())
+		# Stat is done first, so change done while reading is not missed
+		self._stat = self._get_stat()
+		with open(self.filename, "r") as f:
+			self.values = json.loads(f.read())
 	
 	
 	def create(self):
@@ -219,9 +296,17 @@ class Config(object):
 		if not os.path.exists(get_config_path()):
 			os.makedirs(get_config_path())
 		# Save
+		from scc.profile import Encoder
 		data = { k:self.values[k] for k in self.values }
 		jstr = Encoder(sort_keys=True, indent=4).encode(data)
-		open(self.filename, "w").write(jstr)
+		# Written into temporary file first, so other process
+		# can't read half-written config
+		tmp = "%s.%s.tmp" % (self.filename, os.getpid())
+		with Config._lock:
+			with open(tmp, "w") as f:
+				f.write(jstr)
+			os.rename(tmp, self.filename)
+			self._stat = self._get_stat()
 		log.debug("Configuration saved")
 	
 	
@@ -30,6 +30,7 @@ class DeviceMonitor(Monitor):
 		self.daemon = None
 		self.dev_added_cbs = {}
 		self.dev_removed_cbs = {}
+		self.lazy_loaders = {}
 		self.bt_addresses = {}
 		self.known_devs = {}
 	
@@ -39,7 +40,8 @@ class DeviceMonitor(Monitor):
 		Adds function that is called when eudev monitor detects new, ready
 		to use device.
 		
-		This has to be called from something called by init_drivers method.
+		This has to be called from something called by init_drivers method
+		or by loader registered with add_lazy_callback.
 		"""
 		key = (subsystem, vendor_id, product_id)
 		assert key not in self.dev_added_cbs
@@ -49,6 +51,32 @@ class DeviceMonitor(Monitor):
 		self.dev_removed_cbs[key] = removed_cb
 	
 	
+	def add_lazy_callback(self, subsystem, vendor_id, product_id, loader):
+		"""
+		Adds function that is called when device with matching ids is
+		detected, but no callback is registered for it yet.
+		
+		Loader is expected to register real callbacks using add_callback,
+		after which device is handled as if they were registered from start.
+		Loader is called only once, all keys it was registered with are
+		removed before it's called.
+		"""
+		key = (subsystem, vendor_id, product_id)
+		assert key not in self.lazy_loaders
+		self.match_subsystem(subsystem)
+		self.lazy_loaders[key] = loader
+	
+	
+	def _run_lazy_loader(self, key):
+		loader = self.lazy_loaders[key]
+		for k in [ k for k, l in self.lazy_loaders.items() if l is loader ]:
+			del self.lazy_loaders[k]
+		try:
+			loader()
+		except Exception as e:
+			log.exception(e)
+	
+	
 	def add_remove_callback(self, syspath, cb):
 		"""
 		Adds (possibly replaces) callback that will be called once
@@ -78,6 +106,8 @@ class DeviceMonitor(Monitor):
 			# Cannot grab vendor & product, probably subdevice or bus itself
 			return
 		key = (subsystem, vendor, product)
+		if key in self.lazy_loaders and key not in self.dev_added_cbs:
+			self._run_lazy_loader(key)
 		cb = self.dev_added_cbs.get(key)
 		rem_cb = self.dev_removed_cbs.get(key)
 		if cb:
@@ -157,7 +187,7 @@ class DeviceMonitor(Monitor):
 		enumerator = self._eudev.enumerate()
 		subsystem_to_vp_to_callback = {}
 		
-		for key, cb in self.dev_added_cbs.items():
+		for key, cb in list(self.dev_added_cbs.items()) + list(self.lazy_loaders.items()):
 			subsystem, vendor_id, product_id = key
 			enumerator.match_subsystem(subsystem)
 			if subsystem not in subsystem_to_vp_to_callback:
@@ -11,6 +11,13 @@ Additionaly, start(daemon) method is called from each module that defines it
 just before daemon startup is complete.
 
 Assigning Mapper to Controller is handled by daemon.
+
+Drivers listed in DRIVER_MANIFEST are not imported at all until device
+they can handle is connected. Device monitor matches connected devices
+against listed (subsystem, vendor_id, product_id) keys and only then
+driver is imported, initialized and started, as if it were there from start.
+Driver that registers callbacks for anything not listed in manifest
+has to be kept out of it.
 """
 
 MOD_INIT_ORDER = (
@@ -19,3 +26,12 @@ MOD_INIT_ORDER = (
 	"scc.drivers.evdevdrv",
 	"scc.drivers.hiddrv"
 )
+
+DRIVER_MANIFEST = {
+	# Maps module name to tuple of (subsystem, vendor_id, product_id) keys
+	# that driver registers in its init method.
+	"sc_dongle"		: ( ("usb", 0x28de, 0x1142), ),
+	"sc_by_cable"	: ( ("usb", 0x28de, 0x1102), ),
+	"sc_by_bt"		: ( ("bluetooth", 0x28de, 0x1106), ),
+	"ds4drv"		: ( ("usb", 0x054c, 0x09cc), ("bluetooth", 0x054c, 0x09cc) ),
+}
@@ -260,62 +260,51 @@ class DS4EvdevController(EvdevController):
 	
 	
 	def _gyro_input(self, *a):
-		new_state = self._state
+		state = self._begin_change()
 		try:
 			for event in self._gyro.read():
 				if event.type == self.ECODES.EV_ABS:
 					axis, factor = DS4EvdevController.GYRO_MAP[event.code]
 					if axis:
-						new_state = new_state._replace(
-								**{ axis : int(event.value * factor) })
+						setattr(state, axis, int(event.value * factor))
 		except IOError:
 			# Errors here are not even reported, evdev class handles important ones
+			self._cancel_change()
 			return
 		
-		if new_state is not self._state:
-			old_state, self._state = self._state, new_state
-			if self.mapper:
-				self.mapper.input(self, old_state, new_state)
+		self._end_change()
 	
 	
 	def _touchpad_input(self, *a):
-		new_state = self._state
+		state = self._begin_change()
 		try:
 			for event in self._touchpad.read():
 				if event.type == self.ECODES.EV_ABS:
 					if event.code == self.ECODES.ABS_MT_POSITION_X:
 						value = event.value * DS4EvdevController.TOUCH_FACTOR_X
-						value = STICK_PAD_MIN + int(value)
-						new_state = new_state._replace(cpad_x = value)
+						state.cpad_x = STICK_PAD_MIN + int(value)
 					elif event.code == self.ECODES.ABS_MT_POSITION_Y:
 						value = event.value * DS4EvdevController.TOUCH_FACTOR_Y
-						value = STICK_PAD_MAX - int(value)
-						new_state = new_state._replace(cpad_y = value)
+						state.cpad_y = STICK_PAD_MAX - int(value)
 				elif event.type == 0:
 					pass
 				elif event.code == self.ECODES.BTN_LEFT:
 					if event.value == 1:
-						b = new_state.buttons | SCButtons.CPADPRESS
-						new_state = new_state._replace(buttons = b)
+						state.buttons |= SCButtons.CPADPRESS
 					else:
-						b = new_state.buttons & ~SCButtons.CPADPRESS
-						new_state = new_state._replace(buttons = b)
+						state.buttons &= ~SCButtons.CPADPRESS
 				elif event.code == self.ECODES.BTN_TOUCH:
 					if event.value == 1:
-						b = new_state.buttons | SCButtons.CPADTOUCH
-						new_state = new_state._replace(buttons = b)
+						state.buttons |= SCButtons.CPADTOUCH
 					else:
-						b = new_state.buttons & ~SCButtons.CPADTOUCH
-						new_state = new_state._replace(buttons = b,
-								cpad_x = 0, cpad_y = 0)
+						state.buttons &= ~SCButtons.CPADTOUCH
+						state.cpad_x, state.cpad_y = 0, 0
 		except IOError:
 			# Errors here are not even reported, evdev class handles important ones
+			self._cancel_change()
 			return
 		
-		if new_state is not self._state:
-			old_state, self._state = self._state, new_state
-			if self.mapper:
-				self.mapper.input(self, old_state, new_state)
+		self._end_change()
 	
 	
 	def close(self):
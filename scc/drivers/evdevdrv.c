@@ -0,0 +1,201 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <linux/input.h>
+#include <inttypes.h>
+#include <stdbool.h>
+#include <limits.h>
+#include <string.h>
+#include <unistd.h>
+#include <errno.h>
+
+#define EVDEVDRV_MODULE_VERSION 1
+PyObject* module;
+
+#define AXIS_COUNT 17
+#define EVENT_BUFFER_SIZE 64
+#define EV_KEY_COUNT 0x300
+#define EV_ABS_COUNT 0x40
+
+// Values returned by decode
+#define DECODE_STATE_CHANGED	0b01
+#define DECODE_PADTOUCH_EMULATED	0b10
+
+// Few SCButtons values
+#define SCB_RPADTOUCH	0b00010000000000000000000000000000
+#define SCB_LPADTOUCH	0b00001000000000000000000000000000
+#define SCB_LPAD		0b00000010000000000000000000000000
+
+/** Same as in HIDControllerInput; Must match EvdevControllerInput in evdevdrv.py */
+struct EvdevControllerInput {
+	uint32_t buttons;
+	int32_t axes[AXIS_COUNT];
+};
+
+
+enum AxisType {
+	AXIS_LPAD_X  = 0,
+	AXIS_LPAD_Y  = 1,
+	AXIS_RPAD_X  = 2,
+	AXIS_RPAD_Y  = 3,
+};
+
+
+enum KeyMode {
+	KEY_DISABLED = 0,
+	KEY_BUTTON   = 1,
+	KEY_AXIS     = 2,
+	_KeyMode_force_int = INT_MAX
+};
+
+
+/** Key mapped either to button or to axis (dpad or trigger) */
+struct KeyData {
+	enum KeyMode mode;
+	uint32_t button;
+	uint8_t axis;
+	int32_t pressed;
+	int32_t released;
+};
+
+
+/** Axis with calibration, see parse_axis in evdevdrv.py */
+struct AbsData {
+	bool enabled;
+	uint8_t axis;
+	double scale;
+	double offset;
+	double deadzone;
+	int32_t clamp_min;
+	int32_t clamp_max;
+};
+
+
+struct EvdevDecoder {
+	int fileno;
+	struct KeyData keys[EV_KEY_COUNT];
+	struct AbsData abs[EV_ABS_COUNT];
+	bool synced;
+	size_t position;
+	size_t count;
+	
+	struct EvdevControllerInput old_state;
+	struct EvdevControllerInput state;
+	struct input_event buffer[EVENT_BUFFER_SIZE];
+};
+
+
+/**
+ * Evdev gamepad typically can't generate *PADTOUCH buttons, so those
+ * are emulated while stick mapped to pad is moved.
+ * Returns true if emulated button was pressed.
+ */
+static bool emulate_padtouch(struct EvdevDecoder* dec, uint8_t axis) {
+	if ((axis == AXIS_LPAD_X) || (axis == AXIS_LPAD_Y)) {
+		if ((dec->state.buttons & SCB_LPADTOUCH) == 0) {
+			dec->state.buttons |= SCB_LPAD | SCB_LPADTOUCH;
+			return true;
+		}
+	} else if ((axis == AXIS_RPAD_X) || (axis == AXIS_RPAD_Y)) {
+		if ((dec->state.buttons & SCB_RPADTOUCH) == 0) {
+			dec->state.buttons |= SCB_RPADTOUCH;
+			return true;
+		}
+	}
+	return false;
+}
+
+
+static bool decode_key(struct EvdevDecoder* dec, const struct input_event* ev) {
+	struct KeyData* key;
+	if (ev->code >= EV_KEY_COUNT)
+		return false;
+	key = &(dec->keys[ev->code]);
+	switch (key->mode) {
+		case KEY_BUTTON:
+			if (ev->value)
+				dec->state.buttons |= key->button;
+			else
+				dec->state.buttons &= ~key->button;
+			return false;
+		case KEY_AXIS:
+			dec->state.axes[key->axis] = ev->value ? key->pressed : key->released;
+			return emulate_padtouch(dec, key->axis);
+		default:
+			return false;
+	}
+}
+
+
+static bool decode_abs(struct EvdevDecoder* dec, const struct input_event* ev) {
+	struct AbsData* abs;
+	double value;
+	if (ev->code >= EV_ABS_COUNT)
+		return false;
+	abs = &(dec->abs[ev->code]);
+	if (!abs->enabled)
+		return false;
+	value = ((double)ev->value * abs->scale) + abs->offset;
+	if ((value >= -abs->deadzone) && (value <= abs->deadzone)) {
+		dec->state.axes[abs->axis] = 0;
+	} else {
+		int32_t ivalue = (int32_t)(value * abs->clamp_max);
+		if (ivalue < abs->clamp_min) ivalue = abs->clamp_min;
+		if (ivalue > abs->clamp_max) ivalue = abs->clamp_max;
+		dec->state.axes[abs->axis] = ivalue;
+	}
+	return emulate_padtouch(dec, abs->axis);
+}
+
+
+/**
+ * Reads events from device and applies them to state, until EV_SYN is
+ * reached and state differs from one returned last time.
+ *
+ * Returns combination of DECODE_* flags, 0 if there is nothing more to read
+ * or negative errno if reading fails.
+ */
+int decode(struct EvdevDecoder* dec) {
+	int rv = 0;
+	if (dec->synced) {
+		dec->old_state = dec->state;
+		dec->synced = false;
+	}
+	while (true) {
+		if (dec->position >= dec->count) {
+			ssize_t r = read(dec->fileno, dec->buffer, sizeof(dec->buffer));
+			dec->position = dec->count = 0;
+			if (r < 0)
+				return ((errno == EAGAIN) || (errno == EINTR)) ? 0 : -errno;
+			if (r == 0)
+				return -ENODEV;
+			dec->count = r / sizeof(struct input_event);
+		}
+		
+		while (dec->position < dec->count) {
+			const struct input_event* ev = &(dec->buffer[dec->position ++]);
+			switch (ev->type) {
+				case EV_KEY:
+					if (decode_key(dec, ev))
+						rv |= DECODE_PADTOUCH_EMULATED;
+					break;
+				case EV_ABS:
+					if (decode_abs(dec, ev))
+						rv |= DECODE_PADTOUCH_EMULATED;
+					break;
+				case EV_SYN:
+					if (memcmp(&(dec->old_state), &(dec->state), sizeof(struct EvdevControllerInput)) != 0) {
+						dec->synced = true;
+						return rv | DECODE_STATE_CHANGED;
+					}
+					break;
+				default:
+					break;
+			}
+		}
+	}
+}
+
+
+const int evdevdrv_module_version(void) {
+	return EVDEVDRV_MODULE_VERSION;
+}
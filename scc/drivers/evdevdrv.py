@@ -10,7 +10,10 @@ from scc.constants import STICK_PAD_MIN, STICK_PAD_MAX, TRIGGER_MIN, TRIGGER_MAX
 from scc.constants import SCButtons, ControllerFlags
 from scc.controller import Controller
 from scc.paths import get_config_path
-from scc.tools import clamp
+from scc.tools import find_library
+from scc.tracing import tracer
+from scc.uinput import InputEvent
+from scc.lib import IntEnum
 
 
 HAVE_EVDEV = False
@@ -26,22 +29,100 @@ except ImportError:
 	ecodes = FakeECodes()
 
 from collections import namedtuple
-import os, sys, binascii, json, logging
+import os, sys, binascii, json, ctypes, logging
 log = logging.getLogger("evdev")
 
 TRIGGERS = "ltrig", "rtrig"
 FIRST_BUTTON = 288
-
-EvdevControllerInput = namedtuple('EvdevControllerInput',
-	'buttons ltrig rtrig stick_x stick_y lpad_x lpad_y rpad_x rpad_y '
-	'gpitch groll gyaw q1 q2 q3 q4 '
-	'cpad_x cpad_y'
-)
+EVENT_BUFFER_SIZE = 64		# Must match EVENT_BUFFER_SIZE in evdevdrv.c
+EV_KEY_COUNT = 0x300
+EV_ABS_COUNT = 0x40
+DECODE_STATE_CHANGED = 0b01
+DECODE_PADTOUCH_EMULATED = 0b10
 
 AxisCalibrationData = namedtuple('AxisCalibrationData',
 	'scale offset center clamp_min clamp_max deadzone'
 )
 
+
+class EvdevControllerInput(ctypes.Structure):
+	# Same layout as HIDControllerInput
+	_fields_ = [
+		('buttons', ctypes.c_uint32),
+		('lpad_x', ctypes.c_int32),
+		('lpad_y', ctypes.c_int32),
+		('rpad_x', ctypes.c_int32),
+		('rpad_y', ctypes.c_int32),
+		('stick_x', ctypes.c_int32),
+		('stick_y', ctypes.c_int32),
+		('ltrig', ctypes.c_int32),
+		('rtrig', ctypes.c_int32),
+		('gpitch', ctypes.c_int32),
+		('groll', ctypes.c_int32),
+		('gyaw', ctypes.c_int32),
+		('q1', ctypes.c_int32),
+		('q2', ctypes.c_int32),
+		('q3', ctypes.c_int32),
+		('q4', ctypes.c_int32),
+		('cpad_x', ctypes.c_int32),
+		('cpad_y', ctypes.c_int32),
+	]
+
+
+AXES = tuple([ name for (name, type) in EvdevControllerInput._fields_ ][1:])
+
+
+class KeyMode(IntEnum):
+	DISABLED = 0
+	BUTTON   = 1
+	AXIS     = 2	# Used for dpads and triggers
+
+
+class KeyData(ctypes.Structure):
+	_fields_ = [
+		('mode', ctypes.c_int),
+		('button', ctypes.c_uint32),
+		('axis', ctypes.c_uint8),
+		('pressed', ctypes.c_int32),
+		('released', ctypes.c_int32),
+	]
+
+
+class AbsData(ctypes.Structure):
+	_fields_ = [
+		('enabled', ctypes.c_bool),
+		('axis', ctypes.c_uint8),
+		('scale', ctypes.c_double),
+		('offset', ctypes.c_double),
+		('deadzone', ctypes.c_double),
+		('clamp_min', ctypes.c_int32),
+		('clamp_max', ctypes.c_int32),
+	]
+
+
+class EvdevDecoder(ctypes.Structure):
+	_fields_ = [
+		('fileno', ctypes.c_int),
+		('keys', KeyData * EV_KEY_COUNT),
+		('abs', AbsData * EV_ABS_COUNT),
+		('synced', ctypes.c_bool),
+		('position', ctypes.c_size_t),
+		('count', ctypes.c_size_t),
+
+		('old_state', EvdevControllerInput),
+		('state', EvdevControllerInput),
+		('buffer', InputEvent * EVENT_BUFFER_SIZE),
+	]
+
+
+EvdevDecoderPtr = ctypes.POINTER(EvdevDecoder)
+
+
+_lib = find_library('libevdevdrv')
+_lib.decode.restype = ctypes.c_int
+_lib.decode.argtypes = [ EvdevDecoderPtr ]
+
+
 class EvdevController(Controller):
 	"""
 	Wrapper around evdev device.
@@ -67,12 +148,12 @@ class EvdevController(Controller):
 		self.config = config
 		self.daemon = daemon
 		self.poller = None
+		self._build_decoder()
 		if daemon:
 			self.poller = daemon.get_poller()
 			self.poller.register(self.device.fd, self.poller.POLLIN, self.input)
 			self.device.grab()
 			self._id = self._generate_id()
-		self._state = EvdevControllerInput( *[0] * len(EvdevControllerInput._fields) )
 		self._padpressemu_task = None
 
 
@@ -93,17 +174,52 @@ class EvdevController(Controller):
 			except: pass
 		for x, value in config.get("axes", {}).items():
 			code, axis = int(x), value.get("axis")
-			if axis in EvdevControllerInput._fields:
+			if axis in AXES:
 				self._calibrations[code] = parse_axis(value)
 				self._axis_map[code] = axis
 		for x, value in config.get("dpads", {}).items():
 			code, axis = int(x), value.get("axis")
-			if axis in EvdevControllerInput._fields:
+			if axis in AXES:
 				self._calibrations[code] = parse_axis(value)
 				self._dpad_map[code] = value.get("positive", False)
 				self._axis_map[code] = axis
 
 
+	def _build_decoder(self):
+		"""
+		Converts maps created by _parse_config into EvdevDecoder.
+		Events are then read and applied to state by 'decode' function
+		in evdevdrv.c
+		"""
+		self._decoder = EvdevDecoder(fileno=self.device.fd, synced=True)
+		self._decoder_ptr = ctypes.byref(self._decoder)
+		self._old_state = self._decoder.old_state
+		self._state = self._decoder.state
+
+		for code, axis in self._axis_map.items():
+			if code in self._calibrations and code < EV_ABS_COUNT:
+				cal = self._calibrations[code]
+				self._decoder.abs[code] = AbsData(enabled=True,
+					axis=AXES.index(axis), scale=cal.scale, offset=cal.offset,
+					deadzone=cal.deadzone, clamp_min=cal.clamp_min,
+					clamp_max=cal.clamp_max)
+
+		for code in range(EV_KEY_COUNT):
+			if code in self._dpad_map:
+				cal = self._calibrations[code]
+				value = STICK_PAD_MAX if self._dpad_map[code] else STICK_PAD_MIN
+				self._decoder.keys[code] = KeyData(mode=KeyMode.AXIS,
+					axis=AXES.index(self._axis_map[code]),
+					pressed=int(value * cal.scale * STICK_PAD_MAX), released=0)
+			elif code in self._button_map:
+				self._decoder.keys[code] = KeyData(mode=KeyMode.BUTTON,
+					button=self._button_map[code])
+			elif code in self._axis_map:
+				self._decoder.keys[code] = KeyData(mode=KeyMode.AXIS,
+					axis=AXES.index(self._axis_map[code]),
+					pressed=TRIGGER_MAX, released=TRIGGER_MIN)
+
+
 	def close(self):
 		self.poller.unregister(self.device.fd)
 		try:
@@ -152,83 +268,50 @@ class EvdevController(Controller):
 
 
 	def input(self, *a):
-		new_state = self._state
-		need_cancel_padpressemu = False
-		try:
-			for event in self.device.read():
-				if event.type == ecodes.EV_KEY and event.code in self._dpad_map:
-					cal = self._calibrations[event.code]
-					if event.value:
-						if self._dpad_map[event.code]:
-							# Positive
-							value = STICK_PAD_MAX
-						else:
-							value = STICK_PAD_MIN
-						cal = self._calibrations[event.code]
-						value = int(value * cal.scale * STICK_PAD_MAX)
-					else:
-						value = 0
-					axis = self._axis_map[event.code]
-					if not new_state.buttons & SCButtons.LPADTOUCH and axis in ("lpad_x", "lpad_y"):
-						b = new_state.buttons | SCButtons.LPAD | SCButtons.LPADTOUCH
-						need_cancel_padpressemu = True
-						new_state = new_state._replace(buttons=b, **{ axis : value })
-					elif not new_state.buttons & SCButtons.RPADTOUCH and axis in ("rpad_x", "rpad_y"):
-						b = new_state.buttons | SCButtons.RPADTOUCH
-						need_cancel_padpressemu = True
-						new_state = new_state._replace(buttons=b, **{ axis : value })
-					else:
-						new_state = new_state._replace(**{ axis : value })
-				elif event.type == ecodes.EV_KEY and event.code in self._button_map:
-					if event.value:
-						b = new_state.buttons | self._button_map[event.code]
-						new_state = new_state._replace(buttons=b)
-					else:
-						b = new_state.buttons & ~self._button_map[event.code]
-						new_state = new_state._replace(buttons=b)
-				elif event.type == ecodes.EV_KEY and event.code in self._axis_map:
-					axis = self._axis_map[event.code]
-					if event.value:
-						new_state = new_state._replace(**{ axis : TRIGGER_MAX })
-					else:
-						new_state = new_state._replace(**{ axis : TRIGGER_MIN })
-				elif event.type == ecodes.EV_ABS and event.code in self._axis_map:
-					cal = self._calibrations[event.code]
-					value = (float(event.value) * cal.scale) + cal.offset
-					if value >= -cal.deadzone and value <= cal.deadzone:
-						value = 0
-					else:
-						value = clamp(cal.clamp_min,
-								int(value * cal.clamp_max), cal.clamp_max)
-					axis = self._axis_map[event.code]
-					if not new_state.buttons & SCButtons.LPADTOUCH and axis in ("lpad_x", "lpad_y"):
-						b = new_state.buttons | SCButtons.LPAD | SCButtons.LPADTOUCH
-						need_cancel_padpressemu = True
-						new_state = new_state._replace(buttons=b, **{ axis : value })
-					elif not new_state.buttons & SCButtons.RPADTOUCH and axis in ("rpad_x", "rpad_y"):
-						b = new_state.buttons | SCButtons.RPADTOUCH
-						need_cancel_padpressemu = True
-						new_state = new_state._replace(buttons=b, **{ axis : value })
-					else:
-						new_state = new_state._replace(**{ axis : value })
-		except IOError as e:
-			# TODO: Maybe check e.errno to determine exact error
-			# all of them are fatal for now
-			log.error(e)
-			_evdevdrv.device_removed(self.device.fn)
-
-		if new_state is not self._state:
-			# Something got changed
-			old_state, self._state = self._state, new_state
+		tracer.report_received()
+		while True:
+			r = _lib.decode(self._decoder_ptr)
+			if r <= 0:
+				break
 			if self.mapper:
-				if need_cancel_padpressemu:
+				if r & DECODE_PADTOUCH_EMULATED:
 					if self._padpressemu_task:
 						self.mapper.cancel_task(self._padpressemu_task)
-					self._padpressemu_task = self.mapper.schedule(
+					# Not owned by mapper, profile change must not cancel this
+					self._padpressemu_task = self.mapper.scheduler.schedule(
 						self.PADPRESS_EMULATION_TIMEOUT,
-						self.cancel_padpress_emulation
+						self.cancel_padpress_emulation, self.mapper
 					)
-				self.mapper.input(self, old_state, new_state)
+				self.mapper.input(self, self._old_state, self._state)
+
+		if r < 0:
+			# TODO: Maybe check errno to determine exact error
+			# all of them are fatal for now
+			log.error("%s: %s", self.device.fn, os.strerror(-r))
+			_evdevdrv.device_removed(self.device.fn)
+
+
+	def _begin_change(self):
+		"""
+		Used when state is changed outside of decoder, by padpress emulation
+		or by subclass. Returns state that can be modified in place.
+		_end_change or _cancel_change has to be called afterwards.
+		"""
+		self._decoder.old_state = self._decoder.state
+		return self._state
+
+
+	def _end_change(self):
+		""" Sends state modified after _begin_change to mapper """
+		# Next call to decode has to start from this state
+		self._decoder.synced = True
+		if self.mapper and bytes(self._old_state) != bytes(self._state):
+			self.mapper.input(self, self._old_state, self._state)
+
+
+	def _cancel_change(self):
+		""" Reverts state modified after _begin_change """
+		self._decoder.state = self._decoder.old_state
 
 
 	def test_input(self, event):
@@ -256,30 +339,24 @@ class EvdevController(Controller):
 		"""
 
 		need_reschedule = False
-		new_state = self._state
-		if new_state.buttons & SCButtons.LPADTOUCH:
-			if self._state.lpad_x == 0 and self._state.lpad_y == 0:
-				b = new_state.buttons & ~(SCButtons.LPAD | SCButtons.LPADTOUCH)
-				new_state = new_state._replace(buttons=b)
+		state = self._begin_change()
+		if state.buttons & SCButtons.LPADTOUCH:
+			if state.lpad_x == 0 and state.lpad_y == 0:
+				state.buttons &= ~(SCButtons.LPAD | SCButtons.LPADTOUCH)
 			else:
 				need_reschedule = True
 
-		if new_state.buttons & SCButtons.RPADTOUCH:
-			if self._state.rpad_x == 0 and self._state.rpad_y == 0:
-				b = new_state.buttons & ~SCButtons.RPADTOUCH
-				new_state = new_state._replace(buttons=b)
+		if state.buttons & SCButtons.RPADTOUCH:
+			if state.rpad_x == 0 and state.rpad_y == 0:
+				state.buttons &= ~SCButtons.RPADTOUCH
 			else:
 				need_reschedule = True
-
-		if new_state is not self._state:
-			# Something got changed
-			old_state, self._state = self._state, new_state
-			if self.mapper:
-				self.mapper.input(self, old_state, new_state)
+		self._end_change()
 
 		if need_reschedule:
-			self._padpressemu_task = mapper.schedule(
-				self.PADPRESS_EMULATION_TIMEOUT, self.cancel_padpress_emulation)
+			self._padpressemu_task = mapper.scheduler.schedule(
+				self.PADPRESS_EMULATION_TIMEOUT, self.cancel_padpress_emulation,
+				mapper)
 		else:
 			self._padpressemu_task = None
 
@@ -9,6 +9,8 @@ from scc.lib.hidparse import UsagePage, parse_report_descriptor
 from scc.lib.hidparse import GenericDesktopPage, AXES
 from scc.drivers.usb import register_hotplug_device, unregister_hotplug_device
 from scc.drivers.usb import USBDevice
+from scc.device_monitor import DeviceMonitor
+from scc.lib.eudevmonitor import Eudev
 from scc.constants import STICK_PAD_MIN, STICK_PAD_MAX
 from scc.constants import SCButtons, ControllerFlags
 from scc.drivers.evdevdrv import FIRST_BUTTON, TRIGGERS, parse_axis
@@ -26,7 +28,6 @@ LIBUSB_DT_REPORT = 0x22
 AXIS_COUNT = 17		# Must match number of axis fields in HIDControllerInput and values in AxisType
 BUTTON_COUNT = 32	# Must match (or be less than) number of bits in HIDControllerInput.buttons
 ALLOWED_SIZES = [1, 2, 4, 8, 16, 32]
-SYS_DEVICES = "/sys/devices"
 
 
 BLACKLIST = [
@@ -230,7 +231,8 @@ class HIDController(USBDevice, Controller):
 
 
 	def _load_hid_descriptor(self, config, max_size, vid, pid, test_mode):
-		hid_descriptor = HIDController.find_sys_devices_descriptor(vid, pid)
+		hid_descriptor = HIDController.find_sys_devices_descriptor(vid, pid,
+				self.device.getBusNumber(), self.device.getDeviceAddress())
 		if hid_descriptor is None:
 			hid_descriptor = self.handle.getRawDescriptor(
 					LIBUSB_DT_REPORT, 0, 512)
@@ -413,37 +415,40 @@ class HIDController(USBDevice, Controller):
 
 
 	@staticmethod
-	def find_sys_devices_descriptor(vid, pid):
+	def find_sys_devices_descriptor(vid, pid, busnum, devnum):
 		"""
-		Finds, loads and returns HID descriptor available somewhere deep in
-		/sys/devices structure.
+		Finds, loads and returns HID descriptor that kernel exposes in sysfs
+		for USB device with given ids and address.
 
-		Done by walking /sys/devices recursivelly, searching for file named
-		'report_descriptor' in subdirectory with name contining vid and pid.
+		hidraw nodes are enumerated using udev and descriptor is read from
+		'report_descriptor' file of HID device that is parent of node
+		belonging to requested USB device. That's much cheaper than walking
+		whole /sys/devices structure.
 
 		This is very much prefered before loading HID descriptor from device,
 		as some controllers are presenting descriptor that are completly
 		broken and kernel already deals with it.
 		"""
-		def recursive_search(pattern, path):
-			for name in os.listdir(path):
-				full_path = os.path.join(path, name)
-				if name == "report_descriptor":
-					if pattern in os.path.split(path)[-1].lower():
-						return full_path
+		pattern = ":%.4x:%.4x" % (vid, pid)
+		full_path = None
+		try:
+			for syspath in Eudev().enumerate().match_subsystem("hidraw"):
+				# syspath is <usb device>/<interface>/<hid device>/hidraw/hidrawX
+				hid_path = os.path.dirname(os.path.dirname(syspath))
+				if pattern not in os.path.split(hid_path)[-1].lower():
+					continue
+				usb_path = os.path.dirname(os.path.dirname(hid_path))
 				try:
-					if os.path.islink(full_path):
-						# Recursive stuff in /sys ftw...
+					if DeviceMonitor.get_usb_address(usb_path) != (busnum, devnum):
 						continue
-					if os.path.isdir(full_path):
-						r = recursive_search(pattern, full_path)
-						if r: return r
-				except IOError:
-					pass
-			return None
-
-		pattern = ":%.4x:%.4x" % (vid, pid)
-		full_path = recursive_search(pattern, SYS_DEVICES)
+				except (IOError, OSError, ValueError):
+					# Not an USB device
+					continue
+				if os.path.exists(os.path.join(hid_path, "report_descriptor")):
+					full_path = os.path.join(hid_path, "report_descriptor")
+					break
+		except (ImportError, OSError) as e:
+			log.warning("Failed to enumerate hidraw devices: %s", e)
 		try:
 			if full_path:
 				log.debug("Loading descriptor from '%s'", full_path)
@@ -618,6 +623,7 @@ def hiddrv_test(cls, args):
 	Basically, if HID device works with this, it will work with daemon as well.
 	"""
 	from scc.poller import Poller
+	from scc.scheduler import Scheduler
 	from scc.drivers.usb import _usb
 	from scc.device_monitor import create_device_monitor
 	from scc.scripts import InvalidArguments
@@ -634,6 +640,7 @@ def hiddrv_test(cls, args):
 
 		def __init__(self):
 			self.poller = Poller()
+			self.scheduler = Scheduler()
 			self.dev_monitor = create_device_monitor(self)
 			self.exitcode = -1
 
@@ -649,6 +656,9 @@ def hiddrv_test(cls, args):
 		def get_poller(self):
 			return self.poller
 
+		def get_scheduler(self):
+			return self.scheduler
+
 	fake_daemon = FakeDaemon()
 
 	def cb(device, handle):
@@ -674,7 +684,8 @@ def hiddrv_test(cls, args):
 		print("Ready")
 	sys.stdout.flush()
 	while fake_daemon.exitcode < 0:
-		fake_daemon.poller.poll()
+		fake_daemon.poller.poll(fake_daemon.scheduler.get_timeout())
+		fake_daemon.scheduler.run()
 		_usb.mainloop()
 
 	return fake_daemon.exitcode
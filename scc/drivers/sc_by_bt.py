@@ -10,6 +10,7 @@ Shares a lot of classes with sc_dongle.py
 from scc.lib.hidraw import HIDRaw
 from scc.constants import ControllerFlags
 from scc.tools import find_library
+from scc.tracing import tracer
 from .sc_dongle import SCPacketType, SCPacketLength, SCConfigType
 from .sc_dongle import SCController
 from math import sin, cos
@@ -261,6 +262,7 @@ class SCByBt(SCController):
 		r = self.driver._lib.read_input(self._c_data_ptr)
 		
 		if r == 1:
+			tracer.report_received()
 			if self.mapper is not None:
 				if self._input_rotation_l and (self._state.type & 0x0100) != 0:
 					lx, ly = self._state.lpad_x, self._state.lpad_y
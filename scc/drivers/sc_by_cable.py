@@ -9,9 +9,8 @@ Shares a lot of classes with sc_dongle.py
 
 from scc.lib.usb1 import USBError
 from scc.drivers.usb import USBDevice, register_hotplug_device
-from .sc_dongle import ControllerInput, TUP_FORMAT
-from .sc_dongle import SCStatus, SCController
-import struct, logging
+from .sc_dongle import SCController
+import logging
 
 VENDOR_ID = 0x28de
 PRODUCT_ID = 0x1102
@@ -38,7 +37,6 @@ class SCByCable(USBDevice, SCController):
 		USBDevice.__init__(self, device, handle)
 		SCController.__init__(self, self, CONTROLIDX, ENDPOINT)
 		self._ready = False
-		self._last_tup = None
 		daemon.add_mainloop(self._timer)
 		
 		self.claim_by(klass=3, subclass=0, protocol=0)
@@ -65,21 +63,19 @@ class SCByCable(USBDevice, SCController):
 	
 	
 	def _wait_input(self, endpoint, data):
-		tup = ControllerInput._make(struct.unpack(TUP_FORMAT, data))
 		if not self._ready:
 			self.daemon.add_controller(self)
 			self.configure()
 			self._ready = True
-		if tup.status == SCStatus.INPUT:
-			self._last_tup = tup
+		# Only decoded here, state is passed to mapper by _timer
+		self.decode(data)
 	
 	
 	def _timer(self):
 		m = self.get_mapper()
 		if m:
-			if self._last_tup:
-				self.input(self._last_tup)
-				self._last_tup = None
+			if self._decoder.pending:
+				self.send_input()
 			else:
 				m.generate_events()
 				m.generate_feedback()
@@ -87,8 +83,13 @@ class SCByCable(USBDevice, SCController):
 				self.flush()
 			except USBError as e:
 				log.exception(e)
-				log.error("Error while communicating with device, baling out...")
-				self.force_restart()
+				self.on_control_failed(e)
+	
+	
+	def on_control_failed(self, error):
+		""" Restarts controller that failed to accept control message """
+		log.error("Error while communicating with device, baling out...")
+		self.force_restart()
 	
 	
 	def close(self):
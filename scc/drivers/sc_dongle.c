@@ -0,0 +1,105 @@
+#include <inttypes.h>
+#include <stdbool.h>
+#include <string.h>
+#include <math.h>
+
+#define SC_DONGLE_MODULE_VERSION 1
+
+#define STATUS_INPUT	0x01
+#define SCB_LPADTOUCH	0b01000000000000000000000000000
+
+/** Must match ControllerInput in sc_dongle.py */
+struct SCControllerInput {
+	int8_t type;
+	uint8_t status;
+	uint16_t seq;
+	uint32_t buttons;
+	uint8_t ltrig;
+	uint8_t rtrig;
+	int32_t lpad_x;
+	int32_t lpad_y;
+	int32_t rpad_x;
+	int32_t rpad_y;
+	int32_t gpitch;
+	int32_t groll;
+	int32_t gyaw;
+	int32_t q1;
+	int32_t q2;
+	int32_t q3;
+	int32_t q4;
+};
+
+/** Must match SCDecoder in sc_dongle.py */
+struct SCDecoder {
+	double rot_l_sin;
+	double rot_l_cos;
+	double rot_r_sin;
+	double rot_r_cos;
+	bool rotate_l;
+	bool rotate_r;
+	bool pending;
+	struct SCControllerInput old_state;
+	struct SCControllerInput state;
+};
+
+typedef struct SCDecoder* SCDecoderPtr;
+
+static inline int16_t read_int16(const uint8_t* data, size_t offset) {
+	int16_t rv;
+	memcpy(&rv, data + offset, sizeof(int16_t));
+	return rv;
+}
+
+static inline void rotate(int32_t* x, int32_t* y, double s, double c) {
+	double rx = (double)*x * c - (double)*y * s;
+	double ry = (double)*x * s + (double)*y * c;
+	*x = (int32_t)rx;
+	*y = (int32_t)ry;
+}
+
+/**
+ * Decodes 64B long packet sent by dongle or by controller connected by cable.
+ * Returns packet status. State is changed only if status is STATUS_INPUT.
+ *
+ * Previous state is copied to old_state, unless 'pending' flag is set,
+ * what means that previous state was never passed to mapper.
+ */
+int decode(SCDecoderPtr ptr, const uint8_t* data) {
+	struct SCControllerInput* state = &(ptr->state);
+	uint8_t status = data[2];
+	if (status != STATUS_INPUT)
+		return status;
+	
+	if (!ptr->pending)
+		ptr->old_state = *state;
+	
+	state->type = (int8_t)data[0];
+	state->status = status;
+	memcpy(&state->seq, data + 4, sizeof(uint16_t));
+	memcpy(&state->buttons, data + 7, sizeof(uint32_t));
+	state->ltrig = data[11];
+	state->rtrig = data[12];
+	state->lpad_x = read_int16(data, 16);
+	state->lpad_y = read_int16(data, 18);
+	state->rpad_x = read_int16(data, 20);
+	state->rpad_y = read_int16(data, 22);
+	state->gpitch = read_int16(data, 34);
+	state->groll = read_int16(data, 36);
+	state->gyaw = read_int16(data, 38);
+	state->q1 = read_int16(data, 40);
+	state->q2 = read_int16(data, 42);
+	state->q3 = read_int16(data, 44);
+	state->q4 = read_int16(data, 46);
+	
+	if (ptr->rotate_l && (state->buttons & SCB_LPADTOUCH))
+		rotate(&state->lpad_x, &state->lpad_y, ptr->rot_l_sin, ptr->rot_l_cos);
+	if (ptr->rotate_r)
+		rotate(&state->rpad_x, &state->rpad_y, ptr->rot_r_sin, ptr->rot_r_cos);
+	
+	ptr->pending = true;
+	return status;
+}
+
+const int sc_dongle_module_version(void) {
+	return SC_DONGLE_MODULE_VERSION;
+}
@@ -11,47 +11,73 @@ from scc.drivers.usb import USBDevice, register_hotplug_device
 from scc.constants import SCButtons, STICKTILT
 from scc.controller import Controller
 from scc.config import Config
-from collections import namedtuple
+from scc.tools import find_library
 from math import pi as PI, sin, cos
-import struct, logging
+import struct, ctypes, logging
 
 VENDOR_ID = 0x28de
 PRODUCT_ID = 0x1142
 FIRST_ENDPOINT = 2
 FIRST_CONTROLIDX = 1
-INPUT_FORMAT = [
-	('b',   'type'),
-	('x',   'ukn_01'),
-	('B',   'status'),
-	('x',   'ukn_02'),
-	('H',   'seq'),
-	('x',   'ukn_03'),
-	('I',   'buttons'),
-	('B',   'ltrig'),
-	('B',   'rtrig'),
-	('x',   'ukn_04'),
-	('x',   'ukn_05'),
-	('x',   'ukn_06'),
-	('h',   'lpad_x'),
-	('h',   'lpad_y'),
-	('h',   'rpad_x'),
-	('h',   'rpad_y'),
-	('10x', 'ukn_06'),
-	('h',   'gpitch'),
-	('h',   'groll'),
-	('h',   'gyaw'),
-	('h',   'q1'),
-	('h',   'q2'),
-	('h',   'q3'),
-	('h',   'q4'),
-	('16x', 'ukn_07')]
-FORMATS, NAMES = zip(*INPUT_FORMAT)
-TUP_FORMAT = '<' + ''.join(FORMATS)
-ControllerInput = namedtuple('ControllerInput', ' '.join([ x for x in NAMES if not x.startswith('ukn_') ]))
-SCI_NULL = ControllerInput._make(struct.unpack('<' + ''.join(FORMATS), b'\x00' * 64))
 STICKPRESS = 0b1000000000000000000000000000000
 
 
+class ControllerInput(ctypes.Structure):
+	"""
+	Decoded input packet. Packet itself is parsed by 'decode' function in
+	sc_dongle.c, check it for actual format.
+	"""
+	_fields_ = [
+		('type', ctypes.c_int8),
+		('status', ctypes.c_uint8),
+		('seq', ctypes.c_uint16),
+		('buttons', ctypes.c_uint32),
+		('ltrig', ctypes.c_uint8),
+		('rtrig', ctypes.c_uint8),
+		('lpad_x', ctypes.c_int32),
+		('lpad_y', ctypes.c_int32),
+		('rpad_x', ctypes.c_int32),
+		('rpad_y', ctypes.c_int32),
+		('gpitch', ctypes.c_int32),
+		('groll', ctypes.c_int32),
+		('gyaw', ctypes.c_int32),
+		('q1', ctypes.c_int32),
+		('q2', ctypes.c_int32),
+		('q3', ctypes.c_int32),
+		('q4', ctypes.c_int32),
+	]
+	
+	def __repr__(self):
+		return "ControllerInput(%s)" % (", ".join([
+			"%s=%s" % (name, getattr(self, name))
+			for (name, type) in self._fields_ ]),)
+
+
+class SCDecoder(ctypes.Structure):
+	"""
+	Holds current and previous state of controller. Both are overwritten
+	in place by 'decode', so no new objects are created for each packet.
+	"""
+	_fields_ = [
+		('rot_l_sin', ctypes.c_double),
+		('rot_l_cos', ctypes.c_double),
+		('rot_r_sin', ctypes.c_double),
+		('rot_r_cos', ctypes.c_double),
+		('rotate_l', ctypes.c_bool),
+		('rotate_r', ctypes.c_bool),
+		# Set by 'decode', cleared after state is passed to mapper
+		('pending', ctypes.c_bool),
+		('old_state', ControllerInput),
+		('state', ControllerInput),
+	]
+
+SCDecoderPtr = ctypes.POINTER(SCDecoder)
+
+_lib = find_library('libsc_dongle')
+_lib.decode.restype = ctypes.c_int
+_lib.decode.argtypes = [ SCDecoderPtr, ctypes.c_char_p ]
+
+
 log = logging.getLogger("SCDongle")
 
 def init(daemon, config):
@@ -100,10 +126,10 @@ class Dongle(USBDevice):
 	
 	
 	def _on_input(self, endpoint, data):
-		tup = ControllerInput._make(struct.unpack(TUP_FORMAT, data))
-		if tup.status == SCStatus.HOTPLUG:
-			# Most of INPUT_FORMAT doesn't apply here
-			if ord(str(data[4])) == 2:
+		status = data[2]
+		if status == SCStatus.HOTPLUG:
+			# Most of input packet doesn't apply here
+			if data[4] == 2:
 				# Controller connected
 				if endpoint not in self._controllers:
 					self._add_controller(endpoint)
@@ -113,7 +139,7 @@ class Dongle(USBDevice):
 					self.daemon.remove_controller(self._controllers[endpoint])
 					self._controllers[endpoint].disconnected()
 					del self._controllers[endpoint]
-		elif tup.status == SCStatus.INPUT:
+		elif status == SCStatus.INPUT:
 			if endpoint not in self._controllers:
 				self._add_controller(endpoint)
 			elif len(self._no_serial):
@@ -121,7 +147,7 @@ class Dongle(USBDevice):
 					x.read_serial()
 				self._no_serial = []
 			else:
-				self._controllers[endpoint].input(tup)
+				self._controllers[endpoint].input(data)
 
 
 class SCStatus(IntEnum):
@@ -172,7 +198,10 @@ class SCController(Controller):
 		# TODO: Is serial really used anywhere?
 		self._serial = "0000000000"
 		self._id = self._generate_id() if driver else "-"
-		self._old_state = SCI_NULL
+		self._decoder = SCDecoder()
+		self._decoder_ptr = ctypes.byref(self._decoder)
+		self._old_state = self._decoder.old_state
+		self._state = self._decoder.state
 		self._ccidx = ccidx
 	
 	
@@ -184,34 +213,31 @@ class SCController(Controller):
 		return "<SCWireless %s>" % (self.get_id(),)
 	
 	
-	def input(self, idata):
-		old_state, self._old_state = self._old_state, idata
+	def decode(self, data):
+		"""
+		Decodes input packet into controller state, without passing it
+		to mapper. Returns packet status.
+		"""
+		return _lib.decode(self._decoder_ptr, data)
+	
+	
+	def send_input(self):
+		"""
+		Passes last decoded state to mapper. If mapper is not set,
+		state is only marked as consumed.
+		"""
 		if self.mapper:
 			#if idata.buttons & SCButtons.LPAD:
 			#	# STICKPRESS button may signalize pressing stick instead
 			#	if (idata.buttons & STICKPRESS) and not (idata.buttons & STICKTILT):
 			#		idata = ControllerInput.replace(buttons=idata.buttons & ~SCButtons.LPAD)
-			
-			if self._input_rotation_l:
-				lx, ly = idata.lpad_x, idata.lpad_y
-				if idata.buttons & SCButtons.LPADTOUCH:
-					s, c = sin(self._input_rotation_l), cos(self._input_rotation_l)
-					lx = int(idata.lpad_x * c - idata.lpad_y * s)
-					ly = int(idata.lpad_x * s + idata.lpad_y * c)
-				s, c = sin(self._input_rotation_r), cos(self._input_rotation_r)
-				rx = int(idata.rpad_x * c - idata.rpad_y * s)
-				ry = int(idata.rpad_x * s + idata.rpad_y * c)
-				
-				# TODO: This is awfull :(
-				idata = ControllerInput(
-						idata.type, idata.status, idata.seq, idata.buttons,
-						idata.ltrig, idata.rtrig,
-						lx, ly, rx, ry,
-						idata.gpitch, idata.groll, idata.gyaw,
-						idata.q1, idata.q2, idata.q3, idata.q4
-				)
-			
-			self.mapper.input(self, old_state, idata)
+			self.mapper.input(self, self._old_state, self._state)
+		self._decoder.pending = False
+	
+	
+	def input(self, data):
+		self.decode(data)
+		self.send_input()
 	
 	
 	def _generate_id(self):
@@ -279,6 +305,11 @@ class SCController(Controller):
 				led_level=float(config['led_level']))
 		self._input_rotation_l = float(config['input_rotation_l']) * PI / -180.0
 		self._input_rotation_r = float(config['input_rotation_r']) * PI / -180.0
+		# Rotation itself is done by 'decode', sin & cos are computed only once
+		d = self._decoder
+		d.rotate_l, d.rotate_r = bool(self._input_rotation_l), bool(self._input_rotation_r)
+		d.rot_l_sin, d.rot_l_cos = sin(self._input_rotation_l), cos(self._input_rotation_l)
+		d.rot_r_sin, d.rot_r_cos = sin(self._input_rotation_r), cos(self._input_rotation_r)
 	
 	
 	def disconnected(self):
@@ -389,7 +420,9 @@ class SCController(Controller):
 		@param int count		number of period to play
 		"""
 		if amplitude >= 0:
-			self._driver.send_control(self._ccidx, struct.pack('<BBBHHH',
+			# Only latest feedback for each side is sent, as it replaces
+			# previous one anyway
+			self._driver.overwrite_control(self._ccidx, struct.pack('<BBBHHH',
 					SCPacketType.FEEDBACK, 0x07, position,
 					amplitude, period, count))	
 
@@ -10,19 +10,133 @@ Callback will be called with following arguments:
 Callback has to return created USBDevice instance or None.
 """
 from scc.lib import usb1
+from scc.tools import find_library
+from scc.tracing import tracer
+from collections import OrderedDict
 
-import time, traceback, logging
+import time, ctypes, traceback, logging
 log = logging.getLogger("USB")
 
+INPUT_TRANSFERS = 4		# Transfers submitted at once for every input endpoint
+DRAIN_BATCH = 16		# Packets copied from ring at once
+CONTROL_QUEUE_SIZE = 32	# Control messages waiting to be sent, per device
+CONTROL_TIMEOUT = 1000	# ms
+USB_RING_MODULE_VERSION = 2
+
+_lib = None
+
+
+def _get_lib():
+	""" Loads libusb_ring on first use """
+	global _lib
+	if _lib is None:
+		lib = find_library("libusb_ring")
+		if lib.usb_ring_module_version() != USB_RING_MODULE_VERSION:
+			raise Exception("Invalid native module version. Please, recompile 'libusb_ring.so'")
+		lib.usb_ring_new.restype = ctypes.c_void_p
+		lib.usb_ring_new.argtypes = [ ctypes.c_void_p, ctypes.c_ubyte,
+			ctypes.c_int, ctypes.c_int ]
+		lib.usb_ring_submit.argtypes = [ ctypes.c_void_p ]
+		lib.usb_ring_drain.argtypes = [ ctypes.c_void_p, ctypes.c_char_p,
+			ctypes.POINTER(ctypes.c_double), ctypes.c_int ]
+		lib.usb_ring_dropped.restype = ctypes.c_uint32
+		lib.usb_ring_dropped.argtypes = [ ctypes.c_void_p ]
+		lib.usb_ring_cancel.restype = None
+		lib.usb_ring_cancel.argtypes = [ ctypes.c_void_p ]
+		lib.usb_ring_active.argtypes = [ ctypes.c_void_p ]
+		lib.usb_ring_free.restype = None
+		lib.usb_ring_free.argtypes = [ ctypes.c_void_p ]
+		_lib = lib
+	return _lib
+
+
+class InputRing(object):
+	"""
+	Input transfers for one endpoint, handled by libusb_ring.
+	
+	Completed transfers are resubmitted by native code as soon as libusb
+	reports them, so packet is never lost or delayed just because
+	processing of previous one took long. Received packets wait in ring
+	until USBDriver.mainloop calls drain().
+	"""
+	
+	def __init__(self, handle, endpoint, size, callback):
+		self._lib = lib = _get_lib()
+		self.endpoint = endpoint
+		self.size = size
+		self.callback = callback
+		self._data = ctypes.create_string_buffer(size * DRAIN_BATCH)
+		self._times = (ctypes.c_double * DRAIN_BATCH)()
+		self._cancelled = None			# set by close()
+		# usb1 doesn't provide any public way to get raw handle
+		raw_handle = ctypes.cast(handle._USBDeviceHandle__handle, ctypes.c_void_p)
+		self._ring = lib.usb_ring_new(raw_handle, usb1.ENDPOINT_IN | endpoint,
+			size, INPUT_TRANSFERS)
+		if not self._ring:
+			raise MemoryError("Failed to allocate input transfers")
+		err = lib.usb_ring_submit(self._ring)
+		if err:
+			lib.usb_ring_free(self._ring)
+			self._ring = None
+			usb1.raiseUSBError(err)
+	
+	
+	def drain(self):
+		""" Passes all received packets to callback """
+		while self._ring:
+			dropped = self._lib.usb_ring_dropped(self._ring)
+			if dropped:
+				log.warning("Input from endpoint %s is not read fast enough, %s packets dropped",
+					self.endpoint, dropped)
+			count = self._lib.usb_ring_drain(self._ring, self._data, self._times, DRAIN_BATCH)
+			if count == 0:
+				return
+			data, times = self._data.raw, self._times[0:count]
+			for i in range(count):
+				tracer.report_received(times[i])
+				try:
+					self.callback(self.endpoint, data[i * self.size : (i + 1) * self.size])
+				except Exception as e:
+					log.error("Failed to handle recieved data")
+					log.error(e)
+					log.error(traceback.format_exc())
+				if not self._ring:
+					# Closed by callback
+					return
+	
+	
+	def close(self):
+		"""
+		Cancels all transfers. Transfers are freed by libusb_ring from
+		their own callbacks, as libusb reports them cancelled.
+		
+		Returns True once ring is freed. Returns False while some transfer
+		is still being cancelled; close() has to be called again after
+		libusb events are handled in that case.
+		"""
+		if self._ring:
+			self._cancelled, self._ring = self._ring, None
+			self._lib.usb_ring_cancel(self._cancelled)
+		if self._cancelled:
+			if self._lib.usb_ring_active(self._cancelled) > 0:
+				return False
+			self._lib.usb_ring_free(self._cancelled)
+			self._cancelled = None
+		return True
+
+
 class USBDevice(object):
 	""" Base class for all handled usb devices """
 	def __init__(self, device, handle):
 		self.device = device
 		self.handle = handle
 		self._claimed = []
-		self._cmsg = []		# controll messages
-		self._rmsg = []		# requests (excepts response)
-		self._transfer_list = []
+		self._cmsg = OrderedDict()	# controll messages and requests, by key
+		self._ccount = 0				# used to generate unique keys
+		self._ctransfer = None			# created on first flush
+		self._ctransfer_busy = False
+		self._input_rings = []
+		self._closing = False
 	
 	
 	def set_input_interrupt(self, endpoint, size, callback):
@@ -30,44 +144,22 @@ class USBDevice(object):
 		Helper method for setting up input transfer.
 		
 		callback(endpoint, data) is called repeadedly with every packed recieved.
+		INPUT_TRANSFERS transfers are kept submitted, so device doesn't have
+		to wait until callback is done with previous packet.
 		"""
-		def callback_wrapper(transfer):
-			if (transfer.getStatus() != usb1.TRANSFER_COMPLETED or
-				transfer.getActualLength() != size):
-				return
-			
-			data = transfer.getBuffer()
-			try:
-				callback(endpoint, data)
-			except Exception as e:
-				log.error("Failed to handle recieved data")
-				log.error(e)
-				log.error(traceback.format_exc())
-			finally:
-				transfer.submit()
-		
-		transfer = self.handle.getTransfer()
-		transfer.setInterrupt(
-			usb1.ENDPOINT_IN | endpoint,
-			size,
-			callback=callback_wrapper,
-		)
-		transfer.submit()
-		self._transfer_list.append(transfer)
+		self._input_rings.append(InputRing(self.handle, endpoint, size, callback))
+	
+	
+	def drain(self):
+		""" Passes packets received since last call to input callbacks """
+		for ring in list(self._input_rings):
+			ring.drain()
 	
 	
 	def send_control(self, index, data):
 		""" Schedules writing control to device """
-		zeros = b'\x00' * (64 - len(data))
-		
-		self._cmsg.insert(0, (
-			0x21,	# request_type
-			0x09,	# request
-			0x0300,	# value
-			index,
-			data + zeros,
-			0		# Timeout
-		))
+		self._ccount += 1
+		self._queue_control(self._ccount, index, data)
 	
 	
 	def overwrite_control(self, index, data):
@@ -75,21 +167,30 @@ class USBDevice(object):
 		Similar to send_control, but this one checks and overwrites
 		already scheduled controll for same device/index.
 		"""
-		for x in self._cmsg:
-			x_index, x_data, x_timeout = x[-3:]
-			# First 3 bytes are for PacketType, size and ConfigType
-			if x_index == index and x_data[0:3] == data[0:3]:
-				self._cmsg.remove(x)
-				break
-		self.send_control(index, data)
+		# First 3 bytes are for PacketType, size and ConfigType
+		self._queue_control((index, bytes(data[0:3])), index, data)
+	
+	
+	def _queue_control(self, key, index, data):
+		zeros = b'\x00' * (64 - len(data))
+		self._enqueue(key, (
+			(
+				0x21,	# request_type
+				0x09,	# request
+				0x0300,	# value
+				index,
+				data + zeros,
+			), index, 0, None
+		))
 	
 	
 	def make_request(self, index, callback, data, size=64):
 		"""
-		Schedules synchronous request that requires response.
+		Schedules request that requires response.
 		Request is done ASAP and provided callback is called with recieved data.
 		"""
-		self._rmsg.append((
+		self._ccount += 1
+		self._enqueue(self._ccount, (
 			(
 				0x21,	# request_type
 				0x09,	# request
@@ -99,22 +200,113 @@ class USBDevice(object):
 		))
 	
 	
+	def _enqueue(self, key, msg):
+		"""
+		Adds message to queue, replacing one with same key. If queue is
+		full, oldest control message (but never request) is dropped.
+		"""
+		self._cmsg.pop(key, None)
+		if len(self._cmsg) >= CONTROL_QUEUE_SIZE:
+			for k, (_, _, _, callback) in self._cmsg.items():
+				if callback is None:
+					del self._cmsg[k]
+					source = "usb:%.4x:%.4x" % (self.device.getVendorID(), self.device.getProductID())
+					if tracer.report_dropped(source, "control") == 1:
+						# Logged again only after drops are reported by 'scc stats'
+						log.warning("Device is not accepting control messages fast enough, dropping oldest")
+					break
+		self._cmsg[key] = msg
+	
+	
 	def flush(self):
-		""" Flushes all prepared control messages to the device """
-		while len(self._cmsg):
-			msg = self._cmsg.pop()
-			self.handle.controlWrite(*msg)
+		"""
+		Starts sending prepared control messages to the device.
+		Doesn't wait for device; messages are sent one by one, each as
+		soon as previous one is done.
+		"""
+		if self._ctransfer_busy or not self._cmsg:
+			return
+		if self._ctransfer is None:
+			self._ctransfer = self.handle.getTransfer()
+		key, (msg, index, size, callback) = self._cmsg.popitem(last=False)
+		self._ctransfer.setControl(*msg, callback=self._on_control_written,
+			user_data=(index, size, callback), timeout=CONTROL_TIMEOUT)
+		self._ctransfer.submit()
+		self._ctransfer_busy = True
+	
+	
+	def _on_control_written(self, transfer):
+		self._ctransfer_busy = False
+		if not self._control_completed(transfer):
+			return
+		index, size, callback = transfer.getUserData()
+		if callback is None:
+			self._flush_next()
+			return
+		transfer.setControl(
+			0xA1,	# request_type
+			0x01,	# request
+			0x0300,	# value
+			index, size,
+			callback=self._on_control_read, user_data=callback,
+			timeout=CONTROL_TIMEOUT)
+		try:
+			transfer.submit()
+			self._ctransfer_busy = True
+		except usb1.USBError as e:
+			log.error("Failed to read response from device: %s", e)
+			self.on_control_failed(e)
+	
+	
+	def _on_control_read(self, transfer):
+		self._ctransfer_busy = False
+		if not self._control_completed(transfer):
+			return
+		callback = transfer.getUserData()
+		try:
+			callback(transfer.getBuffer()[0:transfer.getActualLength()])
+		except Exception as e:
+			log.error("Failed to handle response")
+			log.error(e)
+			log.error(traceback.format_exc())
+		self._flush_next()
+	
+	
+	def _control_completed(self, transfer):
+		"""
+		Returns True if control transfer was completed, reports error
+		otherwise. Queue stops when transfer is cancelled, what happens
+		only when device is being closed.
+		"""
+		status = transfer.getStatus()
+		if status == usb1.TRANSFER_COMPLETED:
+			return True
+		if status != usb1.TRANSFER_CANCELLED:
+			log.error("Failed to send control message to device, status %s", status)
+			self.on_control_failed(status)
+		return False
+	
+	
+	def _flush_next(self):
+		""" Sends next queued message, called from transfer callbacks """
+		try:
+			self.flush()
+		except usb1.USBError as e:
+			log.error("Failed to send control message to device: %s", e)
+			self.on_control_failed(e)
+	
+	
+	def on_control_failed(self, error):
+		"""
+		Called when control message or request fails after flush() already
+		returned. 'error' is either transfer status or USBError.
 		
-		while len(self._rmsg):
-			msg, index, size, callback = self._rmsg.pop()
-			self.handle.controlWrite(*msg)
-			data = self.handle.controlRead(
-				0xA1,	# request_type
-				0x01,	# request
-				0x0300,	# value
-				index, size
-			)
-			callback(data)
+		Default implementation just continues with next message if device
+		timed out. Override to restart device that stopped responding.
+		"""
+		if error == usb1.TRANSFER_TIMED_OUT:
+			# Device may accept next one
+			self._flush_next()
 	
 	
 	def force_restart(self):
@@ -122,9 +314,15 @@ class USBDevice(object):
 		Restarts device, closes handle and tries to re-grab it again.
 		Don't use unless absolutelly necessary.
 		"""
+		if self._closing:
+			return
 		tp = self.device.getVendorID(), self.device.getProductID()
+		syspath = _usb.get_syspath(self.device)
 		self.close()
-		_usb._retry_devices.append(tp)
+		if syspath is not None:
+			del _usb._syspaths[syspath]
+			_usb._devices.pop(self.device, None)
+			_usb._retry_devices.append((syspath, tp))
 	
 	
 	def claim(self, number):
@@ -168,7 +366,26 @@ class USBDevice(object):
 	
 	
 	def close(self):
-		""" Called after device is disconnected """
+		"""
+		Called after device is disconnected. Input transfers are cancelled
+		right away, but handle is closed only after libusb reports them
+		cancelled, from USBDriver mainloop.
+		"""
+		if self._closing:
+			return
+		self._closing = True
+		if not self._finish_close():
+			_usb._closing.append(self)
+	
+	
+	def _finish_close(self):
+		"""
+		Closes handle if all input transfers are already freed.
+		Returns False if it's too early to do so.
+		"""
+		self._input_rings = [ ring for ring in self._input_rings if not ring.close() ]
+		if self._input_rings:
+			return False
 		try:
 			self.unclaim()
 		except: pass
@@ -176,6 +393,12 @@ class USBDevice(object):
 			self.handle.resetDevice()
 			self.handle.close()
 		except: pass
+		try:
+			self.device.close()
+		except usb1.USBErrorNoDevice:
+			# Safe to ignore, happens when device is physiucally removed
+			pass
+		return True
 
 
 class USBDriver(object):
@@ -188,6 +411,9 @@ class USBDriver(object):
 		self._started = False
 		self._retry_devices = []
 		self._retry_devices_timer = 0
+		self._closing = []		# USBDevices waiting for transfers to be cancelled
+		self._retry_task = None
+		self._timeout_task = None
 		self._ctx = None	# Set by start method
 		self._changed = 0
 	
@@ -203,6 +429,19 @@ class USBDriver(object):
 			to_release, self._devices, self._syspaths = self._devices.values(), {}, {}
 			for d in to_release:
 				d.close()
+		# Mainloop will not run anymore, so cancelling has to be waited for here
+		for i in range(100):
+			if not self._closing:
+				break
+			self._ctx.handleEventsTimeout(0.01)
+			self._finish_closing()
+		if self._closing:
+			# Should not happen. Devices are leaked, as it's not safe to close them
+			log.error("Failed to cancel input transfers of %s USB device(s)", len(self._closing))
+	
+	
+	def _finish_closing(self):
+		self._closing = [ d for d in self._closing if not d._finish_close() ]
 	
 	
 	def start(self):
@@ -279,18 +518,22 @@ class USBDriver(object):
 			return False
 	
 	
+	def get_syspath(self, device):
+		""" Returns syspath of handled device or None if it is not known """
+		for syspath, d in self._syspaths.items():
+			if d is device:
+				return syspath
+		return None
+	
+	
 	def handle_removed_device(self, syspath, vendor, product):
 		if syspath in self._syspaths:
 			device = self._syspaths[syspath]
 			handled_device = self._devices[device]
 			del self._syspaths[syspath]
 			del self._devices[device]
+			# Closes 'device' as well, once its transfers are cancelled
 			handled_device.close()
-			try:
-				device.close()
-			except usb1.USBErrorNoDevice:
-				# Safe to ignore, happens when device is physiucally removed
-				pass
 	
 	
 	def register_hotplug_device(self, callback, vendor_id, product_id, on_failure):
@@ -315,6 +558,10 @@ class USBDriver(object):
 		if self._changed > 0:
 			self._ctx.handleEventsTimeout()
 			self._changed = 0
+			for d in list(self._devices.values()):
+				d.drain()
+			if self._closing:
+				self._finish_closing()
 		
 		for d in self._devices.values():		# TODO: don't use .values() here
 			try:
@@ -323,12 +570,31 @@ class USBDriver(object):
 				log.error("USB device %s disconnected durring flush", d)
 				d.close()
 				break
-		if len(self._retry_devices):
-			if time.time() > self._retry_devices_timer:
-				self._retry_devices_timer = time.time() + 5.0
-				lst, self._retry_devices = self._retry_devices, []
-				for syspath, (vendor, product) in lst:
-					self.handle_new_device(syspath, vendor, product)
+		
+		if self._ctx and self._timeout_task is None:
+			# libusb may need to handle its internal timeouts even if none
+			# of its descriptors becomes ready.
+			timeout = self._ctx.getNextTimeout()
+			if timeout is not None:
+				self._timeout_task = self.daemon.get_scheduler().schedule(
+						timeout, self._on_libusb_timeout)
+		if len(self._retry_devices) and self._retry_task is None:
+			delay = max(0.0, self._retry_devices_timer - time.time())
+			self._retry_task = self.daemon.get_scheduler().schedule(
+					delay, self._retry)
+	
+	
+	def _on_libusb_timeout(self, *a):
+		self._timeout_task = None
+		self._changed += 1
+	
+	
+	def _retry(self, *a):
+		self._retry_task = None
+		self._retry_devices_timer = time.time() + 5.0
+		lst, self._retry_devices = self._retry_devices, []
+		for syspath, (vendor, product) in lst:
+			self.handle_new_device(syspath, vendor, product)
 
 
 # USBDriver should be process-wide singleton
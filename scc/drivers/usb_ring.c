@@ -0,0 +1,215 @@
+/**
+ * SC-Controller - USB input ring
+ *
+ * Keeps multiple interrupt transfers submitted for one input endpoint.
+ * Completed transfer is resubmitted right from libusb callback and
+ * received packet, along with time when it was received, is stored in
+ * ring, from where USBDevice reads it in batches.
+ *
+ * Everything here runs in thread that handles libusb events, so no
+ * locking is needed.
+ */
+#include <libusb.h>
+#include <inttypes.h>
+#include <stdbool.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#define USB_RING_MODULE_VERSION 2
+#define RING_SIZE 64
+
+struct USBRing {
+	libusb_device_handle* handle;
+	unsigned char endpoint;
+	int size;
+	int count;
+	int active;				// number of transfers still submitted
+	bool closing;
+	struct libusb_transfer** transfers;
+	bool* submitted;
+	uint8_t* packets;		// RING_SIZE packets of 'size' bytes
+	double times[RING_SIZE];
+	uint32_t head;
+	uint32_t tail;
+	uint32_t dropped;
+};
+
+typedef struct USBRing* USBRingPtr;
+
+
+/** Same clock as Python's time.perf_counter, used by tracing */
+static inline double now() {
+	struct timespec ts;
+	clock_gettime(CLOCK_MONOTONIC, &ts);
+	return (double)ts.tv_sec + (double)ts.tv_nsec / 1000000000.0;
+}
+
+
+static int index_of(USBRingPtr r, struct libusb_transfer* t) {
+	for (int i=0; i<r->count; i++)
+		if (r->transfers[i] == t)
+			return i;
+	return -1;
+}
+
+
+/** Frees transfer that is not submitted, along with its buffer */
+static void free_transfer(USBRingPtr r, int i) {
+	free(r->transfers[i]->buffer);
+	libusb_free_transfer(r->transfers[i]);
+	r->transfers[i] = NULL;
+}
+
+
+static void on_transfer(struct libusb_transfer* t) {
+	USBRingPtr r = (USBRingPtr)t->user_data;
+	if (r->closing) {
+		// Transfer is freed by its own cancellation callback, so ring
+		// doesn't have to wait for all of them before it can be freed
+		int i = index_of(r, t);
+		r->submitted[i] = false;
+		r->active --;
+		free_transfer(r, i);
+		return;
+	}
+	if ((t->status != LIBUSB_TRANSFER_COMPLETED)
+			|| (t->actual_length != r->size)) {
+		// Failed transfer, or one that returned unexpected amount
+		// of data, is not resubmitted
+		r->submitted[index_of(r, t)] = false;
+		r->active --;
+		return;
+	}
+
+	if (r->head - r->tail >= RING_SIZE) {
+		r->dropped ++;
+	} else {
+		uint32_t i = r->head % RING_SIZE;
+		memcpy(r->packets + i * r->size, t->buffer, r->size);
+		r->times[i] = now();
+		r->head ++;
+	}
+
+	if (libusb_submit_transfer(t) != 0) {
+		r->submitted[index_of(r, t)] = false;
+		r->active --;
+	}
+}
+
+
+/** Frees ring. Has to be called only while usb_ring_active returns 0 */
+void usb_ring_free(USBRingPtr r) {
+	for (int i=0; i<r->count; i++) {
+		if (r->transfers[i] != NULL)
+			free_transfer(r, i);
+	}
+	free(r->transfers);
+	free(r->submitted);
+	free(r->packets);
+	free(r);
+}
+
+
+/**
+ * Allocates ring with 'count' transfers for given endpoint.
+ * Returns NULL if memory cannot be allocated.
+ */
+USBRingPtr usb_ring_new(libusb_device_handle* handle, unsigned char endpoint, int size, int count) {
+	USBRingPtr r = calloc(1, sizeof(struct USBRing));
+	if (r == NULL) return NULL;
+	r->handle = handle;
+	r->endpoint = endpoint;
+	r->size = size;
+	r->count = count;
+	r->transfers = calloc(count, sizeof(struct libusb_transfer*));
+	r->submitted = calloc(count, sizeof(bool));
+	r->packets = malloc(RING_SIZE * size);
+	if ((r->transfers == NULL) || (r->submitted == NULL) || (r->packets == NULL)) {
+		usb_ring_free(r);
+		return NULL;
+	}
+	for (int i=0; i<count; i++) {
+		unsigned char* buffer = malloc(size);
+		r->transfers[i] = libusb_alloc_transfer(0);
+		if ((buffer == NULL) || (r->transfers[i] == NULL)) {
+			free(buffer);
+			usb_ring_free(r);
+			return NULL;
+		}
+		libusb_fill_interrupt_transfer(r->transfers[i], handle, endpoint,
+				buffer, size, on_transfer, r, 0);
+	}
+	return r;
+}
+
+
+/**
+ * Submits all transfers. Returns 0 if at least one transfer was
+ * submitted, libusb error code of first failure otherwise.
+ */
+int usb_ring_submit(USBRingPtr r) {
+	int err = 0;
+	for (int i=0; i<r->count; i++) {
+		if (r->submitted[i]) continue;
+		int rv = libusb_submit_transfer(r->transfers[i]);
+		if (rv == 0) {
+			r->submitted[i] = true;
+			r->active ++;
+		} else if (err == 0) {
+			err = rv;
+		}
+	}
+	return (r->active > 0) ? 0 : err;
+}
+
+
+/**
+ * Copies up to 'max' received packets into 'data' and times when they
+ * were received into 'times'. Returns number of copied packets.
+ */
+int usb_ring_drain(USBRingPtr r, uint8_t* data, double* times, int max) {
+	int n = 0;
+	while ((n < max) && (r->tail != r->head)) {
+		uint32_t i = r->tail % RING_SIZE;
+		memcpy(data + n * r->size, r->packets + i * r->size, r->size);
+		times[n] = r->times[i];
+		r->tail ++;
+		n ++;
+	}
+	return n;
+}
+
+
+/** Returns number of packets dropped because ring was full and resets it */
+uint32_t usb_ring_dropped(USBRingPtr r) {
+	uint32_t rv = r->dropped;
+	r->dropped = 0;
+	return rv;
+}
+
+
+/**
+ * Cancels all submitted transfers. Each is freed as soon as libusb
+ * reports it cancelled and ring can be freed once usb_ring_active
+ * returns 0. Doesn't wait for anything.
+ */
+void usb_ring_cancel(USBRingPtr r) {
+	r->closing = true;
+	for (int i=0; i<r->count; i++) {
+		// If cancelling fails, transfer has already completed and
+		// on_transfer will be called for it anyway
+		if (r->submitted[i])
+			libusb_cancel_transfer(r->transfers[i]);
+	}
+}
+
+
+int usb_ring_active(USBRingPtr r) {
+	return r->active;
+}
+
+
+int usb_ring_module_version(void) {
+	return USB_RING_MODULE_VERSION;
+}
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+SC-Controller - Event Stream
+
+Everything daemon sends to its clients goes through ClientWriter. Nothing
+is ever written to socket in blocking way, so client that doesn't read
+fast enough (OSD menu stuck on slow X server, for example) can't stall
+thread that processes input.
+
+Events generated by locked or observed sources are not sent right away,
+but queued and sent once per mainloop iteration. Queued position of pad,
+stick or trigger is replaced by newer one, so client gets only latest
+position, still in order with button events queued around it.
+
+Reply that is known only later, like result of profile loading, has its
+place reserved by reserve(). Everything written after it is held back until
+reply is filled, so client always receives replies in order of its commands.
+
+Clients that send 'Event format: binary' get events as fixed-size EVENT
+records instead of 'Event:' text lines. See docs/protocol.md.
+"""
+from collections import OrderedDict
+import socket, struct, threading, logging
+log = logging.getLogger("EventStream")
+
+# First byte of binary record. Text messages never start with it.
+EVENT_MARKER = 0
+# marker, number of values, source slot, two values
+EVENT = struct.Struct("<BBHii")
+
+
+class Reply(object):
+	""" Place for reply reserved by ClientWriter.reserve """
+	data = None
+
+
+class ClientWriter(object):
+	"""
+	Buffered, non-blocking replacement for file returned by
+	socket.makefile. Whatever can't be sent right away is kept in buffer
+	and sent when socket becomes writable.
+	
+	Descriptor can be registered in poller only once, so if 'on_read' is
+	set, it's called (without arguments) when there is data to read.
+	"""
+	# Client that has this much data unread is considered dead
+	MAX_BUFFER = 1024 * 1024
+	MAX_QUEUED = 4096
+	
+	def __init__(self, connection, poller, on_read=None):
+		self._connection = connection
+		self._poller = poller
+		self._fileno = connection.fileno()
+		self._on_read = on_read
+		self._lock = threading.Lock()
+		self._buffer = bytearray()
+		self._held = []				# Reserved replies and data written after them
+		self._queue = OrderedDict()
+		self._waiting = False		# True if socket should become writable
+		self._registered = False
+		self.closed = False
+		self._update_events()
+	
+	
+	def write(self, data):
+		""" Sends data as soon as possible """
+		with self._lock:
+			if self.closed:
+				return
+			if self._held:
+				self._held.append(bytes(data))
+				return
+			self._buffer += data
+			self._send()
+	
+	
+	def reserve(self):
+		"""
+		Reserves place for reply in output. Until reply is passed to fill()
+		with returned object, everything written later is held back.
+		"""
+		reply = Reply()
+		with self._lock:
+			if not self.closed:
+				self._held.append(reply)
+		return reply
+	
+	
+	def fill(self, reply, data):
+		"""
+		Sends reply, reserved by reserve(), along with everything that
+		was held back behind it and is not waiting for other reply.
+		"""
+		with self._lock:
+			reply.data = bytes(data)
+			if self.closed:
+				return
+			while self._held:
+				if isinstance(self._held[0], Reply):
+					if self._held[0].data is None:
+						break
+					self._buffer += self._held.pop(0).data
+				else:
+					self._buffer += self._held.pop(0)
+			self._send()
+	
+	
+	def queue(self, data, key=None):
+		"""
+		Queues data to be sent with next flush_queue() call.
+		If 'key' is set, data queued previously with same key and
+		not yet sent is replaced, keeping its position in queue, so
+		it's not reordered against events queued in meanwhile.
+		"""
+		with self._lock:
+			if self.closed:
+				return
+			if key is None:
+				key = object()
+			self._queue[key] = data
+			if len(self._queue) > self.MAX_QUEUED:
+				self._close("too many events queued")
+	
+	
+	def is_queued(self, key):
+		""" Returns True if data with 'key' is queued and not yet sent """
+		with self._lock:
+			return key in self._queue
+	
+	
+	def flush_queue(self):
+		"""
+		Moves queued data to buffer and sends it. Called by daemon once
+		per mainloop iteration.
+		
+		If data sent previously is still not completely received by client,
+		queued data are kept in queue, so only latest positions are sent
+		once client catches up.
+		"""
+		if not self._queue:
+			return
+		with self._lock:
+			if self.closed or self._waiting or self._held:
+				return
+			self._buffer += b"".join(self._queue.values())
+			self._queue.clear()
+			self._send()
+	
+	
+	def close(self):
+		with self._lock:
+			self._close(None)
+	
+	
+	def _send(self):
+		""" Has to be called with lock held """
+		if self._buffer:
+			try:
+				sent = self._connection.send(self._buffer, socket.MSG_DONTWAIT)
+			except (BlockingIOError, InterruptedError):
+				sent = 0
+			except OSError as e:
+				# Client died
+				return self._close(e)
+			del self._buffer[0:sent]
+		if len(self._buffer) > self.MAX_BUFFER:
+			self._close("client is not reading")
+		elif self._waiting != bool(self._buffer):
+			self._waiting = bool(self._buffer)
+			self._update_events()
+	
+	
+	def _update_events(self):
+		events = 0
+		if self._on_read:
+			events |= self._poller.POLLIN
+		if self._waiting:
+			events |= self._poller.POLLOUT
+		if events:
+			self._poller.register(self._fileno, events, self._on_ready)
+			self._registered = True
+		elif self._registered:
+			self._poller.unregister(self._fileno)
+			self._registered = False
+	
+	
+	def _on_ready(self, fd, event):
+		if event == self._poller.POLLIN and self._on_read:
+			self._on_read()
+		else:
+			# Errors and hangups are reported as POLLIN as well
+			with self._lock:
+				if not self.closed:
+					self._send()
+	
+	
+	def _close(self, reason):
+		""" Has to be called with lock held """
+		if self.closed:
+			return
+		if reason:
+			log.warning("Disconnecting client: %s", reason)
+		self.closed = True
+		self._buffer = bytearray()
+		self._held = []
+		self._queue.clear()
+		self._waiting = False
+		if reason:
+			# Reader, if any, is kept registered and notices that
+			# connection was closed
+			try:
+				self._connection.shutdown(socket.SHUT_RDWR)
+			except OSError:
+				pass
+		else:
+			self._on_read = None
+		self._update_events()
@@ -1277,8 +1277,7 @@ class App(Gtk.Application, UserDataManager, BindingEditor):
 	
 	
 	def on_daemon_reconfigured(self, *a):
-		log.debug("Reloading config...")
-		self.config.reload()
+		self.config.check()
 		for ps in self.profile_switchers:
 			ps.set_controller(ps.get_controller())
 	
@@ -11,6 +11,7 @@ probably too crazy even for me.
 from __future__ import unicode_literals
 
 from scc.tools import find_binary, find_button_image, nameof
+from scc.event_stream import EVENT, EVENT_MARKER
 from scc.paths import get_daemon_socket
 from scc.gui import BUTTON_ORDER
 from gi.repository import GObject, Gio, GLib
@@ -81,6 +82,7 @@ class DaemonManager(GObject.GObject):
 		self.buffer = b""
 		self._connect()
 		self._requests = []
+		self._event_sources = {}		# Slot -> (controller, source)
 		self._controllers = []			# Ordered as daemon says
 		self._controller_by_id = {}		# Source of memory leak
 	
@@ -150,6 +152,11 @@ class DaemonManager(GObject.GObject):
 			self._on_daemon_died()
 			return
 		self.buffer = b""
+		# Events are requested as binary records, what is faster to both
+		# generate and parse than text lines
+		self._event_sources = {}
+		self._requests.append(( self.nocallback, self.nocallback ))
+		self.connection.get_output_stream().write_all(b"Event format: binary\n", None)
 		self.connection.get_input_stream().read_bytes_async(102400,
 			1, None, self._on_read_data)
 	
@@ -170,9 +177,22 @@ class DaemonManager(GObject.GObject):
 			self._on_daemon_died()
 			return
 		self.buffer += data
-		while b"\n" in self.buffer:
-			line, self.buffer = self.buffer.split(b"\n", 1)
-			line = line.decode("utf-8")
+		pos = 0
+		while pos < len(self.buffer):
+			if self.buffer[pos] == EVENT_MARKER:
+				if len(self.buffer) - pos < EVENT.size:
+					break
+				marker, count, slot, x, y = EVENT.unpack_from(self.buffer, pos)
+				pos += EVENT.size
+				if slot in self._event_sources:
+					c, what = self._event_sources[slot]
+					c.emit('event', what, [ x, y ][0:count])
+					self.emit('event', c, what, [ x, y ][0:count])
+				continue
+			end = self.buffer.find(b"\n", pos)
+			if end < 0:
+				break
+			line, pos = self.buffer[pos:end].decode("utf-8"), end + 1
 			if line.startswith("Version:"):
 				version = line.split(":", 1)[-1].strip()
 				log.debug("Connected to daemon, version %s", version)
@@ -222,6 +242,9 @@ class DaemonManager(GObject.GObject):
 				c = self.get_controller(data[0])
 				c.emit('event', data[1], [ int(float(x)) for x in data[2:] ])
 				self.emit('event', c, data[1], [ int(float(x)) for x in data[2:] ])
+			elif line.startswith("Event source:"):
+				slot, controller_id, what = line[13:].strip().split(" ", 2)
+				self._event_sources[int(slot)] = self.get_controller(controller_id), what
 			elif line.startswith("Error:"):
 				error = line.split(":", 1)[-1].strip()
 				self.alive = True
@@ -237,6 +260,7 @@ class DaemonManager(GObject.GObject):
 				pass
 			else:
 				self.emit('unknown-msg', line)
+		self.buffer = self.buffer[pos:]
 		# Connection is held forever to detect when daemon exits
 		if self.connection:
 			self.connection.get_input_stream().read_bytes_async(102400,
@@ -0,0 +1,182 @@
+/**
+ * SC-Controller - Gyro
+ *
+ * Math used by gyro actions. Quaternion from input report is converted
+ * to euler angles by gyro_decode, only once per report, and result is
+ * then shared by all actions that need it. gyroabs_compute does rest of
+ * what GyroAbsAction needs and leaves final axis values in state.
+ */
+#include <inttypes.h>
+#include <stdbool.h>
+#include <math.h>
+
+#define GYRO_MODULE_VERSION 1
+
+#define STICK_PAD_MIN		-32768
+#define STICK_PAD_MAX		 32768
+#define TRIGGER_MIN			0
+#define TRIGGER_MAX			255
+#define JUMP_HARDCODED_LIMIT 5
+#define MOUSE_FACTOR		0.01
+
+/** Must match values in gyro.py */
+#define AXIS_NONE			0
+#define AXIS_STICK			1
+#define AXIS_TRIGGER		2
+#define AXIS_HAT			3
+#define AXIS_MOUSE			4
+
+#define DZ_NONE				0
+#define DZ_CUT				1
+#define DZ_ROUND			2
+#define DZ_LINEAR			3
+#define DZ_MINIMUM			4
+
+/** Must match GyroReport in gyro.py */
+struct GyroReport {
+	int32_t q[4];
+	bool eurel;
+	bool valid;
+	double pyr[3];
+};
+
+/** Must match GyroAbsState in gyro.py */
+struct GyroAbsState {
+	double ir[3];
+	double speed[3];
+	int32_t kind[3];
+	int32_t dz_mode;
+	int32_t dz_lower;
+	int32_t dz_upper;
+	int32_t out[3];
+	bool oor;
+};
+
+
+static inline double clamp(double min, double x, double max) {
+	return (x < min) ? min : ((x > max) ? max : x);
+}
+
+
+/** Same as tools.anglediff; Python's % operator is floored, fmod is not */
+static inline double anglediff(double a1, double a2) {
+	double x = fmod(a2 - a1 + M_PI, 2.0 * M_PI);
+	if (x < 0) x += 2.0 * M_PI;
+	return x - M_PI;
+}
+
+
+/** Same as tools.quat2euler */
+static void quat2euler(double* pyr, double q0, double q1, double q2, double q3) {
+	double qq0 = q0 * q0, qq1 = q1 * q1, qq2 = q2 * q2, qq3 = q3 * q3;
+	double xa = qq0 - qq1 - qq2 + qq3;
+	double xb = 2 * (q0 * q1 + q2 * q3);
+	double xn = 2 * (q0 * q2 - q1 * q3);
+	double yn = 2 * (q1 * q2 + q0 * q3);
+	double zn = qq3 + qq2 - qq0 - qq1;
+
+	pyr[0] = atan2(xb, xa);
+	// Rounding may push xn slightly out of -1 to 1 range
+	pyr[1] = atan2(xn, sqrt(fmax(0.0, 1 - xn * xn)));
+	pyr[2] = atan2(yn, zn);
+}
+
+
+/** 1D variants of DeadzoneModifier.mode_* methods */
+static double deadzone(const struct GyroAbsState* st, double x, double range) {
+	double lower = st->dz_lower, upper = st->dz_upper;
+	switch (st->dz_mode) {
+	case DZ_CUT:
+		return (fabs(x) < lower || fabs(x) > upper) ? 0 : x;
+	case DZ_ROUND:
+		if (fabs(x) > upper)
+			return copysign(range, x);
+		return (fabs(x) < lower) ? 0 : x;
+	case DZ_LINEAR:
+		return copysign(clamp(0, ((x - lower) / (upper - lower)) * range, range), x);
+	case DZ_MINIMUM:
+		if (fabs(x) < JUMP_HARDCODED_LIMIT)
+			return 0;
+		return copysign((fabs(x) / range * (upper - lower)) + lower, x);
+	default:
+		return x;
+	}
+}
+
+
+/** Same as AxisAction.clamp_axis */
+static int32_t clamp_axis(int32_t kind, double value) {
+	switch (kind) {
+	case AXIS_TRIGGER:
+		return (int32_t)clamp(TRIGGER_MIN, value, TRIGGER_MAX);
+	case AXIS_HAT:
+		return (int32_t)clamp(-1, value, 1);
+	default:
+		return (int32_t)clamp(STICK_PAD_MIN, value, STICK_PAD_MAX);
+	}
+}
+
+
+/**
+ * Computes pitch, yaw and roll from raw quaternion, unless it was already
+ * computed for same values.
+ */
+void gyro_decode(struct GyroReport* r, int32_t q1, int32_t q2, int32_t q3, int32_t q4, bool eurel) {
+	if (r->valid && (r->eurel == eurel)
+			&& (r->q[0] == q1) && (r->q[1] == q2)
+			&& (r->q[2] == q3) && (r->q[3] == q4))
+		return;
+	r->q[0] = q1; r->q[1] = q2; r->q[2] = q3; r->q[3] = q4;
+	r->eurel = eurel;
+	r->valid = true;
+	if (eurel) {
+		// Controller already sends pitch, yaw and roll; 10430.37 = 2**15 / PI
+		r->pyr[0] = q1 / 10430.37;
+		r->pyr[1] = q2 / 10430.37;
+		r->pyr[2] = q3 / 10430.37;
+	} else {
+		quat2euler(r->pyr, q1 / 32768.0, q2 / 32768.0, q3 / 32768.0, q4 / 32768.0);
+	}
+}
+
+
+/**
+ * Does what GyroAbsAction.gyro does, short of sending anything anywhere.
+ * Initial rotation is taken from report where it's not yet known (is zero),
+ * resulting values for all three axes are stored in st->out and st->oor
+ * is set if rotation is out of range.
+ */
+void gyroabs_compute(struct GyroAbsState* st, const struct GyroReport* r) {
+	st->oor = false;
+	for (int i=0; i<3; i++) {
+		if (st->ir[i] == 0.0)
+			st->ir[i] = r->pyr[i];
+		double v = trunc(anglediff(st->ir[i], r->pyr[i]) * 32768.0 * st->speed[2] * 2.0 / M_PI);
+		if (v > STICK_PAD_MAX) {
+			v = STICK_PAD_MAX;
+			st->oor = true;
+		} else if (v < STICK_PAD_MIN) {
+			v = STICK_PAD_MIN;
+			st->oor = true;
+		}
+
+		switch (st->kind[i]) {
+		case AXIS_NONE:
+			st->out[i] = 0;
+			break;
+		case AXIS_MOUSE:
+			st->out[i] = clamp_axis(AXIS_MOUSE, v * MOUSE_FACTOR * st->speed[i]);
+			break;
+		default:
+			st->out[i] = clamp_axis(st->kind[i], v * st->speed[i]);
+			if (st->dz_mode != DZ_NONE)
+				st->out[i] = (int32_t)deadzone(st, st->out[i], STICK_PAD_MAX);
+			break;
+		}
+	}
+}
+
+
+const int gyro_module_version(void) {
+	return GYRO_MODULE_VERSION;
+}
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+SC-Controller - Gyro
+
+Wrapper around libgyro, native implementation of math needed by gyro
+actions. Mapper keeps one GyroReport, so quaternion from input report is
+converted to euler angles only once, no matter how many actions use it.
+"""
+from scc.tools import find_library
+from scc.constants import CUT, ROUND, LINEAR, MINIMUM
+from scc.uinput import Axes, Rels
+import ctypes, logging
+log = logging.getLogger("Gyro")
+
+GYRO_MODULE_VERSION = 1
+
+# Must match values in gyro.c
+AXIS_NONE		= 0
+AXIS_STICK		= 1
+AXIS_TRIGGER	= 2
+AXIS_HAT		= 3
+AXIS_MOUSE		= 4
+
+DEADZONE_MODES = { CUT : 1, ROUND : 2, LINEAR : 3, MINIMUM : 4 }
+
+_lib = None
+
+
+def _get_lib():
+	"""
+	Loads libgyro on first use, so importing actions doesn't require
+	native module to be compiled.
+	"""
+	global _lib
+	if _lib is None:
+		lib = find_library("libgyro")
+		if lib.gyro_module_version() != GYRO_MODULE_VERSION:
+			raise Exception("Invalid native module version. Please, recompile 'libgyro.so'")
+		lib.gyro_decode.restype = None
+		lib.gyro_decode.argtypes = [ ctypes.POINTER(GyroReport),
+			ctypes.c_int32, ctypes.c_int32, ctypes.c_int32, ctypes.c_int32,
+			ctypes.c_bool ]
+		lib.gyroabs_compute.restype = None
+		lib.gyroabs_compute.argtypes = [ ctypes.POINTER(GyroAbsState),
+			ctypes.POINTER(GyroReport) ]
+		_lib = lib
+	return _lib
+
+
+def axis_kind(axis):
+	""" Returns AXIS_* constant describing how is value for 'axis' clamped """
+	if isinstance(axis, Rels):
+		# Compared first, as Rels.REL_X == Axes.ABS_X
+		return AXIS_MOUSE if axis in (Rels.REL_X, Rels.REL_Y) else AXIS_NONE
+	if not isinstance(axis, (Axes, int)):
+		return AXIS_NONE
+	if axis in (Axes.ABS_Z, Axes.ABS_RZ):
+		return AXIS_TRIGGER
+	if axis in (Axes.ABS_HAT0X, Axes.ABS_HAT0Y):
+		return AXIS_HAT
+	return AXIS_STICK
+
+
+class GyroReport(ctypes.Structure):
+	"""
+	Euler angles computed from last quaternion passed to decode().
+	Calling decode() again with same values does nothing.
+	"""
+	_fields_ = [
+		('q', ctypes.c_int32 * 4),
+		('eurel', ctypes.c_bool),
+		('valid', ctypes.c_bool),
+		('pyr', ctypes.c_double * 3),
+	]
+	
+	def decode(self, q1, q2, q3, q4, eurel=False):
+		"""
+		Returns (pitch, yaw, roll) array, values in -PI to PI range.
+		If 'eurel' is True, q1-q3 are already pitch, yaw and roll,
+		as sent by controllers with ControllerFlags.EUREL_GYROS.
+		"""
+		_get_lib().gyro_decode(self, q1, q2, q3, q4, bool(eurel))
+		return self.pyr
+
+
+class GyroAbsState(ctypes.Structure):
+	"""
+	Everything GyroAbsAction needs to know to compute axis values.
+	Results are stored in 'out' and 'oor' (out of range) fields.
+	"""
+	_fields_ = [
+		('ir', ctypes.c_double * 3),
+		('speed', ctypes.c_double * 3),
+		('kind', ctypes.c_int32 * 3),
+		('dz_mode', ctypes.c_int32),
+		('dz_lower', ctypes.c_int32),
+		('dz_upper', ctypes.c_int32),
+		('out', ctypes.c_int32 * 3),
+		('oor', ctypes.c_bool),
+	]
+	
+	def __init__(self, axes, speed, deadzone=None):
+		ctypes.Structure.__init__(self)
+		for i in (0, 1, 2):
+			self.kind[i] = axis_kind(axes[i])
+			self.speed[i] = speed[i]
+		if deadzone:
+			mode, self.dz_lower, self.dz_upper = deadzone
+			self.dz_mode = DEADZONE_MODES[mode]
+	
+	
+	def reset(self):
+		""" Forgets initial rotation, so it's determined again """
+		self.ir[0] = self.ir[1] = self.ir[2] = 0.0
+	
+	
+	def compute(self, report):
+		_get_lib().gyroabs_compute(self, report)
+		return self.out
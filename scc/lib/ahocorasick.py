@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Aho-Corasick
+
+Finds all of many substrings in text in single pass over that text.
+Used by autoswitcher, which may have hundreds of conditions matching part
+of window title.
+"""
+
+
+class Automaton(object):
+	"""
+	Built from iterable of (substring, value) pairs. find_all(text) returns
+	set of values of all substrings found in text.
+	"""
+	
+	def __init__(self, items):
+		# Every state is index to these lists; state 0 is root
+		self._goto = [ {} ]
+		self._fail = [ 0 ]
+		self._out = [ set() ]
+		for substring, value in items:
+			self._add(substring, value)
+		self._build()
+	
+	
+	def _add(self, substring, value):
+		state = 0
+		for ch in substring:
+			nxt = self._goto[state].get(ch)
+			if nxt is None:
+				nxt = len(self._goto)
+				self._goto.append({})
+				self._fail.append(0)
+				self._out.append(set())
+				self._goto[state][ch] = nxt
+			state = nxt
+		self._out[state].add(value)
+	
+	
+	def _build(self):
+		""" Computes failure links, breadth-first """
+		queue = list(self._goto[0].values())
+		while queue:
+			state = queue.pop(0)
+			for ch, nxt in self._goto[state].items():
+				queue.append(nxt)
+				f = self._fail[state]
+				while f and ch not in self._goto[f]:
+					f = self._fail[f]
+				self._fail[nxt] = self._goto[f].get(ch, 0)
+				self._out[nxt] |= self._out[self._fail[nxt]]
+	
+	
+	def find_all(self, text):
+		rv = set()
+		goto, fail, out = self._goto, self._fail, self._out
+		state = 0
+		for ch in text:
+			while state and ch not in goto[state]:
+				state = fail[state]
+			state = goto[state].get(ch, 0)
+			if out[state]:
+				rv |= out[state]
+		# Empty substring is part of every text
+		rv |= out[0]
+		return rv
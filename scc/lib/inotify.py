@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Inotify
+
+Minimal ctypes wrapper around inotify(7), just enough to watch directories
+for changed files. Descriptor is non-blocking and can be registered
+in Poller; read_events() returns list of (wd, mask, name) tuples.
+"""
+from ctypes.util import find_library
+import os, ctypes, struct
+
+IN_MODIFY		= 0x00000002
+IN_CLOSE_WRITE	= 0x00000008
+IN_MOVED_FROM	= 0x00000040
+IN_MOVED_TO		= 0x00000080
+IN_CREATE		= 0x00000100
+IN_DELETE		= 0x00000200
+IN_DELETE_SELF	= 0x00000400
+IN_MOVE_SELF	= 0x00000800
+IN_Q_OVERFLOW	= 0x00004000
+IN_IGNORED		= 0x00008000
+IN_ONLYDIR		= 0x01000000
+
+IN_CLOEXEC		= os.O_CLOEXEC
+IN_NONBLOCK		= os.O_NONBLOCK
+
+_EVENT = struct.Struct("iIII")
+
+
+def _load_libc():
+	libc = ctypes.CDLL(find_library("c"), use_errno=True)
+	libc.inotify_init1.argtypes = [ ctypes.c_int ]
+	libc.inotify_init1.restype = ctypes.c_int
+	libc.inotify_add_watch.argtypes = [ ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32 ]
+	libc.inotify_add_watch.restype = ctypes.c_int
+	libc.inotify_rm_watch.argtypes = [ ctypes.c_int, ctypes.c_int ]
+	libc.inotify_rm_watch.restype = ctypes.c_int
+	return libc
+
+
+class Inotify(object):
+	_libc = None
+	
+	def __init__(self):
+		if Inotify._libc is None:
+			Inotify._libc = _load_libc()
+		self._fd = Inotify._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+		if self._fd < 0:
+			e = ctypes.get_errno()
+			raise OSError(e, os.strerror(e))
+	
+	
+	def fileno(self):
+		return self._fd
+	
+	
+	def add_watch(self, path, mask):
+		""" Returns watch descriptor. Raises OSError on failure """
+		wd = Inotify._libc.inotify_add_watch(self._fd, path.encode("utf-8"), mask)
+		if wd < 0:
+			e = ctypes.get_errno()
+			raise OSError(e, os.strerror(e), path)
+		return wd
+	
+	
+	def rm_watch(self, wd):
+		Inotify._libc.inotify_rm_watch(self._fd, wd)
+	
+	
+	def read_events(self):
+		"""
+		Returns list of (wd, mask, name) tuples for all events available
+		or empty list if there is nothing to read.
+		"""
+		rv = []
+		while True:
+			try:
+				data = os.read(self._fd, 4096)
+			except BlockingIOError:
+				break
+			if not data:
+				break
+			offset = 0
+			while offset + _EVENT.size <= len(data):
+				wd, mask, cookie, length = _EVENT.unpack_from(data, offset)
+				offset += _EVENT.size
+				name = data[offset:offset + length].rstrip(b"\x00")
+				offset += length
+				rv.append(( wd, mask, name.decode("utf-8", "replace") ))
+		return rv
+	
+	
+	def close(self):
+		if self._fd >= 0:
+			os.close(self._fd)
+			self._fd = -1
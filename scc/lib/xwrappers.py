@@ -18,9 +18,10 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
-from ctypes import CDLL, POINTER, c_void_p, Structure, byref, cast
+from ctypes import CDLL, CFUNCTYPE, POINTER, c_void_p, Structure, Union, byref, cast
 from ctypes import c_long, c_ulong, c_int, c_uint, c_short
 from ctypes import c_ushort, c_ubyte, c_char_p, c_bool
+from collections import OrderedDict
 
 
 def _load_lib(*names):
@@ -108,6 +109,54 @@ class XWindowAttributes(Structure):
 		('screen', c_void_p)
 	]
 
+class XConfigureEvent(Structure):
+	_fields_ = [
+		('type', c_int),
+		('serial', c_ulong),
+		('send_event', c_int),
+		('display', c_void_p),
+		('event', XID),
+		('window', XID),
+		('x', c_int),
+		('y', c_int),
+		('width', c_int),
+		('height', c_int),
+		('border_width', c_int),
+		('above', XID),
+		('override_redirect', c_int),
+	]
+
+class XPropertyEvent(Structure):
+	_fields_ = [
+		('type', c_int),
+		('serial', c_ulong),
+		('send_event', c_int),
+		('display', c_void_p),
+		('window', XID),
+		('atom', Atom),
+		('time', c_ulong),
+		('state', c_int),
+	]
+
+class XErrorEvent(Structure):
+	_fields_ = [
+		('type', c_int),
+		('display', c_void_p),
+		('resourceid', XID),
+		('serial', c_ulong),
+		('error_code', c_ubyte),
+		('request_code', c_ubyte),
+		('minor_code', c_ubyte),
+	]
+
+class XEvent(Union):
+	_fields_ = [
+		('type', c_int),
+		('xconfigure', XConfigureEvent),
+		('xproperty', XPropertyEvent),
+		('pad', c_long * 24),
+	]
+
 
 # Consants
 SHAPE_BOUNDING	= 0
@@ -121,6 +170,14 @@ SUCCESS			= 0
 
 ISVIEWABLE		= 2
 
+CONFIGURENOTIFY	= 22
+PROPERTYNOTIFY	= 28
+STRUCTURENOTIFYMASK	= 1 << 17
+PROPERTYCHANGEMASK	= 1 << 22
+QUEUEDALREADY	= 0
+BADWINDOW		= 3
+BADDRAWABLE		= 9
+
 
 # Functions
 open_display = libX11.XOpenDisplay
@@ -128,6 +185,10 @@ open_display.__doc__ = "Opens connection to XDisplay"
 open_display.argtypes = [ c_char_p ]
 open_display.restype = c_void_p
 
+close_display = libX11.XCloseDisplay
+close_display.__doc__ = "Closes connection to XDisplay"
+close_display.argtypes = [ c_void_p ]
+
 free = libX11.XFree
 free.__doc__ = "Used to free some resource returned by XLib"
 free.argtypes = [ c_void_p ]
@@ -161,6 +222,32 @@ query_pointer.__doc__ = "Returns a lot of nonsense along with mouse cursor posit
 query_pointer.argtypes = [ c_void_p, XID, POINTER(XID), POINTER(XID),
 	POINTER(c_int), POINTER(c_int), POINTER(c_int), POINTER(c_int), POINTER(c_uint) ]
 
+XErrorHandler = CFUNCTYPE(c_int, c_void_p, POINTER(XErrorEvent))
+set_error_handler = libX11.XSetErrorHandler
+set_error_handler.__doc__ = "Sets function called when XServer reports error"
+set_error_handler.argtypes = [ XErrorHandler ]
+set_error_handler.restype = c_void_p
+
+connection_number = libX11.XConnectionNumber
+connection_number.__doc__ = "Returns file descriptor of connection to XServer"
+connection_number.argtypes = [ c_void_p ]
+
+select_input = libX11.XSelectInput
+select_input.__doc__ = "Sets events XServer should report for window"
+select_input.argtypes = [ c_void_p, XID, c_long ]
+
+pending = libX11.XPending
+pending.__doc__ = "Reads events from XServer and returns number of queued events"
+pending.argtypes = [ c_void_p ]
+
+events_queued = libX11.XEventsQueued
+events_queued.__doc__ = "Returns number of queued events. With QUEUEDALREADY, doesn't talk to XServer"
+events_queued.argtypes = [ c_void_p, c_int ]
+
+next_event = libX11.XNextEvent
+next_event.__doc__ = "Removes first event from queue"
+next_event.argtypes = [ c_void_p, POINTER(XEvent) ]
+
 get_window_attributes = libX11.XGetWindowAttributes
 get_window_attributes.__doc__ = "https://tronche.com/gui/x/xlib/window-information/XGetWindowAttributes.html"
 get_window_attributes.argtypes = [ c_void_p, XID, POINTER(XWindowAttributes) ]
@@ -267,6 +354,13 @@ def get_xkb_state(dpy):
 
 
 def get_window_size(dpy, window):
+	cache = _geometry_caches.get(dpy)
+	if cache is not None:
+		return cache.get_window_size(window)
+	return _get_window_size(dpy, window)
+
+
+def _get_window_size(dpy, window):
 	attrs = XWindowAttributes()
 	get_window_attributes(dpy, window, byref(attrs))
 	return attrs.width, attrs.height
@@ -281,6 +375,13 @@ def is_window_visible(dpy, window):
 
 def get_window_geometry(dpy, win):
 	""" Returns window x,y,width,height """
+	cache = _geometry_caches.get(dpy)
+	if cache is not None:
+		return cache.get_window_geometry(win)
+	return _get_window_geometry(dpy, win)
+
+
+def _get_window_geometry(dpy, win):
 	attrs = XWindowAttributes()
 	get_window_attributes(dpy, win, byref(attrs))
 	x, y = c_int(), c_int()
@@ -294,7 +395,10 @@ def get_window_geometry(dpy, win):
 
 
 def get_screen_size(dpy):
-	return get_window_size(dpy, get_default_root_window(dpy))
+	cache = _geometry_caches.get(dpy)
+	if cache is not None:
+		return cache.get_screen_size()
+	return _get_window_size(dpy, get_default_root_window(dpy))
 
 
 def get_mouse_pos(dpy, relative_to=None):
@@ -348,14 +452,27 @@ def get_current_window(dpy):
 	"""
 	Returns active window or root window if there is no active.
 	"""
-	# Try using WM-provided info first
+	cache = _geometry_caches.get(dpy)
+	if cache is not None:
+		return cache.get_current_window()
+	rv = _get_active_window(dpy)
+	if rv is not None:
+		return rv
+	return _get_focused_window(dpy)
+
+
+def _get_active_window(dpy):
+	""" Returns _NET_ACTIVE_WINDOW or None if WM doesn't provide it """
 	trash, prop = get_window_prop(dpy,
 			get_default_root_window(dpy), "_NET_ACTIVE_WINDOW")
-	if prop is not None:
+	if prop is not None and prop.value is not None:
 		rv = cast(prop, POINTER(Atom)).contents.value
 		free(prop)
 		return rv
-	
+	return None
+
+
+def _get_focused_window(dpy):
 	# Fall-back to something what probably can't work anyway
 	win, revert_to = XID(), c_int()
 	get_input_focus(dpy, byref(win), byref(revert_to))
@@ -416,3 +533,161 @@ def get_wm_state(dpy, window):
 	count, state = get_window_prop(dpy, window, "_NET_WM_STATE", 1024)
 	if count <= 0: return []
 	return cast(state, POINTER(Atom))[0:count]
+
+
+# Windows passed to ignore_window_errors, only last few are remembered
+_ignored_windows = OrderedDict()
+_IGNORED_WINDOWS_MAX = 32
+_previous_error_handler = None
+
+
+@XErrorHandler
+def _on_error(dpy, event):
+	e = event.contents
+	if e.error_code in (BADWINDOW, BADDRAWABLE) and e.resourceid in _ignored_windows:
+		return 0
+	return _previous_error_handler(dpy, event)
+
+
+def ignore_window_errors(window):
+	"""
+	Ignores errors caused by 'window' being destroyed. Needed when events
+	are selected on windows owned by other clients, as those may be
+	destroyed at any time. Errors are reported asynchronously, so few
+	previously passed windows are remembered as well.
+	
+	All other errors are passed to previously set handler, which by
+	default terminates process.
+	"""
+	global _previous_error_handler
+	if _previous_error_handler is None:
+		_previous_error_handler = XErrorHandler(set_error_handler(_on_error))
+	_ignored_windows.pop(window, None)
+	_ignored_windows[window] = True
+	while len(_ignored_windows) > _IGNORED_WINDOWS_MAX:
+		_ignored_windows.popitem(last=False)
+
+
+_geometry_caches = {}
+
+
+def watch_geometry(dpy):
+	"""
+	Starts caching screen size, active window and its geometry for
+	display, so get_screen_size, get_current_window, get_window_size and
+	get_window_geometry don't have to ask XServer every time.
+	
+	Returned GeometryCache has to be registered in poller, so its
+	process_events method is called whenever there is something to read
+	on connection.
+	"""
+	if dpy not in _geometry_caches:
+		_geometry_caches[dpy] = GeometryCache(dpy)
+	return _geometry_caches[dpy]
+
+
+def unwatch_geometry(dpy):
+	""" Stops caching started by watch_geometry """
+	_geometry_caches.pop(dpy, None)
+
+
+class GeometryCache(object):
+	"""
+	Values cached by watch_geometry. Every value is computed when it's
+	needed first time and kept until XServer reports that it may have
+	changed; screen size by ConfigureNotify on root window (sent on
+	XRandR resize), active window by change of _NET_ACTIVE_WINDOW
+	property and its size and position by ConfigureNotify on active window.
+	"""
+	
+	def __init__(self, dpy):
+		self.dpy = dpy
+		self.root = get_default_root_window(dpy)
+		self._net_active_window = intern_atom(dpy, b"_NET_ACTIVE_WINDOW", False)
+		self._screen_size = None
+		self._window = None
+		self._window_size = None
+		self._window_geometry = None
+		self._event = XEvent()
+		select_input(dpy, self.root, STRUCTURENOTIFYMASK | PROPERTYCHANGEMASK)
+		flush(dpy)
+	
+	
+	def fileno(self):
+		return connection_number(self.dpy)
+	
+	
+	def process_events(self, *a):
+		""" Reads events from XServer and drops values they invalidate """
+		while pending(self.dpy):
+			self._process_event()
+	
+	
+	def _process_event(self):
+		ev = self._event
+		next_event(self.dpy, byref(ev))
+		if ev.type == CONFIGURENOTIFY:
+			if ev.xconfigure.window == self.root:
+				self._screen_size = None
+			elif ev.xconfigure.window == self._window:
+				self._window_size, self._window_geometry = None, None
+		elif ev.type == PROPERTYNOTIFY:
+			if ev.xproperty.atom == self._net_active_window:
+				self._set_window(None)
+	
+	
+	def _check_queue(self):
+		"""
+		Processes events Xlib may have read while waiting for reply to
+		something else; those would not wake up poller.
+		"""
+		while events_queued(self.dpy, QUEUEDALREADY):
+			self._process_event()
+	
+	
+	def _set_window(self, window):
+		# Events are not unselected on previously active window, as it
+		# may be already destroyed
+		self._window = window
+		self._window_size, self._window_geometry = None, None
+		if window is not None and window != self.root:
+			# Window cache is watching may be destroyed at any time
+			ignore_window_errors(window)
+			select_input(self.dpy, window, STRUCTURENOTIFYMASK)
+			flush(self.dpy)
+	
+	
+	def get_screen_size(self):
+		self._check_queue()
+		if self._screen_size is None:
+			self._screen_size = _get_window_size(self.dpy, self.root)
+		return self._screen_size
+	
+	
+	def get_current_window(self):
+		self._check_queue()
+		if self._window is None:
+			window = _get_active_window(self.dpy)
+			if not window:
+				# Not cached, as there is no event to tell when focus changes
+				return _get_focused_window(self.dpy)
+			self._set_window(window)
+		return self._window
+	
+	
+	def get_window_size(self, window):
+		self._check_queue()
+		if window != self._window:
+			return _get_window_size(self.dpy, window)
+		if self._window_size is None:
+			self._window_size = _get_window_size(self.dpy, window)
+		return self._window_size
+	
+	
+	def get_window_geometry(self, window):
+		self._check_queue()
+		if window != self._window:
+			return _get_window_geometry(self.dpy, window)
+		if self._window_geometry is None:
+			self._window_geometry = _get_window_geometry(self.dpy, window)
+		return self._window_geometry
@@ -34,6 +34,7 @@ class Macro(Action):
 		self._active = False
 		self._current = None
 		self._release = None
+		self._task = None
 		for p in parameters:
 			if type(p) == float and len(self.actions):
 				self.actions[-1].delay_after = p
@@ -63,26 +64,37 @@ class Macro(Action):
 			# Execute next action
 			self._release, self._current = self._current[0], self._current[1:]
 			self._release.button_press(mapper)
-			mapper.schedule(self.hold_time, self.timer)
+			self._task = mapper.schedule(self.hold_time, self.timer)
 		else:
 			# Finish execited action
 			self._release.button_release(mapper)
 			if len(self._current) == 0 and self.repeat and self._active:
 				# Repeating
 				self._current = [] + self.actions
-				mapper.schedule(self._release.delay_after, self.timer)
+				self._task = mapper.schedule(self._release.delay_after, self.timer)
 				self._release = None
 			elif len(self._current) == 0:
 				# Finished
 				self._current = None
 				self._release = None
+				self._task = None
 			else:
 				# Schedule for next action
-				mapper.schedule(self._release.delay_after, self.timer)
+				self._task = mapper.schedule(self._release.delay_after, self.timer)
 				self._release = None
 	
 	
 	def cancel(self, mapper):
+		# Stops macro in middle of execution, so next press starts it again
+		# from beginning
+		if self._task:
+			mapper.cancel_task(self._task)
+			self._task = None
+		if self._release is not None:
+			self._release.button_release(mapper)
+		self._active = False
+		self._current = None
+		self._release = None
 		for a in self.actions:
 			a.cancel(mapper)
 	
@@ -209,6 +221,12 @@ class Cycle(Macro):
 				self._current = 0
 	
 	
+	def cancel(self, mapper):
+		# Position in cycle is kept, there is nothing scheduled to reset
+		for a in self.actions:
+			a.cancel(mapper)
+	
+	
 	def describe(self, context):
 		if self.name: return self.name
 		return _("Cycle Actions")
@@ -329,6 +347,7 @@ class TapAction(PressAction):
 		PressAction.__init__(self, button)
 		self._lst = []
 		self._keep_pressed = False
+		self._task = None
 		self.button = button
 		self.count = count
 
@@ -394,7 +413,9 @@ class TapAction(PressAction):
 			ButtonAction._button_release(mapper, self.button)
 		if len(self._lst):
 			mapper.pressed[self.button] = self.COUNTER_VAL
-			mapper.schedule(self.PAUSE, self._rel_tap_press)
+			self._task = mapper.schedule(self.PAUSE, self._rel_tap_press)
+		else:
+			self._task = None
 	
 	
 	def button_release(self, mapper):
@@ -407,6 +428,17 @@ class TapAction(PressAction):
 				ButtonAction._button_release(mapper, self.button)
 	
 	
+	def cancel(self, mapper):
+		if self._task:
+			mapper.cancel_task(self._task)
+			self._task = None
+		if len(self._lst) or self._keep_pressed:
+			# Interrupted in middle of tapping or while keeping button pressed
+			mapper.pressed[self.button] = 1
+			ButtonAction._button_release(mapper, self.button)
+		self._lst, self._keep_pressed = [], False
+	
+	
 	def describe_short(self):
 		""" Used in macro editor """
 		if self.count <= 1:
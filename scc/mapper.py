@@ -8,15 +8,34 @@ from scc.constants import SCButtons, LEFT, RIGHT, CPAD, HapticPos
 from scc.constants import FE_STICK, FE_TRIGGER, FE_PAD, GYRO
 from scc.constants import STICK, STICKTILT, ControllerFlags
 from scc.aliases import ALL_AXES, ALL_BUTTONS
-from scc.actions import ButtonAction, GyroAbsAction
+from scc.actions import ButtonAction, GyroAbsAction, NoAction
 from scc.controller import HapticData
+from scc.gyro import GyroReport
 from scc.config import Config
 from scc.profile import Profile
+from scc.tracing import tracer
 
 
 import traceback, logging, time, os
 log = logging.getLogger("Mapper")
 
+# Maps index of bit to SCButtons member, used to dispatch changed buttons
+BUTTON_BY_BIT = { int(x).bit_length() - 1 : x for x in SCButtons }
+ALL_BUTTONS_MASK = sum(SCButtons)
+
+def copy_state(state, buttons=None):
+	"""
+	Returns copy of controller state, optionally with buttons replaced.
+	State may be namedtuple or ctypes structure.
+	"""
+	if hasattr(state, "_replace"):
+		return state if buttons is None else state._replace(buttons=buttons)
+	rv = type(state).from_buffer_copy(state)
+	if buttons is not None:
+		rv.buttons = buttons
+	return rv
+
+
 class Mapper(object):
 	DEBUG = False
 	
@@ -29,6 +48,7 @@ class Mapper(object):
 		Emulated gamepad will have rumble enabled only if poller is set to
 		instance and configuration allows it.
 		"""
+		self._profile = None
 		self.profile = profile
 		self.controller = None
 		self.xdisplay = None
@@ -58,6 +78,70 @@ class Mapper(object):
 		self.lpad_touched = False
 		self.state, self.old_state = None, None
 		self.force_event = set()
+		# Euler angles computed from last gyro input, shared by all actions
+		self.gyro_report = GyroReport()
+		# Set by daemon while input is being recorded, see scc.replay
+		self.recorder = None
+		# Set by daemon while sniffing is enabled, see scc.state_page
+		self.state_page = None
+		# Used when input rate is limited, see set_input_rate
+		self._input_interval = 0.0
+		self._next_tick = 0.0
+		self._pending = None			# newest state not yet processed
+		self._pending_controller = None
+		self._pending_down = 0			# buttons pressed in any stored state
+		self._pending_up = 0			# buttons released in any stored state
+		self._last_state = None			# last state passed to _tick
+		self._drain_task = None
+	
+	
+	def _get_profile(self):
+		return self._profile
+	
+	
+	def _set_profile(self, profile):
+		self._profile = profile
+		self.profile_changed()
+	
+	
+	profile = property(_get_profile, _set_profile)
+	
+	
+	def profile_changed(self):
+		"""
+		Marks dispatch table as outdated, so it's rebuilt before next input
+		is processed. Has to be called when actions in profile are replaced
+		in place, as it's done when input is locked or observed.
+		Assigning new profile calls this automatically.
+		"""
+		self._dispatch_valid = False
+	
+	
+	def _compile_profile(self):
+		"""
+		Builds dispatch table from current profile. For buttons, it maps bit
+		index to bound action; for everything else, it stores action or None
+		if NoAction is bound, so input can skip it completly.
+		"""
+		# Set before reading profile, so change done in meanwhile
+		# from another thread is not lost
+		self._dispatch_valid = True
+		p = self._profile
+		noaction = NoAction()
+		self._button_actions = [ None ] * ALL_BUTTONS_MASK.bit_length()
+		self._button_mask = 0
+		for x in p.buttons:
+			if p.buttons[x] is not noaction:
+				self._button_actions[int(x).bit_length() - 1] = p.buttons[x]
+				self._button_mask |= x
+		bound = lambda a: None if a is noaction else a
+		self._stick_action = bound(p.stick)
+		self._gyro_action = bound(p.gyro)
+		self._trigger_actions = (
+			bound(p.triggers.get(LEFT, noaction)),
+			bound(p.triggers.get(RIGHT, noaction))
+		)
+		self._pad_actions = { x : bound(p.pads[x]) for x in p.pads }
 	
 	
 	def create_gamepad(self, enabled, poller):
@@ -124,15 +208,25 @@ class Mapper(object):
 	
 	
 	def sync(self):
-		""" Syncs generated events """
+		"""
+		Syncs generated events and sends them out, using single write
+		for every emulated device.
+		"""
 		if len(self.syn_list):
 			for dev in self.syn_list:
 				dev.synEvent()
 			self.syn_list = set()
+		if self.gamepad.flush() | self.mouse.flush() | self.keyboard.flush():
+			tracer.mark(self.controller, "syn")
 	
 	
 	def set_controller(self, c):
 		""" Sets controller device, used by some (one so far) actions """
+		if c is not self.controller:
+			# Input stored for previous controller is thrown away
+			if self._drain_task is not None:
+				self.scheduler.cancel_task(self._drain_task)
+			self._drain_task, self._pending, self._last_state = None, None, None
 		self.controller = c
 	
 	
@@ -171,8 +265,10 @@ class Mapper(object):
 		Schedules callback to be ran no sooner than after delay.
 		Delay is float number in seconds.
 		Callback is called with mapper as only argument.
+		
+		Task is owned by mapper and so it's dropped by cancel_all.
 		"""
-		return self.scheduler.schedule(delay, cb, self)
+		return self.scheduler.schedule(delay, cb, self, owner=self)
 	
 	
 	def cancel_task(self, task):
@@ -283,9 +379,9 @@ class Mapper(object):
 		Gets button that was pressed by very last handled event or None,
 		if last event doesn't involved button pressing.
 		"""
-		for x in SCButtons:
-			if x & self.buttons & ~self.old_buttons:
-				return x
+		pressed = self.buttons & ~self.old_buttons & ALL_BUTTONS_MASK
+		if pressed:
+			return BUTTON_BY_BIT[pressed.bit_length() - 1]
 		return None
 	
 	
@@ -339,10 +435,12 @@ class Mapper(object):
 	def cancel_all(self):
 		"""
 		Called when profile is changed to let all actions to cancel
-		long-running effects they may have created
+		long-running effects they may have created.
+		Drops all tasks scheduled using mapper.schedule as well.
 		"""
 		for a in self.profile.get_actions():
 			a.cancel(self)
+		self.scheduler.cancel_owned(self)
 	
 	
 	def reset_gyros(self):
@@ -351,7 +449,85 @@ class Mapper(object):
 				a.reset()
 	
 	
+	def set_input_rate(self, rate):
+		"""
+		Limits how many times per second is input processed. States received
+		faster than that are merged together, see _coalesce.
+		0 disables limit.
+		"""
+		self._input_interval = 1.0 / rate if rate > 0 else 0.0
+	
+	
 	def input(self, controller, old_state, state):
+		"""
+		Called by driver for every input report. 'state' may be overwritten
+		once this method returns.
+		"""
+		if self.state_page is not None:
+			self.state_page.update(controller, state)
+		if self._input_interval:
+			self._coalesce(controller, old_state, state)
+		else:
+			self._tick(controller, old_state, state)
+	
+	
+	def _coalesce(self, controller, old_state, state):
+		"""
+		Used instead of processing input right away when input rate is
+		limited. If last tick was too recently, state is only stored and
+		processed later by _drain.
+		"""
+		state = copy_state(state)
+		if self._pending is None:
+			now = time.time()
+			if now >= self._next_tick:
+				self._next_tick = now + self._input_interval
+				old_state = self._last_state or copy_state(old_state)
+				self._last_state = state
+				self._tick(controller, old_state, state)
+				return
+			self._drain_task = self.scheduler.schedule(self._next_tick - now, self._drain)
+			self._pending_down, self._pending_up = 0, 0
+		self._pending = state
+		self._pending_controller = controller
+		self._pending_down |= state.buttons
+		self._pending_up |= ~state.buttons
+	
+	
+	def _drain(self):
+		"""
+		Processes newest stored state. Analog values are simply taken from
+		it, but buttons are adjusted so every press and release that
+		happened since last tick is seen by actions. Edge that can't be
+		sent in this tick (button pressed and released again) is kept
+		for next one.
+		"""
+		state, self._pending = self._pending, None
+		self._drain_task = None
+		if state is None:
+			return
+		controller = self._pending_controller
+		last = self._last_state.buttons if self._last_state else 0
+		missed_press = self._pending_down & ~last & ~state.buttons
+		missed_release = self._pending_up & last & state.buttons
+		buttons = (state.buttons | missed_press) & ~missed_release
+		self._next_tick = time.time() + self._input_interval
+		if buttons != state.buttons:
+			self._pending = state
+			self._pending_down, self._pending_up = state.buttons, ~state.buttons
+			self._drain_task = self.scheduler.schedule(self._input_interval, self._drain)
+			state = copy_state(state, buttons)
+		old_state, self._last_state = self._last_state, state
+		self._tick(controller, old_state or state, state)
+	
+	
+	def _tick(self, controller, old_state, state):
+		tracer.mark(controller, "input")
+		if self.recorder is not None:
+			self.recorder.record(controller, state)
+		if not self._dispatch_valid:
+			self._compile_profile()
+		
 		# Store states
 		self.old_state = old_state
 		self.old_buttons = self.buttons
@@ -371,74 +547,84 @@ class Mapper(object):
 		btn_add = xor & self.buttons
 		
 		try:
-			if btn_add or btn_rem:
-				# At least one button was pressed
-				for x in self.profile.buttons:
-					if x & btn_add:
-						self.profile.buttons[x].button_press(self)
-					elif x & btn_rem:
-						self.profile.buttons[x].button_release(self)
-			
+			# Check buttons, going only over changed bits with action bound
+			changed = xor & self._button_mask
+			while changed:
+				bit = changed.bit_length() - 1
+				changed ^= 1 << bit
+				if btn_add & (1 << bit):
+					self._button_actions[bit].button_press(self)
+				else:
+					self._button_actions[bit].button_release(self)
 			
 			# Check stick
-			if self.controller.flags & ControllerFlags.SEPARATE_STICK:
+			stick = self._stick_action
+			if stick is None:
+				pass
+			elif self.controller.flags & ControllerFlags.SEPARATE_STICK:
 				if FE_STICK in fe or self.old_state.stick_x != state.stick_x or self.old_state.stick_y != state.stick_y:
-					self.profile.stick.whole(self, state.stick_x, state.stick_y, STICK)
+					stick.whole(self, state.stick_x, state.stick_y, STICK)
 			elif not self.buttons & SCButtons.LPADTOUCH:
 				if FE_STICK in fe or self.old_state.lpad_x != state.lpad_x or self.old_state.lpad_y != state.lpad_y:
-					self.profile.stick.whole(self, state.lpad_x, state.lpad_y, STICK)
+					stick.whole(self, state.lpad_x, state.lpad_y, STICK)
 			
 			# Check gyro
-			if controller.get_gyro_enabled():
-				self.profile.gyro.gyro(self, state.gpitch, state.gyaw, state.groll, state.q1, state.q2, state.q3, state.q4)
+			if self._gyro_action is not None and controller.get_gyro_enabled():
+				self._gyro_action.gyro(self, state.gpitch, state.gyaw, state.groll, state.q1, state.q2, state.q3, state.q4)
 			
 			# Check triggers
-			if FE_TRIGGER in fe or state.ltrig != self.old_state.ltrig:
-				if LEFT in self.profile.triggers:
-					self.profile.triggers[LEFT].trigger(self, state.ltrig, self.old_state.ltrig)
-			if FE_TRIGGER in fe or state.rtrig != self.old_state.rtrig:
-				if RIGHT in self.profile.triggers:
-					self.profile.triggers[RIGHT].trigger(self, state.rtrig, self.old_state.rtrig)
+			ltrig, rtrig = self._trigger_actions
+			if ltrig is not None and (FE_TRIGGER in fe or state.ltrig != self.old_state.ltrig):
+				ltrig.trigger(self, state.ltrig, self.old_state.ltrig)
+			if rtrig is not None and (FE_TRIGGER in fe or state.rtrig != self.old_state.rtrig):
+				rtrig.trigger(self, state.rtrig, self.old_state.rtrig)
 			
 			# Check pads
 			# RPAD
-			if controller.flags & ControllerFlags.HAS_RSTICK:
+			rpad = self._pad_actions.get(RIGHT)
+			if rpad is None:
+				pass
+			elif controller.flags & ControllerFlags.HAS_RSTICK:
 				if FE_PAD in fe or self.old_state.rpad_x != state.rpad_x or self.old_state.rpad_y != state.rpad_y:
-					self.profile.pads[RIGHT].whole(self, state.rpad_x, state.rpad_y, RIGHT)
+					rpad.whole(self, state.rpad_x, state.rpad_y, RIGHT)
 			elif FE_PAD in fe or self.buttons & SCButtons.RPADTOUCH or SCButtons.RPADTOUCH & btn_rem:
-				self.profile.pads[RIGHT].whole(self, state.rpad_x, state.rpad_y, RIGHT)
+				rpad.whole(self, state.rpad_x, state.rpad_y, RIGHT)
 			
 			# LPAD
+			lpad = self._pad_actions.get(LEFT)
 			if self.controller.flags & ControllerFlags.SEPARATE_STICK:
-				if FE_PAD in fe or self.old_state.lpad_x != state.lpad_x or self.old_state.lpad_y != state.lpad_y:
-					self.profile.pads[LEFT].whole(self, state.lpad_x, state.lpad_y, LEFT)
+				if lpad is not None and (FE_PAD in fe or self.old_state.lpad_x != state.lpad_x or self.old_state.lpad_y != state.lpad_y):
+					lpad.whole(self, state.lpad_x, state.lpad_y, LEFT)
 			else:
 				if self.buttons & SCButtons.LPADTOUCH:
 					# Pad is being touched now
 					if not self.lpad_touched:
 						self.lpad_touched = True
-					self.profile.pads[LEFT].whole(self, state.lpad_x, state.lpad_y, LEFT)
-					if self.old_state.buttons & STICKTILT and not self.buttons & STICKTILT:
+					if lpad is not None:
+						lpad.whole(self, state.lpad_x, state.lpad_y, LEFT)
+					if stick is not None and self.old_state.buttons & STICKTILT and not self.buttons & STICKTILT:
 						# LPAD and stick share axes and so when they are used simultaneously (by someone with 3 hands or so :)
 						# this is how mapper can tell that stick was recentered
-						self.profile.stick.whole(self, 0, 0, STICK)
+						stick.whole(self, 0, 0, STICK)
 				elif not self.buttons & STICKTILT:
 					# Pad is not being touched
 					if self.lpad_touched:
 						self.lpad_touched = False
-						self.profile.pads[LEFT].whole(self, 0, 0, LEFT)
+						if lpad is not None:
+							lpad.whole(self, 0, 0, LEFT)
 					
 			# CPAD (touchpad on DS4 controller)
-			if controller.flags & ControllerFlags.HAS_CPAD:
+			cpad = self._pad_actions.get(CPAD)
+			if cpad is not None and controller.flags & ControllerFlags.HAS_CPAD:
 				if ((FE_PAD in fe)
 						or (self.old_state.cpad_x != state.cpad_x)
 						or (self.old_state.cpad_y != state.cpad_y)
 						or ((self.old_buttons & SCButtons.CPADTOUCH) and not (self.buttons & SCButtons.CPADTOUCH))
 					):
 					if self.buttons & SCButtons.CPADTOUCH:
-						self.profile.pads[CPAD].whole(self, state.cpad_x, state.cpad_y, CPAD)
+						cpad.whole(self, state.cpad_x, state.cpad_y, CPAD)
 					elif self.old_buttons & SCButtons.CPADTOUCH:
-						self.profile.pads[CPAD].whole(self, 0, 0, CPAD)
+						cpad.whole(self, 0, 0, CPAD)
 		except Exception:
 			# Log error but don't crash here, it breaks too many things at once
 			if hasattr(self, "_testing"):
@@ -450,6 +636,7 @@ class Mapper(object):
 		self.scheduler.run()
 		self.generate_events()
 		self.generate_feedback()
+		tracer.done()
 	
 	
 	def generate_events(self):
@@ -0,0 +1,643 @@
+#!/usr/bin/env python3
+"""
+SC-Controller - Mapper Worker
+
+Optional mode, enabled by 'mapper_workers' option, in which every mapper
+runs in its own process, so input from multiple controllers is processed
+by multiple CPU cores.
+
+WorkerMapper stays in daemon and controller driver passes input to it as
+to any other mapper, but state is only copied into ring buffer shared with
+worker process. Worker owns uinput devices, scheduler and its own copy
+of profile and does all the processing.
+
+Daemon keeps its copy of profile as well. When daemon replaces action in
+it (input is locked or observed by client, gesture is being recognized),
+that input is processed by daemon and removed from worker's profile.
+Events generated in daemon, by such actions or by menu items selected in
+OSD, are forwarded to uinput devices owned by worker. Special actions
+executed in worker are sent back and executed by daemon.
+
+Usage of worker process: python3 -m scc.mapper_worker control_fd ring_fd eventfd
+"""
+from scc.lib import xwrappers as X
+from scc.constants import SCButtons, LEFT, RIGHT
+from scc.uinput import CannotCreateUInputException
+from scc.tools import init_logging
+from scc.parser import TalkingActionParser
+from scc.controller import Controller
+from scc.actions import Action, NoAction
+from scc.scheduler import Scheduler
+from scc.profile import Profile
+from scc.poller import Poller
+from scc.mapper import Mapper
+from collections import namedtuple, deque
+
+import os, sys, mmap, time, socket, struct, pickle, logging, subprocess
+log = logging.getLogger("MWorker")
+
+STATE_FIELDS = ( "buttons", "ltrig", "rtrig", "stick_x", "stick_y",
+	"lpad_x", "lpad_y", "rpad_x", "rpad_y", "gpitch", "groll", "gyaw",
+	"q1", "q2", "q3", "q4", "cpad_x", "cpad_y" )
+ControllerState = namedtuple("ControllerState", STATE_FIELDS)
+# Flags, buttons and everything else from STATE_FIELDS
+STATE = struct.Struct("<II" + "i" * (len(STATE_FIELDS) - 1))
+FLAG_GYRO_ENABLED = 1 << 0
+
+MAX_MESSAGE = 65536
+# Messages that describe state of worker. Last one of each is sent again,
+# in this order, to worker started after previous one died.
+STATE_MESSAGES = ( "init", "controller", "xdisplay", "profile", "overlay", "input_rate" )
+# Worker that died more than MAX_RESTARTS times in RESTART_PERIOD seconds
+# is not started again
+MAX_RESTARTS = 3
+RESTART_PERIOD = 60.0
+
+
+def get_sources(profile):
+	""" Returns dict of every input in profile and action assigned to it """
+	rv = { ("stick",) : profile.stick, ("gyro",) : profile.gyro }
+	for name in ("buttons", "triggers", "pads"):
+		for x, action in getattr(profile, name).items():
+			rv[name, x] = action
+	return rv
+
+
+def set_source(profile, source, action):
+	""" Assigns action to input identified by key returned by get_sources """
+	if len(source) == 1:
+		setattr(profile, source[0], action)
+	else:
+		getattr(profile, source[0])[source[1]] = action
+
+
+class Ring(object):
+	"""
+	Ring buffer of STATE records in shared memory, written by daemon and
+	read by worker.
+	Header holds number of records ever written (head) and read (tail).
+	
+	There are no memory barriers available from Python, so writer signals
+	eventfd after every stored record and reader takes only as many
+	records as was signaled. Syscalls on both sides order memory accesses,
+	so reader never sees head moved before record itself is written.
+	"""
+	SIZE = 256
+	HEADER = struct.Struct("<QQ")
+	
+	def __init__(self, fd=None):
+		size = Ring.HEADER.size + STATE.size * Ring.SIZE
+		if fd is None:
+			fd = os.memfd_create("scc-mapper-ring")
+			os.ftruncate(fd, size)
+		self.fd = fd
+		self._mem = mmap.mmap(fd, size)
+		self._dropped = 0
+	
+	
+	def push(self, flags, state):
+		"""
+		Stores state. Returns True if state was stored and reader should
+		be signaled or False if ring is full and state was dropped.
+		"""
+		mem = self._mem
+		head, tail = Ring.HEADER.unpack_from(mem, 0)
+		if head - tail >= Ring.SIZE:
+			if self._dropped == 0:
+				log.warning("Mapper worker is not reading input, dropping states")
+			self._dropped += 1
+			return False
+		STATE.pack_into(mem, Ring.HEADER.size + (head % Ring.SIZE) * STATE.size,
+			flags, *( getattr(state, x, 0) for x in STATE_FIELDS ))
+		struct.pack_into("<Q", mem, 0, head + 1)
+		return True
+	
+	
+	def pop(self):
+		""" Returns (flags, ControllerState) tuple or None if ring is empty """
+		mem = self._mem
+		head, tail = Ring.HEADER.unpack_from(mem, 0)
+		if tail == head:
+			return None
+		record = STATE.unpack_from(mem, Ring.HEADER.size + (tail % Ring.SIZE) * STATE.size)
+		struct.pack_into("<Q", mem, 8, tail + 1)
+		return record[0], ControllerState(*record[1:])
+
+
+class ActionRef(object):
+	""" Stands for action passed as argument of special action """
+	def __init__(self, action):
+		self.string = action.to_string()
+
+
+class RemoteDevice(object):
+	"""
+	Stands for uinput device owned by worker. Calls are queued and sent to
+	worker when mapper flushes devices.
+	"""
+	def __init__(self, mapper, name):
+		self._mapper = mapper
+		self._name = name
+	
+	
+	def _forward(method):
+		def fn(self, *a):
+			self._mapper._events.append(( self._name, method, a ))
+		return fn
+	
+	keyEvent = _forward("keyEvent")
+	axisEvent = _forward("axisEvent")
+	relEvent = _forward("relEvent")
+	scanEvent = _forward("scanEvent")
+	synEvent = _forward("synEvent")
+	moveEvent = _forward("moveEvent")
+	scrollEvent = _forward("scrollEvent")
+	pressEvent = _forward("pressEvent")
+	releaseEvent = _forward("releaseEvent")
+	reset = _forward("reset")
+	
+	
+	def flush(self):
+		return self._mapper._flush_events()
+
+
+class WorkerMapper(Mapper):
+	"""
+	Mapper that does its work in another process. Has same interface as
+	Mapper, so daemon can use it in same way.
+	"""
+	
+	def __init__(self, profile, scheduler, keyboard=b"SCController Keyboard",
+				mouse=b"SCController Mouse", gamepad=True, poller=None):
+		self._events = []
+		self._overlay = set()
+		self._sent = {}
+		self._gamepad_name = None
+		self._parser = TalkingActionParser()
+		self._ring = Ring()
+		self._outbox = deque()
+		self._poller = poller
+		self._pollout = False
+		self._wakeup = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+		self._state = {}
+		self._restarts = deque()
+		self.on_error = None
+		self._start_worker()
+		self._send("init", keyboard, mouse, gamepad, logging.getLogger().level)
+		
+		Mapper.__init__(self, profile, scheduler, keyboard=None, mouse=None,
+				gamepad=False, poller=poller)
+		self.keyboard = RemoteDevice(self, "keyboard")
+		self.mouse = RemoteDevice(self, "mouse")
+		self.gamepad = RemoteDevice(self, "gamepad")
+	
+	
+	def _start_worker(self):
+		self._socket, worker_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+		self._socket.setblocking(False)
+		self._pollout = False
+		self._poller.register(self._socket.fileno(), self._poller.POLLIN, self._on_socket)
+		
+		env = dict(os.environ)
+		path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+		env["PYTHONPATH"] = os.pathsep.join([ path ] + [ x for x in
+			env.get("PYTHONPATH", "").split(os.pathsep) if x ])
+		fds = ( worker_socket.fileno(), self._ring.fd, self._wakeup )
+		self._process = subprocess.Popen([ sys.executable, "-m", "scc.mapper_worker" ]
+			+ [ str(x) for x in fds ], pass_fds=fds, env=env)
+		worker_socket.close()
+	
+	
+	def _on_worker_died(self):
+		"""
+		Reaps dead worker process and starts new one, unless it keeps dying.
+		Input received until new worker is ready waits in ring.
+		"""
+		self._poller.unregister(self._socket.fileno())
+		self._outbox.clear()
+		self._socket.close()
+		self._socket = None
+		try:
+			code = self._process.wait(1.0)
+		except subprocess.TimeoutExpired:
+			# Closed socket but didn't exit
+			self._process.kill()
+			code = self._process.wait()
+		
+		now = time.time()
+		while self._restarts and self._restarts[0] < now - RESTART_PERIOD:
+			self._restarts.popleft()
+		if len(self._restarts) >= MAX_RESTARTS:
+			log.error("Mapper worker died with exit code %s, not restarting", code)
+			self._report_error("mapper_worker",
+				"Mapper worker keeps crashing, input from controller is not processed")
+			return
+		log.error("Mapper worker died with exit code %s, restarting", code)
+		self._restarts.append(now)
+		self._start_worker()
+		for name in STATE_MESSAGES:
+			if name in self._state:
+				self._queue_message(self._state[name])
+	
+	
+	def _report_error(self, id, error):
+		if self.on_error:
+			self.on_error(id, error)
+		else:
+			log.error(error)
+	
+	
+	def _send(self, *message):
+		"""
+		Sends message to worker, after events generated so far.
+		If worker is not reading fast enough, message is queued and sent
+		once socket becomes writable, so mainloop is never blocked.
+		"""
+		self._flush_events()
+		if message[0] in STATE_MESSAGES:
+			self._state[message[0]] = message
+		self._queue_message(message)
+	
+	
+	def _queue_message(self, message):
+		if self._socket is None:
+			# Worker is gone for good
+			return
+		self._outbox.append(pickle.dumps(message))
+		if len(self._outbox) == 1:
+			self._flush_outbox()
+	
+	
+	def _flush_outbox(self):
+		while self._outbox:
+			try:
+				self._socket.send(self._outbox[0])
+			except (BlockingIOError, InterruptedError):
+				self._set_pollout(True)
+				return
+			except OSError as e:
+				log.error("Failed to communicate with mapper worker: %s", e)
+				self._outbox.clear()
+				return
+			self._outbox.popleft()
+		self._set_pollout(False)
+	
+	
+	def _set_pollout(self, pollout):
+		if pollout != self._pollout:
+			self._pollout = pollout
+			events = self._poller.POLLIN
+			if pollout:
+				events |= self._poller.POLLOUT
+			self._poller.register(self._socket.fileno(), events, self._on_socket)
+	
+	
+	def _flush_events(self):
+		if not self._events:
+			return False
+		events, self._events = self._events, []
+		self._send("events", events)
+		return True
+	
+	
+	def _on_socket(self, fd, event):
+		if event == self._poller.POLLOUT:
+			return self._flush_outbox()
+		try:
+			data = self._socket.recv(MAX_MESSAGE)
+		except (BlockingIOError, InterruptedError):
+			return
+		except OSError:
+			data = b""
+		if not data:
+			return self._on_worker_died()
+		message = pickle.loads(data)
+		if message[0] == "feedback":
+			if self.controller:
+				self.controller.feedback(message[1])
+		elif message[0] == "gamepad":
+			self._gamepad_name = message[1]
+		elif message[0] == "error":
+			self._report_error(*message[1:])
+		elif message[0] == "sa":
+			name, actionstr, osd_enabled, args = message[1:]
+			try:
+				action = self._parser.restart(actionstr).parse()
+			except Exception as e:
+				log.error("Failed to parse action from worker: %s", e)
+				return
+			# Set by modifier which is not part of action itself
+			action.osd_enabled = osd_enabled
+			args = [ self._parser.restart(x.string).parse()
+				if isinstance(x, ActionRef) else x for x in args ]
+			action.execute_named(name, self, *args)
+	
+	
+	def _get_profile(self):
+		return self._profile
+	
+	
+	def _set_profile(self, profile):
+		self._profile = profile
+		self._sent = get_sources(profile)
+		self._overlay = set()
+		self._send("profile", profile.get_filename())
+		Mapper.profile_changed(self)
+	
+	
+	profile = property(_get_profile, _set_profile)
+	
+	
+	def profile_changed(self):
+		"""
+		Inputs with actions replaced since profile was sent to worker are
+		processed here and disabled in worker.
+		"""
+		Mapper.profile_changed(self)
+		current = get_sources(self._profile)
+		overlay = { x for x in current if current[x] is not self._sent.get(x) }
+		if overlay != self._overlay:
+			self._overlay = overlay
+			self._send("overlay", overlay)
+	
+	
+	def _compile_profile(self):
+		Mapper._compile_profile(self)
+		overlay = self._overlay
+		for x in SCButtons:
+			if ("buttons", x) not in overlay and self._button_mask & x:
+				self._button_actions[int(x).bit_length() - 1] = None
+				self._button_mask &= ~x
+		if ("stick",) not in overlay:
+			self._stick_action = None
+		if ("gyro",) not in overlay:
+			self._gyro_action = None
+		self._trigger_actions = tuple(
+			a if ("triggers", x) in overlay else None
+			for (x, a) in zip(( LEFT, RIGHT ), self._trigger_actions) )
+		self._pad_actions = { x : a for (x, a) in self._pad_actions.items()
+			if ("pads", x) in overlay }
+	
+	
+	def input(self, controller, old_state, state):
+		if self.state_page is not None:
+			self.state_page.update(controller, state)
+		flags = FLAG_GYRO_ENABLED if controller.get_gyro_enabled() else 0
+		if self._ring.push(flags, state):
+			try:
+				os.eventfd_write(self._wakeup, 1)
+			except OSError:
+				# Worker is dead, what is already reported
+				pass
+		if self._overlay:
+			self._tick(controller, old_state, state)
+		else:
+			self.state = state
+			if self.recorder is not None:
+				self.recorder.record(controller, state)
+	
+	
+	def set_input_rate(self, rate):
+		self._send("input_rate", rate)
+	
+	
+	def set_controller(self, c):
+		Mapper.set_controller(self, c)
+		self._send("controller", None if c is None else
+			( c.get_id(), c.get_type(), c.flags ))
+	
+	
+	def set_xdisplay(self, x):
+		Mapper.set_xdisplay(self, x)
+		self._send("xdisplay", x is not None)
+	
+	
+	def get_gamepad_name(self):
+		return self._gamepad_name
+	
+	
+	def cancel_all(self):
+		Mapper.cancel_all(self)
+		self._send("cancel_all")
+	
+	
+	def release_virtual_buttons(self):
+		Mapper.release_virtual_buttons(self)
+		self._send("release_virtual_buttons")
+	
+	
+	def reset_gyros(self):
+		Mapper.reset_gyros(self)
+		self._send("reset_gyros")
+
+
+class WorkerController(Controller):
+	""" Stands for controller handled by daemon """
+	
+	def __init__(self, worker, id, type, flags):
+		Controller.__init__(self)
+		self._worker = worker
+		self._id = id
+		self._type = type
+		self.flags = flags
+		self.gyro_enabled = False
+	
+	
+	def get_type(self):
+		return self._type
+	
+	
+	def get_gyro_enabled(self):
+		return self.gyro_enabled
+	
+	
+	def feedback(self, data):
+		self._worker.send("feedback", data)
+
+
+class SpecialActionsForwarder(object):
+	""" Used as special actions handler in worker """
+	
+	def __init__(self, worker):
+		self._worker = worker
+	
+	
+	def __getattr__(self, name):
+		if not name.startswith("on_sa_"):
+			raise AttributeError(name)
+		def forward(mapper, action, *args):
+			args = [ ActionRef(x) if isinstance(x, Action) else x for x in args ]
+			self._worker.send("sa", name[len("on_sa_"):], action.to_string(),
+				getattr(action, "osd_enabled", False), args)
+		return forward
+
+
+class Worker(object):
+	""" Runs in worker process """
+	
+	def __init__(self, control_fd, ring_fd, wakeup_fd):
+		self.socket = socket.socket(fileno=control_fd)
+		self.ring = Ring(ring_fd)
+		self.wakeup_fd = wakeup_fd
+		self.scheduler = Scheduler()
+		self.poller = Poller()
+		self.mapper = None
+		self.controller = None
+		self.xdisplay = None
+		self.geometry = None
+		self.sources = {}
+		self.overlay = set()
+		self.old_state = None
+		self.poller.register(self.socket.fileno(), self.poller.POLLIN, self.on_message)
+		self.poller.register(self.wakeup_fd, self.poller.POLLIN, self.on_wakeup)
+	
+	
+	def send(self, *message):
+		self.socket.send(pickle.dumps(message))
+	
+	
+	def run(self):
+		while True:
+			ready = self.poller.wait(self.scheduler.get_timeout())
+			self.scheduler.update_time()
+			self.poller.dispatch(ready)
+			if self.scheduler.run() and self.mapper:
+				self.mapper.generate_events()
+				self.mapper.generate_feedback()
+	
+	
+	def on_wakeup(self, fd, event):
+		try:
+			count = os.eventfd_read(fd)
+		except BlockingIOError:
+			return
+		# Profile or controller sent before state was pushed has to be
+		# used for it, so messages are processed first
+		self.on_message()
+		for i in range(count):
+			record = self.ring.pop()
+			if record is None:
+				break
+			flags, state = record
+			if self.controller and self.mapper:
+				self.controller.gyro_enabled = bool(flags & FLAG_GYRO_ENABLED)
+				self.mapper.input(self.controller, self.old_state or state, state)
+			self.old_state = state
+	
+	
+	def on_message(self, *a):
+		""" Processes all messages received from daemon """
+		while True:
+			try:
+				data = self.socket.recv(MAX_MESSAGE, socket.MSG_DONTWAIT)
+			except (BlockingIOError, InterruptedError):
+				return
+			if not data:
+				# Daemon exited
+				sys.exit(0)
+			message = pickle.loads(data)
+			getattr(self, "on_" + message[0])(*message[1:])
+	
+	
+	def on_init(self, keyboard, mouse, gamepad, level):
+		logging.getLogger().setLevel(level)
+		profile = Profile(TalkingActionParser())
+		try:
+			self.mapper = Mapper(profile, self.scheduler, keyboard=keyboard,
+				mouse=mouse, gamepad=gamepad, poller=self.poller)
+		except CannotCreateUInputException as e:
+			# Reported by daemon, same way as when it fails to create
+			# mapper by itself
+			log.exception(e)
+			self.send("error", "uinput", str(e))
+			self.mapper = Mapper(profile, self.scheduler, keyboard=None,
+				mouse=None, gamepad=False)
+		self.mapper.set_special_actions_handler(SpecialActionsForwarder(self))
+		self.send("gamepad", self.mapper.get_gamepad_name())
+	
+	
+	def on_controller(self, info):
+		self.controller = None if info is None else WorkerController(self, *info)
+		self.mapper.set_controller(self.controller)
+	
+	
+	def on_xdisplay(self, enabled):
+		# Daemon sends this for every set_xdisplay call, so already opened
+		# connection is reused
+		if enabled and self.xdisplay is None and "DISPLAY" in os.environ:
+			self.xdisplay = X.open_display(os.environ["DISPLAY"].encode("utf-8")) or None
+			if self.xdisplay:
+				self.geometry = X.watch_geometry(self.xdisplay)
+				self.poller.register(self.geometry.fileno(), self.poller.POLLIN,
+					self.geometry.process_events)
+		elif not enabled and self.xdisplay is not None:
+			xdisplay, self.xdisplay = self.xdisplay, None
+			self.mapper.set_xdisplay(None)
+			self.poller.unregister(self.geometry.fileno())
+			self.geometry = None
+			X.unwatch_geometry(xdisplay)
+			X.close_display(xdisplay)
+		self.mapper.set_xdisplay(self.xdisplay)
+	
+	
+	def on_profile(self, filename):
+		profile = Profile(TalkingActionParser())
+		if filename:
+			try:
+				profile.load(filename).compress()
+			except Exception as e:
+				log.error("Failed to load profile '%s': %s", filename, e)
+		self.sources = get_sources(profile)
+		self.overlay = set()
+		self.mapper.profile = profile
+	
+	
+	def on_overlay(self, overlay):
+		""" Inputs in 'overlay' are handled by daemon """
+		mapper = self.mapper
+		for source, action in self.sources.items():
+			if source in overlay:
+				if source not in self.overlay:
+					# Input may be in use right now
+					if source[0] == "buttons" and mapper.buttons & source[1]:
+						action.button_release(mapper)
+					elif source[0] == "pads":
+						action.whole(mapper, 0, 0, source[1])
+				action = NoAction()
+			set_source(mapper.profile, source, action)
+		self.overlay = overlay
+		mapper.profile_changed()
+		mapper.generate_events()
+	
+	
+	def on_events(self, events):
+		for device, method, args in events:
+			getattr(getattr(self.mapper, device), method)(*args)
+		self.mapper.sync()
+	
+	
+	def on_input_rate(self, rate):
+		self.mapper.set_input_rate(rate)
+	
+	
+	def on_cancel_all(self):
+		self.mapper.cancel_all()
+	
+	
+	def on_release_virtual_buttons(self):
+		self.mapper.release_virtual_buttons()
+		self.mapper.generate_events()
+	
+	
+	def on_reset_gyros(self):
+		self.mapper.reset_gyros()
+
+
+def main():
+	init_logging(suffix=" W")
+	control_fd, ring_fd, wakeup_fd = [ int(x) for x in sys.argv[1:4] ]
+	Worker(control_fd, ring_fd, wakeup_fd).run()
+
+
+if __name__ == "__main__":
+	main()
@@ -6,9 +6,8 @@ Container for list of menu items + required parsers
 """
 from __future__ import unicode_literals
 from scc.tools import _, set_logging_level
-from scc.actions import Action
 
-import json, os
+import json, os, importlib
 
 class MenuData(object):
 	""" Contains list of menu items. Indexable """
@@ -118,8 +117,8 @@ class MenuData(object):
 		used_ids = set()
 		for i in data:
 			item = None
-			if "generator" in i and i["generator"] in MENU_GENERATORS:
-				item = MENU_GENERATORS[i["generator"]](**i)
+			if "generator" in i and get_menu_generator(i["generator"]):
+				item = get_menu_generator(i["generator"])(**i)
 			elif "separator" in i:
 				item = Separator(i["name"] if "name" in i else None)
 			elif "submenu" in i:
@@ -143,7 +142,7 @@ class MenuData(object):
 				if "name" in i:
 					label = i["name"]
 				elif action:
-					label = action.describe(Action.AC_OSD)
+					label = action.describe(action.AC_OSD)
 				if "icon" in i:
 					icon = i["icon"]
 				item = MenuItem(id, label, action, icon=icon)
@@ -291,3 +290,21 @@ class MenuGenerator(object):
 
 # Holds dict of knowm menu ganerators, but generated elsewhere
 MENU_GENERATORS = { }
+
+# Generators defined in modules that are too expensive to import just in
+# case some menu uses them. Maps generator name to module which adds it
+# to MENU_GENERATORS when imported.
+LAZY_MENU_GENERATORS = {
+	"autoswitch"	: "scc.x11.autoswitcher",
+}
+
+
+def get_menu_generator(name):
+	"""
+	Returns menu generator class registered under given name,
+	importing module that defines it if needed. Returns None if there
+	is no such generator.
+	"""
+	if name not in MENU_GENERATORS and name in LAZY_MENU_GENERATORS:
+		importlib.import_module(LAZY_MENU_GENERATORS[name])
+	return MENU_GENERATORS.get(name)
@@ -288,6 +288,7 @@ class ClickModifier(Modifier):
 
 class TouchedModifier(Modifier):
 	COMMAND = "touched"
+	_release_task = None
 	
 	
 	def describe(self, context):
@@ -306,14 +307,27 @@ class TouchedModifier(Modifier):
 		return self
 	
 	
+	def _press(self, mapper):
+		self.action.button_press(mapper)
+		self._release_task = mapper.schedule(0.02, self._release)
+	
+	
 	def _release(self, mapper):
+		self._release_task = None
 		return self.action.button_release(mapper)
 	
 	
+	def cancel(self, mapper):
+		if self._release_task:
+			# Child action is still pressed
+			mapper.cancel_task(self._release_task)
+			self._release(mapper)
+		Modifier.cancel(self, mapper)
+	
+	
 	def whole(self, mapper, x, y, what):
 		if mapper.is_touched(what) and not mapper.was_touched(what):
-			self.action.button_press(mapper)
-			mapper.schedule(0.02, self._release)
+			self._press(mapper)
 
 
 class UntouchedModifier(TouchedModifier):
@@ -322,12 +336,12 @@ class UntouchedModifier(TouchedModifier):
 	
 	def whole(self, mapper, x, y, what):
 		if not mapper.is_touched(what) and mapper.was_touched(what):
-			self.action.button_press(mapper)
-			mapper.schedule(0.02, self._release)
+			self._press(mapper)
 
 
 class PressedModifier(Modifier):
 	COMMAND = "pressed"
+	_release_task = None
 	
 	
 	def describe(self, context):
@@ -346,15 +360,28 @@ class PressedModifier(Modifier):
 		return self
 	
 	
-	def button_press(self, mapper):
+	def _press(self, mapper):
 		self.action.button_press(mapper)
-		mapper.schedule(0.02, self._release)
+		self._release_task = mapper.schedule(0.02, self._release)
 	
 	
 	def _release(self, mapper):
+		self._release_task = None
 		return self.action.button_release(mapper)
 	
 	
+	def cancel(self, mapper):
+		if self._release_task:
+			# Child action is still pressed
+			mapper.cancel_task(self._release_task)
+			self._release(mapper)
+		Modifier.cancel(self, mapper)
+	
+	
+	def button_press(self, mapper):
+		self._press(mapper)
+	
+	
 	def button_release(self, mapper):
 		pass
 
@@ -374,8 +401,7 @@ class ReleasedModifier(PressedModifier):
 	
 	
 	def button_release(self, mapper):
-		self.action.button_press(mapper)
-		mapper.schedule(0.02, self._release)
+		self._press(mapper)
 
 
 class BallModifier(Modifier, WholeHapticAction):
@@ -727,7 +753,7 @@ class DeadzoneModifier(Modifier):
 		elif isinstance(self.action, GyroAbsAction):
 			# Another special case, GyroAbs has to handle deadzone
 			# only after math is finished
-			self.action._deadzone_fn = self._convert
+			self.action._deadzone = ( self.mode, self.lower, self.upper )
 			return self.action
 		return self
 	
@@ -805,6 +831,7 @@ class ModeModifier(Modifier):
 		self.old_action = None
 		self.shell_commands = {}
 		self.shell_timeout = 0.5
+		self.shell_task = None
 		self.timeout = DoubleclickModifier.DEAFAULT_TIMEOUT
 		
 		# ShellCommandAction cannot be imported normally, it would create
@@ -849,6 +876,18 @@ class ModeModifier(Modifier):
 				self.checks.append(( self.make_button_check(c), action ))
 	
 	
+	def __getstate__(self):
+		# Checks are closures, those can't be pickled
+		state = self.__dict__.copy()
+		del state['checks']
+		return state
+	
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self.make_checks()
+	
+	
 	def get_child_actions(self):
 		rv = list(self.mods.values()) + list(self.shell_commands.values())
 		if self.default is not None:
@@ -948,6 +987,11 @@ class ModeModifier(Modifier):
 	
 	
 	def cancel(self, mapper):
+		if self.shell_task:
+			# Profile changed while waiting for shell conditions
+			mapper.cancel_task(self.shell_task)
+			self.shell_task = None
+			self.kill_shell_commands()
 		for action in self.mods.values():
 			action.cancel(mapper)
 		self.default.cancel(mapper)
@@ -1005,7 +1049,7 @@ class ModeModifier(Modifier):
 			for c in self.shell_commands.values():
 				c.__proc = c.button_press(mapper)
 			self.shell_timeout = 0.5
-			mapper.schedule(0, self.check_shell_commands)
+			self.shell_task = mapper.schedule(0, self.check_shell_commands)
 			return
 		
 		sel = self.select(mapper)
@@ -1014,6 +1058,7 @@ class ModeModifier(Modifier):
 	
 	
 	def check_shell_commands(self, mapper):
+		self.shell_task = None
 		for c in self.shell_commands.values():
 			if c.__proc and c.__proc.poll() == 0:
 				sel = self.select(mapper)
@@ -1023,7 +1068,7 @@ class ModeModifier(Modifier):
 		
 		self.shell_timeout -= 0.05
 		if self.shell_timeout > 0:
-			mapper.schedule(0.05, self.check_shell_commands)
+			self.shell_task = mapper.schedule(0.05, self.check_shell_commands)
 		else:
 			# time is up, kill all processes and execute what's left
 			self.kill_shell_commands()
@@ -1121,6 +1166,7 @@ class DoubleclickModifier(Modifier, HapticEnabledAction):
 		self.actions = ( self.action, self.normalaction, self.holdaction )
 		self.timeout = time or DoubleclickModifier.DEAFAULT_TIMEOUT
 		self.waiting_task = None
+		self.release_task = None
 		self.pressed = False
 		self.active = None
 	
@@ -1239,8 +1285,7 @@ class DoubleclickModifier(Modifier, HapticEnabledAction):
 			mapper.cancel_task(self.waiting_task)
 			self.waiting_task = None
 			if self.normalaction:
-				self.normalaction.button_press(mapper)
-				mapper.schedule(0.02, self.normalaction.button_release)
+				self._short_click(mapper)
 		elif self.active:
 			# Released held button
 			self.active.button_release(mapper)
@@ -1258,8 +1303,32 @@ class DoubleclickModifier(Modifier, HapticEnabledAction):
 				self.active.button_press(mapper)
 			elif self.normalaction:
 				# User did short click and nothing else
-				self.normalaction.button_press(mapper)
-				mapper.schedule(0.02, self.normalaction.button_release)
+				self._short_click(mapper)
+	
+	
+	def _short_click(self, mapper):
+		self.normalaction.button_press(mapper)
+		self.release_task = mapper.schedule(0.02, self._short_click_release)
+	
+	
+	def _short_click_release(self, mapper):
+		self.release_task = None
+		self.normalaction.button_release(mapper)
+	
+	
+	def cancel(self, mapper):
+		if self.waiting_task:
+			mapper.cancel_task(self.waiting_task)
+			self.waiting_task = None
+		if self.release_task:
+			mapper.cancel_task(self.release_task)
+			self._short_click_release(mapper)
+		if self.active:
+			self.active.button_release(mapper)
+			self.active = None
+		self.pressed = False
+		for a in self.get_child_actions():
+			a.cancel(mapper)
 
 
 class HoldModifier(DoubleclickModifier):
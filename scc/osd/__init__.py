@@ -11,6 +11,7 @@ from gi.repository import Gtk, Gdk, GLib, GObject, GdkX11
 from scc.constants import STICK_PAD_MIN, STICK_PAD_MAX
 from scc.osd.timermanager import TimerManager
 from scc.paths import get_share_path
+from scc.startup_profile import startup_profile
 from scc.lib import xwrappers as X
 from scc.config import Config
 
@@ -36,10 +37,16 @@ class OSDWindow(Gtk.Window):
 	
 	EPILOG = ""
 	css_provider = None			# Used by staticmethods
+	css_key = None				# Style and colors css_provider was made for
+	layer_shell = None			# GtkLayerShell module, False if not available
 	
 	def __init__(self, wmclass):
 		Gtk.Window.__init__(self)
-		OSDWindow._apply_css(Config())
+		config = Config()
+		if OSDWindow.css_key != OSDWindow._get_css_key(config):
+			# Css is parsed only if it was not applied already for
+			# current colors, what matters in scc-osd-daemon
+			OSDWindow._apply_css(config)
 		
 		self.argparser = argparse.ArgumentParser(description=__doc__,
 			formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -52,16 +59,13 @@ class OSDWindow(Gtk.Window):
 		self.set_name(wmclass)
 		self.set_wmclass(wmclass, wmclass)
 		self.using_wlroots = False
-		try:
-			from gi.repository import GtkLayerShell
-			if GtkLayerShell.is_supported():
-				self.using_wlroots=True
-				GtkLayerShell.init_for_window(self)
-				GtkLayerShell.set_layer(self, GtkLayerShell.Layer.TOP)
-				GtkLayerShell.set_anchor(self, GtkLayerShell.Edge.LEFT, True)
-				GtkLayerShell.set_anchor(self, GtkLayerShell.Edge.BOTTOM, True)
-		except (ImportError):
-			pass
+		GtkLayerShell = OSDWindow._get_layer_shell()
+		if GtkLayerShell and GtkLayerShell.is_supported():
+			self.using_wlroots=True
+			GtkLayerShell.init_for_window(self)
+			GtkLayerShell.set_layer(self, GtkLayerShell.Layer.TOP)
+			GtkLayerShell.set_anchor(self, GtkLayerShell.Edge.LEFT, True)
+			GtkLayerShell.set_anchor(self, GtkLayerShell.Edge.BOTTOM, True)
 		if not self.using_wlroots:
 			self.set_decorated(False)
 			self.stick()
@@ -71,8 +75,32 @@ class OSDWindow(Gtk.Window):
 			self.set_type_hint(Gdk.WindowTypeHint.NOTIFICATION)
 	
 	
+	@staticmethod
+	def _get_layer_shell():
+		"""
+		Returns GtkLayerShell module or None if it's not available.
+		Looked up only once, so scc-osd-daemon doesn't search for
+		missing typelib every time new window is created.
+		"""
+		if OSDWindow.layer_shell is None:
+			try:
+				from gi.repository import GtkLayerShell
+				OSDWindow.layer_shell = GtkLayerShell
+			except (ImportError):
+				OSDWindow.layer_shell = False
+		return OSDWindow.layer_shell or None
+	
+	
+	@staticmethod
+	def _get_css_key(config):
+		return (config['osd_style'],
+			tuple(sorted(config['osd_colors'].items())),
+			tuple(sorted(config['osk_colors'].items())))
+	
+	
 	@staticmethod
 	def _apply_css(config):
+		OSDWindow.css_key = OSDWindow._get_css_key(config)
 		if OSDWindow.css_provider:
 			Gtk.StyleContext.remove_provider_for_screen(
 				Gdk.Screen.get_default(), OSDWindow.css_provider)
@@ -216,6 +244,7 @@ class OSDWindow(Gtk.Window):
 			y = Gdk.Screen.height() - self.get_allocated_height() + y + 1
 		
 		self.move(x, y)
+		startup_profile.watch_first_frame(self)
 		Gtk.Window.show(self)
 		self.make_window_clicktrough()
 	
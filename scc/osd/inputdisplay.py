@@ -1,12 +1,17 @@
 #!/usr/bin/env python2
 """
 SC-Controller - Input Display
+
+Reads controller state from state page (see scc.state_page) when daemon
+provides one and falls back to observing inputs over daemon socket otherwise.
 """
 from __future__ import unicode_literals
 from scc.tools import _, set_logging_level
 
 from gi.repository import Gtk, GLib
 from scc.constants import SCButtons, STICK, LEFT, RIGHT, STICK_PAD_MAX
+from scc.constants import ControllerFlags, STICKTILT
+from scc.state_page import StatePageReader, get_state_page_path
 from scc.gui.daemon_manager import DaemonManager
 from scc.gui.svg_widget import SVGWidget
 from scc.osd import OSDWindow
@@ -19,6 +24,9 @@ class InputDisplay(OSDWindow):
 	IMAGE = "inputdisplay.svg"
 	HILIGHT_COLOR = "#FF00FF00"		# ARGB
 	OBSERVE_COLOR = "#00007FFF"		# ARGB
+	POLL_INTERVAL = 16				# ms, used while reading from state page
+	BUTTONS = ( 'A', 'B', 'C', 'X', 'Y', 'START', 'BACK', 'LB', 'RB',
+		'LPAD', 'RPAD', 'LGRIP', 'RGRIP' )
 	
 	def __init__(self, imagepath="/usr/share/scc/images"):
 		OSDWindow.__init__(self, "osd-menu")
@@ -26,6 +34,10 @@ class InputDisplay(OSDWindow):
 		self.config = None
 		self.hilights = { self.HILIGHT_COLOR : set(), self.OBSERVE_COLOR : set() }
 		self.imagepath = imagepath
+		self.page = None
+		self._separate_stick = True
+		self._counter = None
+		self._timer = None
 		
 		self._eh_ids = []
 	
@@ -82,14 +94,64 @@ class InputDisplay(OSDWindow):
 	def on_daemon_connected(self, *a):
 		c = self.daemon.get_controllers()[0]
 		c.unlock_all()
-		c.observe(DaemonManager.nocallback, self.on_observe_failed,
-			'A', 'B', 'C', 'X', 'Y', 'START', 'BACK', 'LB', 'RB',
-			'LPAD', 'RPAD', 'LGRIP', 'RGRIP', 'LT', 'RT', 'LEFT',
-			'RIGHT', 'STICK', 'STICKPRESS')	
-		c.connect('event', self.on_daemon_event_observer)
+		self._separate_stick = bool(c.get_flags() & ControllerFlags.SEPARATE_STICK)
+		try:
+			self.page = StatePageReader(get_state_page_path(c.get_id()))
+		except (OSError, ValueError) as e:
+			log.debug("State page not available, observing inputs: %s", e)
+			c.observe(DaemonManager.nocallback, self.on_observe_failed,
+				*(self.BUTTONS + ('LT', 'RT', 'LEFT', 'RIGHT', 'STICK', 'STICKPRESS')))
+			c.connect('event', self.on_daemon_event_observer)
+		else:
+			if self._timer is None:
+				self._timer = GLib.timeout_add(self.POLL_INTERVAL, self.on_poll_page)
 		c.connect('lost', self.on_controller_lost)
 	
 	
+	def quit(self, code=-1):
+		if self._timer is not None:
+			GLib.source_remove(self._timer)
+			self._timer = None
+		if self.page is not None:
+			self.page.close()
+			self.page = None
+		OSDWindow.quit(self, code)
+	
+	
+	def on_poll_page(self):
+		rv = self.page.read()
+		if rv is None or rv[0] == self._counter:
+			# Nothing new was received since last check
+			return True
+		self._counter, flags, state = rv
+		buttons = state["buttons"]
+		self._set_position(RIGHT, state["rpad_x"], state["rpad_y"])
+		if self._separate_stick:
+			self._set_position(LEFT, state["lpad_x"], state["lpad_y"])
+			self._set_position(STICK, state["stick_x"], state["stick_y"])
+		else:
+			# Stick shares axes with left pad, same rules as in Mapper.input
+			# are used to tell which one is being used
+			if buttons & SCButtons.LPADTOUCH:
+				self._set_position(LEFT, state["lpad_x"], state["lpad_y"])
+				if not buttons & STICKTILT:
+					self._set_position(STICK, 0, 0)
+			else:
+				self._set_position(LEFT, 0, 0)
+				self._set_position(STICK, state["lpad_x"], state["lpad_y"])
+			if buttons & SCButtons.LPAD and not buttons & (SCButtons.LPADTOUCH | STICKTILT):
+				buttons = (buttons & ~SCButtons.LPAD) | SCButtons.STICKPRESS
+		hilights = set(self.hilights[self.OBSERVE_COLOR])
+		for what in self.BUTTONS:
+			self._set_pressed(what, buttons & getattr(SCButtons, what))
+		self._set_pressed("LEFT", state["ltrig"])
+		self._set_pressed("RIGHT", state["rtrig"])
+		self._set_pressed("STICK", buttons & SCButtons.STICKPRESS)
+		if hilights != self.hilights[self.OBSERVE_COLOR]:
+			self._update_background()
+		return True
+	
+	
 	def on_observe_failed(self, error):
 		log.error("Failed to enable test mode: %s", error)
 		if "Sniffing" in error:
@@ -102,52 +164,55 @@ class InputDisplay(OSDWindow):
 	
 	def on_daemon_event_observer(self, daemon, what, data):
 		if what in (LEFT, RIGHT, STICK):
-			widget, area = {
-				LEFT  : (self.lpadTest,  "LPADTEST"),
-				RIGHT : (self.rpadTest,  "RPADTEST"),
-				STICK : (self.stickTest, "STICKTEST"),
-			}[what]
-			# Check if stick or pad is released
-			if data[0] == data[1] == 0:
-				widget.hide()
-				return
-			if not widget.is_visible():
-				widget.show()
-			# Grab values
-			ax, ay, aw, trash = self.background.get_area_position(area)
-			cw = widget.get_allocation().width
-			# Compute center
-			x, y = ax + aw * 0.5 - cw * 0.5, ay + 1.0 - cw * 0.5
-			# Add pad position
-			x += data[0] * aw / STICK_PAD_MAX * 0.5
-			y -= data[1] * aw / STICK_PAD_MAX * 0.5
-			# Move circle
-			self.main_area.move(widget, x, y)
+			self._set_position(what, data[0], data[1])
 		elif what in ("LT", "RT", "STICKPRESS"):
 			what = {
 				"LT" : "LEFT",
 				"RT" : "RIGHT",
 				"STICKPRESS" : "STICK"
 			}[what]
-			if data[0]:
-				self.hilights[self.OBSERVE_COLOR].add(what)
-			else:
-				self.hilights[self.OBSERVE_COLOR].remove(what)
+			self._set_pressed(what, data[0])
 			self._update_background()
 		elif hasattr(SCButtons, what):
-			try:
-				if data[0]:
-					self.hilights[self.OBSERVE_COLOR].add(what)
-				else:
-					self.hilights[self.OBSERVE_COLOR].remove(what)
-				self._update_background()
-			except KeyError as e:
-				# Non fatal
-				pass
+			self._set_pressed(what, data[0])
+			self._update_background()
 		else:
 			print("event", what)
 	
 	
+	def _set_position(self, what, pos_x, pos_y):
+		""" Moves or hides cursor displayed over stick or pad """
+		widget, area = {
+			LEFT  : (self.lpadTest,  "LPADTEST"),
+			RIGHT : (self.rpadTest,  "RPADTEST"),
+			STICK : (self.stickTest, "STICKTEST"),
+		}[what]
+		# Check if stick or pad is released
+		if pos_x == pos_y == 0:
+			widget.hide()
+			return
+		if not widget.is_visible():
+			widget.show()
+		# Grab values
+		ax, ay, aw, trash = self.background.get_area_position(area)
+		cw = widget.get_allocation().width
+		# Compute center
+		x, y = ax + aw * 0.5 - cw * 0.5, ay + 1.0 - cw * 0.5
+		# Add pad position
+		x += pos_x * aw / STICK_PAD_MAX * 0.5
+		y -= pos_y * aw / STICK_PAD_MAX * 0.5
+		# Move circle
+		self.main_area.move(widget, x, y)
+	
+	
+	def _set_pressed(self, what, pressed):
+		""" Changes hilight of button. _update_background has to be called after """
+		if pressed:
+			self.hilights[self.OBSERVE_COLOR].add(what)
+		else:
+			self.hilights[self.OBSERVE_COLOR].discard(what)
+	
+	
 	def _update_background(self):
 		h = {}
 		for color in self.hilights:
@@ -23,9 +23,9 @@ from math import sqrt
 import os, sys, logging
 log = logging.getLogger("osd.menu")
 
-# Fill MENU_GENERATORS dict
+# Fill MENU_GENERATORS dict. Autoswitcher is imported only when its
+# generator is used, see LAZY_MENU_GENERATORS
 import scc.osd.menu_generators
-import scc.x11.autoswitcher
 
 
 class Menu(OSDWindow):
@@ -24,6 +24,29 @@ def get_config_path():
 	return os.path.join(confdir, "scc")
 
 
+def get_cache_path():
+	"""
+	Returns directory where cached data is stored.
+	~/.cache/scc under normal conditions.
+	"""
+	cachedir = os.path.expanduser("~/.cache")
+	if "XDG_CACHE_HOME" in os.environ:
+		cachedir = os.environ['XDG_CACHE_HOME']
+	return os.path.join(cachedir, "scc")
+
+
+def get_runtime_path():
+	"""
+	Returns directory for files that are rewritten often and don't have to
+	survive reboot, so they should be kept in memory.
+	$XDG_RUNTIME_DIR/scc under normal conditions, /dev/shm/scc-<uid>
+	if XDG_RUNTIME_DIR is not set.
+	"""
+	if "XDG_RUNTIME_DIR" in os.environ:
+		return os.path.join(os.environ['XDG_RUNTIME_DIR'], "scc")
+	return os.path.join("/dev/shm", "scc-%s" % (os.getuid(),))
+
+
 def get_profiles_path():
 	"""
 	Returns directory where profiles are stored.
@@ -2,13 +2,17 @@
 """
 SC-Controller - Poller
 
-Uses select to pool for file descriptors. Driver classes can use
+Uses epoll to pool for file descriptors. Driver classes can use
 daemon.get_poller().register and .unregister to add file descriptors and
 register callbacks to be called when data is available in them.
 
 Callback is called as callback(fd, event) where event is one of select.POLL*
+
+Poller is used as core of daemon's event loop. poll() blocks until there is
+data available on any registered descriptor, timeout passes or wakeup() is
+called from another thread.
 """
-import select, logging
+import os, fcntl, select, logging
 log = logging.getLogger("Poller")
 
 
@@ -18,41 +22,98 @@ class Poller(object):
 	POLLIN = select.POLLIN
 	POLLOUT = select.POLLOUT
 	POLLPRI = select.POLLPRI
+	# Errors and hangups are reported as POLLIN, so reader gets chance to
+	# notice that descriptor is dead. That's how select-based poller worked.
+	_IN_MASK = select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP
 	
 	def __init__(self):
 		self._events = {}
 		self._callbacks = {}
-		self._pool_in = ()
-		self._pool_out = ()
-		self._pool_pri = ()
+		self._epoll = select.epoll()
+		self._wakeup_r, self._wakeup_w = os.pipe()
+		for fd in (self._wakeup_r, self._wakeup_w):
+			fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+			fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+		self.register(self._wakeup_r, Poller.POLLIN, self._on_wakeup)
 	
 	
 	def register(self, fd, events, callback):
 		if fd < 0:
 			raise ValueError("Invalid file descriptor")
+		if fd in self._events:
+			self._epoll.modify(fd, events)
+		else:
+			self._epoll.register(fd, events)
 		self._events[fd] = events
 		self._callbacks[fd] = callback
-		self._generate_lists()
 	
 	
 	def unregister(self, fd):
-		if fd in self._events: del self._events[fd]
+		if fd in self._events:
+			del self._events[fd]
+			try:
+				self._epoll.unregister(fd)
+			except (OSError, IOError, ValueError):
+				# Descriptor was already closed, epoll forgot about it on its own
+				pass
 		if fd in self._callbacks: del self._callbacks[fd]
-		self._generate_lists()
 	
 	
-	def _generate_lists(self):
-		self._pool_in = [ fd for fd, events in self._events.items() if events & Poller.POLLIN ]
-		self._pool_out = [ fd for fd, events in self._events.items() if events & Poller.POLLOUT ]
-		self._pool_pri = [ fd for fd, events in self._events.items() if events & Poller.POLLPRI ]
+	def wakeup(self):
+		"""
+		Interrupts poll() that is (or will be) blocking in another thread.
+		Safe to be called from any thread.
+		"""
+		try:
+			os.write(self._wakeup_w, b"\x00")
+		except OSError:
+			# Pipe is full, what means that poll() will wake up anyway
+			pass
+	
+	
+	def _on_wakeup(self, fd, event):
+		try:
+			while os.read(fd, 1024): pass
+		except OSError:
+			# EAGAIN, pipe is empty
+			pass
+	
+	
+	def wait(self, timeout=0.01):
+		"""
+		Waits up to 'timeout' seconds for any registered descriptor to become
+		ready, without calling any callbacks.
+		If timeout is None, waits until something happens.
+		
+		Returns list to be passed to dispatch().
+		"""
+		try:
+			return self._epoll.poll(-1 if timeout is None else max(0, timeout))
+		except InterruptedError:
+			return []
+	
+	
+	def dispatch(self, ready):
+		"""
+		Calls callbacks for descriptors returned by wait().
+		Returns number of descriptors that were ready.
+		"""
+		for fd, events in ready:
+			if events & Poller._IN_MASK:
+				self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLIN)
+			if events & select.EPOLLOUT:
+				self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLOUT)
+			if events & select.EPOLLPRI:
+				self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLPRI)
+		return len(ready)
 	
 	
 	def poll(self, timeout=0.01):
-		inn, out, pri = select.select( self._pool_in, self._pool_out, self._pool_pri, timeout )
+		"""
+		Waits up to 'timeout' seconds for any registered descriptor to become
+		ready and calls assigned callbacks.
+		If timeout is None, waits until something happens.
 		
-		for fd in inn:
-			self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLIN)
-		for fd in out:
-			self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLOUT)
-		for fd in pri:
-			self._callbacks.get(fd, DO_NOTHING)(fd, Poller.POLLPRI)
+		Returns number of descriptors that were ready.
+		"""
+		return self.dispatch(self.wait(timeout))
@@ -12,6 +12,7 @@ from scc.special_actions import MenuAction
 from scc.modifiers import HoldModifier
 from scc.lib.jsonencoder import JSONEncoder
 from scc.parser import TalkingActionParser
+from scc.profile_cache import profile_cache
 from scc.menu_data import MenuData
 from scc.actions import NoAction
 
@@ -84,8 +85,10 @@ class Profile(object):
 	
 	def load(self, filename):
 		""" Loads profile from file. Returns self """
-		fileobj = open(filename, "r")
-		self.load_fileobj(fileobj)
+		if not profile_cache.load(self, filename):
+			with open(filename, "r") as fileobj:
+				self.load_fileobj(fileobj)
+			profile_cache.save(self, filename)
 		self.filename = filename
 		return self
 	
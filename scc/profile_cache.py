@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+SC-Controller - Profile Cache
+
+Parsing profile means tokenizing every action string in it, what takes
+noticeable time with bigger profiles. To skip this, parsed profiles are
+pickled into ~/.cache/scc/profiles and reused until profile file, set of
+registered actions, source of any module defining them or SCC version
+changes. Any process can read cache, but only daemon, which sets
+'writable', writes it.
+
+On top of that, daemon keeps few last used profiles in ProfileLRU, so
+switching back and forth between same profiles doesn't have to read
+anything at all.
+"""
+from scc.constants import DAEMON_VERSION
+from scc.paths import get_cache_path
+from scc.actions import Action
+from scc.lib import inotify
+from collections import OrderedDict
+import os, sys, zlib, pickle, hashlib, threading, logging
+log = logging.getLogger("ProfileCache")
+
+
+class ProfileCache(object):
+	# Has to be increased whenever attributes of any action change
+	FORMAT = 2
+	# Profile attributes set by Profile.load_fileobj
+	ATTRIBUTES = ( 'description', 'is_template', 'buttons', 'stick', 'gyro',
+		'triggers', 'pads', 'menus', 'original_version' )
+	
+	def __init__(self):
+		self.enabled = True
+		self.writable = False
+		self.hits = 0
+		self.misses = 0
+	
+	
+	# Module name -> hash of its source, computed only once
+	_sources = {}
+	
+	@staticmethod
+	def get_action_set_signature():
+		"""
+		Returns string that changes when any action is registered, removed
+		or replaced, for example by custom.py, or when source of module
+		defining any action or its base class changes.
+		"""
+		classes = []
+		def walk(dct, prefix):
+			for keyword in sorted(dct, key=str):
+				value = dct[keyword]
+				if isinstance(value, dict):
+					for x in walk(value, "%s%s." % (prefix, keyword)):
+						yield x
+				else:
+					classes.append(value)
+					yield "%s%s=%s.%s" % (prefix, keyword,
+						value.__module__, value.__name__)
+		
+		lines = list(walk(Action.ALL, ""))
+		modules = { c.__module__ for cls in classes for c in cls.__mro__ }
+		for name in sorted(modules):
+			lines.append("%s:%s" % (name, ProfileCache._get_source_hash(name)))
+		return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+	
+	
+	@staticmethod
+	def _get_source_hash(name):
+		if name not in ProfileCache._sources:
+			filename = getattr(sys.modules.get(name), "__file__", None)
+			try:
+				with open(filename, "rb") as f:
+					ProfileCache._sources[name] = hashlib.sha1(f.read()).hexdigest()
+			except (TypeError, OSError):
+				# Builtin module or source not available
+				ProfileCache._sources[name] = ""
+		return ProfileCache._sources[name]
+	
+	
+	@staticmethod
+	def get_cache_filename(filename, parser):
+		key = "%s\n%s" % (os.path.abspath(filename), parser.__class__.__name__)
+		return os.path.join(get_cache_path(), "profiles",
+			hashlib.sha1(key.encode("utf-8")).hexdigest() + ".cache")
+	
+	
+	def _get_key(self, filename):
+		st = os.stat(filename)
+		return ( ProfileCache.FORMAT, DAEMON_VERSION, st.st_mtime_ns,
+			st.st_size, self.get_action_set_signature() )
+	
+	
+	def load(self, profile, filename):
+		"""
+		Loads cached data for profile file into profile.
+		Returns True on success or False if profile has to be parsed.
+		"""
+		if not self.enabled:
+			return False
+		try:
+			key = self._get_key(filename)
+			with open(self.get_cache_filename(filename, profile.parser), "rb") as f:
+				if pickle.load(f) != key:
+					# Stale
+					self.misses += 1
+					return False
+				data = pickle.loads(zlib.decompress(f.read()))
+		except FileNotFoundError:
+			self.misses += 1
+			return False
+		except Exception as e:
+			log.warning("Failed to load cached profile '%s': %s", filename, e)
+			self.misses += 1
+			return False
+		
+		for name in ProfileCache.ATTRIBUTES:
+			setattr(profile, name, data[name])
+		self.hits += 1
+		return True
+	
+	
+	def save(self, profile, filename):
+		""" Stores just loaded profile in cache, if cache is writable """
+		if not self.enabled or not self.writable:
+			return
+		cache_file = self.get_cache_filename(filename, profile.parser)
+		try:
+			key = self._get_key(filename)
+			data = zlib.compress(pickle.dumps({
+				name : getattr(profile, name) for name in ProfileCache.ATTRIBUTES
+			}, pickle.HIGHEST_PROTOCOL))
+			if not os.path.exists(os.path.dirname(cache_file)):
+				os.makedirs(os.path.dirname(cache_file))
+			# Written into temporary file first, so other process
+			# can't read half-written cache
+			tmp = "%s.%s.tmp" % (cache_file, os.getpid())
+			with open(tmp, "wb") as f:
+				pickle.dump(key, f)
+				f.write(data)
+			os.rename(tmp, cache_file)
+		except Exception as e:
+			log.warning("Failed to cache profile '%s': %s", filename, e)
+	
+	
+	def get_stats(self):
+		""" Returns (hits, misses) tuple """
+		return self.hits, self.misses
+
+
+class ProfileLRU(object):
+	"""
+	Bounded LRU of loaded (and compressed) profiles, keyed by filename
+	and mtime.
+	
+	Actions keep runtime state, what makes Profile instance used by mapper
+	unsafe to reuse. LRU stores pickled copy of every profile, taken right
+	after it's parsed, and get() creates fresh actions from it instead.
+	That is still much faster than parsing.
+	
+	Optionally watches profile directories with inotify, so profiles edited
+	while in LRU are dropped without waiting for next stat. Inotify events
+	are handled in main thread, while profiles are loaded in ProfileLoader
+	thread, hence the lock.
+	"""
+	SIZE = 8
+	WATCH_MASK = ( inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO
+		| inotify.IN_MOVED_FROM | inotify.IN_DELETE | inotify.IN_ONLYDIR )
+	
+	def __init__(self, size=SIZE):
+		self.size = size
+		self.hits = 0
+		self.misses = 0
+		self._profiles = OrderedDict()	# filename -> (key, pickled data)
+		self._inotify = None
+		self._watches = {}				# wd -> directory
+		self._lock = threading.Lock()
+	
+	
+	@staticmethod
+	def _get_key(filename):
+		st = os.stat(filename)
+		return st.st_mtime_ns, st.st_size
+	
+	
+	def get(self, filename, profile):
+		"""
+		Fills 'profile' with fresh copy of profile loaded from 'filename'
+		and returns it. Returns None if profile is not in LRU or file was
+		changed since.
+		"""
+		path = os.path.abspath(filename)
+		with self._lock:
+			key, data = self._profiles.get(path, (None, None))
+			if data is not None:
+				self._profiles.move_to_end(path)
+		try:
+			if data is not None and self._get_key(path) == key:
+				data = pickle.loads(data)
+				for name in ProfileCache.ATTRIBUTES:
+					setattr(profile, name, data[name])
+				profile.filename = filename
+				self.hits += 1
+				return profile
+		except Exception as e:
+			log.warning("Failed to reuse profile '%s': %s", filename, e)
+		self.misses += 1
+		return None
+	
+	
+	def load(self, filename, profile):
+		"""
+		Loads and compresses 'profile' from 'filename' and stores its copy
+		in LRU. Returns profile.
+		"""
+		path = os.path.abspath(filename)
+		# Stat is done first, so change done while parsing is not missed
+		key = self._get_key(path)
+		profile.load(filename).compress()
+		try:
+			data = pickle.dumps({
+				name : getattr(profile, name) for name in ProfileCache.ATTRIBUTES
+			}, pickle.HIGHEST_PROTOCOL)
+		except Exception as e:
+			# Probably some custom action
+			log.debug("Profile '%s' can't be kept in LRU: %s", filename, e)
+			return profile
+		with self._lock:
+			self._profiles[path] = key, data
+			self._profiles.move_to_end(path)
+			while len(self._profiles) > self.size:
+				self._profiles.popitem(last=False)
+			self._watch(os.path.dirname(path))
+		return profile
+	
+	
+	def invalidate(self, filename=None):
+		"""
+		Drops profile loaded from 'filename', or everything if filename
+		is None.
+		"""
+		with self._lock:
+			if filename is None:
+				self._profiles.clear()
+				return
+			if self._profiles.pop(os.path.abspath(filename), None):
+				log.debug("Profile '%s' changed, dropped from LRU", filename)
+	
+	
+	def start_watching(self, poller):
+		"""
+		Starts watching directories of loaded profiles using inotify.
+		If that fails, changes are detected only by checking mtime.
+		"""
+		try:
+			self._inotify = inotify.Inotify()
+		except Exception as e:
+			log.warning("Failed to initialize inotify: %s", e)
+			return
+		poller.register(self._inotify.fileno(), poller.POLLIN, self._on_inotify)
+		with self._lock:
+			for filename in list(self._profiles):
+				self._watch(os.path.dirname(filename))
+	
+	
+	def _watch(self, directory):
+		if self._inotify is None or directory in self._watches.values():
+			return
+		try:
+			self._watches[self._inotify.add_watch(directory, self.WATCH_MASK)] = directory
+		except OSError as e:
+			log.warning("Failed to watch '%s': %s", directory, e)
+	
+	
+	def _on_inotify(self, fd, event):
+		for wd, mask, name in self._inotify.read_events():
+			if mask & inotify.IN_Q_OVERFLOW:
+				self.invalidate()
+			elif mask & inotify.IN_IGNORED:
+				self._watches.pop(wd, None)
+			elif wd in self._watches and name:
+				self.invalidate(os.path.join(self._watches[wd], name))
+	
+	
+	def get_stats(self):
+		""" Returns (hits, misses) tuple """
+		return self.hits, self.misses
+
+
+profile_cache = ProfileCache()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+SC-Controller - Replay
+
+Recording of controller input as it enters Mapper and replaying it through
+Mapper with dummy virtual devices, so actions and profiles can be
+benchmarked and compared with previous output without any hardware.
+
+Recording is started by sending 'Record: filename' to daemon and stopped
+when client disconnects. File starts with MAGIC, followed by records
+packed with RECORD.
+"""
+from scc.controller import Controller
+from scc.scheduler import Scheduler
+from scc.tracing import Histogram
+from scc.mapper import Mapper
+from scc.uinput import Dummy
+from collections import namedtuple
+import time, struct, hashlib, threading, logging
+log = logging.getLogger("Replay")
+
+MAGIC = b"SCCREC1\n"
+FIELDS = ( 'buttons', 'ltrig', 'rtrig', 'stick_x', 'stick_y',
+	'lpad_x', 'lpad_y', 'rpad_x', 'rpad_y', 'gpitch', 'groll', 'gyaw',
+	'q1', 'q2', 'q3', 'q4', 'cpad_x', 'cpad_y' )
+# timestamp, controller type, controller flags, gyro enabled, state
+RECORD = struct.Struct("<d16sI?I" + "i" * (len(FIELDS) - 1))
+# How long after last record are scheduled tasks still executed
+TAIL = 1.0
+
+ReplayInput = namedtuple('ReplayInput', FIELDS)
+Record = namedtuple('Record', 'time type flags gyro state')
+
+
+class Recorder(object):
+	"""
+	Writes every input passed to Mapper into file.
+	Mapper calls 'record' for as long as instance is set as its 'recorder'.
+	"""
+	
+	def __init__(self, filename):
+		self._file = open(filename, "wb")
+		self._file.write(MAGIC)
+		# Records are written from main thread, but file may be closed from
+		# socket thread
+		self._lock = threading.Lock()
+		self.count = 0
+	
+	
+	def record(self, controller, state):
+		data = RECORD.pack(
+			time.time(),
+			controller.get_type().encode("utf-8")[0:16],
+			int(controller.flags),
+			bool(controller.get_gyro_enabled()),
+			*[ int(getattr(state, name, 0)) for name in FIELDS ]
+		)
+		with self._lock:
+			if self._file:
+				self._file.write(data)
+				self.count += 1
+	
+	
+	def close(self):
+		with self._lock:
+			if self._file:
+				self._file.close()
+				self._file = None
+				log.debug("Recorded %s inputs", self.count)
+
+
+def load_recording(filename):
+	"""
+	Returns list of Records loaded from file.
+	Raises ValueError if file is not recording.
+	"""
+	with open(filename, "rb") as f:
+		data = f.read()
+	if not data.startswith(MAGIC):
+		raise ValueError("Not a recording: %s" % (filename,))
+	data = data[len(MAGIC):]
+	# Last record may be incomplete if daemon was killed while recording
+	data = data[0:len(data) - len(data) % RECORD.size]
+	rv = []
+	for values in RECORD.iter_unpack(data):
+		t, type, flags, gyro = values[0:4]
+		type = type.rstrip(b"\x00").decode("utf-8")
+		rv.append(Record(t, type, flags, gyro, ReplayInput._make(values[4:])))
+	return rv
+
+
+class ReplayController(Controller):
+	""" Pretends to be controller that was recorded """
+	
+	def __init__(self):
+		Controller.__init__(self)
+		self._id = "replay"
+		self._type = "replay"
+		self._gyro = False
+	
+	
+	def get_type(self):
+		return self._type
+	
+	
+	def get_gyro_enabled(self):
+		return self._gyro
+	
+	
+	def set_record(self, record):
+		self._type, self.flags, self._gyro = record.type, record.flags, record.gyro
+	
+	
+	def __repr__(self):
+		return "<ReplayController %s>" % (self._type,)
+
+
+class RecordingDummy(Dummy):
+	"""
+	Dummy virtual device that stores every call made to it into list
+	shared with other devices, so order of events is retained.
+	"""
+	
+	def __init__(self, name, events):
+		self._name = name
+		self._events = events
+	
+	
+	def _recorded(method):
+		def fn(self, *a):
+			self._events.append((self._name, method) + tuple(
+				tuple(x) if type(x) == list else x for x in a))
+		return fn
+	
+	keyEvent = _recorded("key")
+	axisEvent = _recorded("axis")
+	relEvent = _recorded("rel")
+	scanEvent = _recorded("scan")
+	synEvent = _recorded("syn")
+	moveEvent = _recorded("move")
+	scrollEvent = _recorded("scroll")
+	pressEvent = _recorded("press")
+	releaseEvent = _recorded("release")
+	del _recorded
+
+
+class ReplayStats(object):
+	def __init__(self):
+		self.count = 0
+		self.wall_time = 0.0
+		self.cpu_time = 0.0
+		self.histogram = Histogram()
+	
+	
+	def get_throughput(self):
+		""" Returns processed reports per second """
+		if self.wall_time <= 0:
+			return 0.0
+		return self.count / self.wall_time
+	
+	
+	def get_cpu_per_report(self):
+		""" Returns average CPU time spent on one report, in microseconds """
+		if self.count == 0:
+			return 0.0
+		return self.cpu_time * 1000000.0 / self.count
+
+
+class Replayer(object):
+	"""
+	Feeds recorded inputs to Mapper with given profile and remembers
+	every event generated.
+	"""
+	
+	def __init__(self, profile):
+		self.events = []
+		self.scheduler = Scheduler()
+		self.controller = ReplayController()
+		self.mapper = Mapper(profile, self.scheduler,
+			keyboard=False, mouse=False, gamepad=False)
+		self.mapper.keyboard = RecordingDummy("keyboard", self.events)
+		self.mapper.mouse = RecordingDummy("mouse", self.events)
+		self.mapper.gamepad = RecordingDummy("gamepad", self.events)
+		self.mapper.set_controller(self.controller)
+		self.controller.set_mapper(self.mapper)
+		self._old_state = ReplayInput(*[ 0 ] * len(FIELDS))
+		self._now = 0.0
+	
+	
+	def replay(self, records, realtime=False):
+		"""
+		Replays records. With 'realtime' set, waits between records as long
+		as it was waited while recording. Otherwise, replays as fast as
+		possible, with time.time faked to match recorded timestamps, so
+		output doesn't depend on speed of replay.
+		
+		Returns ReplayStats.
+		"""
+		stats = ReplayStats()
+		if len(records) == 0:
+			return stats
+		_time = time.time
+		if not realtime:
+			time.time = lambda: self._now
+			self._now = records[0].time
+			self.scheduler.update_time()
+		cpu_start, wall_start = time.process_time(), time.perf_counter()
+		try:
+			if realtime:
+				offset = _time() - records[0].time
+				for r in records:
+					self._sleep(r.time + offset)
+					self._input(r, stats)
+				self._sleep(records[-1].time + offset + TAIL)
+			else:
+				for r in records:
+					self._advance(r.time)
+					self._input(r, stats)
+				self._advance(records[-1].time + TAIL)
+		finally:
+			time.time = _time
+		stats.cpu_time = time.process_time() - cpu_start
+		stats.wall_time = time.perf_counter() - wall_start
+		return stats
+	
+	
+	def _input(self, record, stats):
+		self.controller.set_record(record)
+		self.scheduler.update_time()
+		t = time.perf_counter()
+		self.mapper.input(self.controller, self._old_state, record.state)
+		stats.histogram.add((time.perf_counter() - t) * 1000000.0)
+		stats.count += 1
+		self._old_state = record.state
+	
+	
+	def _run_scheduled(self):
+		if self.scheduler.run():
+			self.mapper.generate_events()
+			self.mapper.generate_feedback()
+	
+	
+	def _advance(self, t):
+		""" Moves fake time to 't', executing scheduled tasks on the way """
+		while True:
+			timeout = self.scheduler.get_timeout()
+			if timeout is None or self._now + timeout >= t:
+				break
+			self._now += timeout
+			self._run_scheduled()
+		self._now = t
+		self._run_scheduled()
+	
+	
+	def _sleep(self, until):
+		""" Sleeps until 'until', executing scheduled tasks on the way """
+		while True:
+			remaining = until - time.time()
+			if remaining <= 0:
+				break
+			timeout = self.scheduler.get_timeout()
+			time.sleep(remaining if timeout is None else min(remaining, timeout))
+			self._run_scheduled()
+	
+	
+	def dump(self):
+		""" Returns generated events as list of strings """
+		return [ " ".join([ str(x) for x in e ]) for e in self.events ]
+	
+	
+	def get_digest(self):
+		""" Returns hash of all generated events """
+		return hashlib.sha1("\n".join(self.dump()).encode("utf-8")).hexdigest()
@@ -16,26 +16,32 @@ from scc.uinput import CannotCreateUInputException
 from scc.tools import set_logging_level, find_binary, clamp
 from scc.device_monitor import create_device_monitor
 from scc.cemuhook_server import CemuhookServer
+from scc.event_stream import ClientWriter, EVENT, EVENT_MARKER
 from scc.custom import load_custom_module
 from scc.gestures import GestureDetector
 from scc.parser import TalkingActionParser
 from scc.controller import HapticData
 from scc.scheduler import Scheduler
+from scc.replay import Recorder
+from scc.state_page import StatePage, get_state_page_path
+from scc.startup_profile import startup_profile
+from scc.tracing import tracer
 from scc.menu_data import MenuData
+from scc.profile_cache import profile_cache, ProfileLRU
 from scc.profile import Profile
 from scc.actions import Action
 from scc.config import Config
 from scc.poller import Poller
 from scc.mapper import Mapper
+from scc.mapper_worker import WorkerMapper
 from scc import drivers
 
-from socketserver import UnixStreamServer, ThreadingMixIn, StreamRequestHandler
-import os, sys, pkgutil, signal, time, json, logging
-import threading, traceback, subprocess, shlex
+import os, re, sys, pkgutil, signal, socket, time, json, logging
+import threading, traceback, subprocess, shlex, queue
 log = logging.getLogger("SCCDaemon")
-tlog = logging.getLogger("Socket Thread")
 
-class ThreadingUnixStreamServer(ThreadingMixIn, UnixStreamServer): daemon_threads = True
+# Matches command part of message, such as 'Profile:' or 'Unlock.'
+RE_COMMAND = re.compile(rb"[A-Za-z][A-Za-z ]*[:.]")
 
 
 class SCCDaemon(Daemon):
@@ -43,15 +49,17 @@ class SCCDaemon(Daemon):
 	def __init__(self, piddile, socket_file):
 		set_logging_level(True, True)
 		Daemon.__init__(self, piddile)
-		Config()					# Generates ~/.config/scc and default config if needed
+		cfg = Config()				# Generates ~/.config/scc and default config if needed
+		cfg.subscribe(self._on_config_changed)
+		tracer.enabled = cfg["latency_tracing"]
 		self.started = False
 		self.exiting = False
 		self.socket_file = socket_file
 		self.poller = Poller()
 		self.dev_monitor = create_device_monitor(self)
-		self.scheduler = Scheduler()
+		self.scheduler = Scheduler(wakeup=self.poller.wakeup)
 		self.xdisplay = None
-		self.sserver = None			# UnixStreamServer instance
+		self.sserver = None			# Listening socket
 		self.errors = []
 		self.alone = False			# Set by launching script from --alone flag
 		self.custom_py_loaded = False
@@ -61,7 +69,7 @@ class SCCDaemon(Daemon):
 		# TODO: Use osd_ids for all menus
 		self.osd_ids = {}
 		self.controllers = []
-		self.mainloops = [ self.poller.poll, self.scheduler.run ]
+		self.mainloops = []
 		self.rescan_cbs = [ ]
 		self.on_exit_cbs = []
 		self.subprocs = []
@@ -70,7 +78,36 @@ class SCCDaemon(Daemon):
 		self.default_mapper = None
 		self.free_mappers = [ ]
 		self.clients = set()
+		self.recorder = None		# Set while input is being recorded
+		self.state_pages = {}		# Controller -> StatePage, while sniffing is enabled
+		self.profile_lru = ProfileLRU()
+		self.menu_cache = {}		# Filename -> (stat, MenuData), see _get_menu
+		self.profile_loader = ProfileLoader(self)
 		self.cwd = os.getcwd()
+		self.commands = {
+			b"Controller."		: self._cmd_default_controller,
+			b"Controller:"		: self._cmd_controller,
+			b"Event format:"	: self._cmd_event_format,
+			b"Feedback:"		: self._cmd_feedback,
+			b"Gesture:"			: self._cmd_gesture,
+			b"Gestured:"		: self._cmd_gestured,
+			b"Led:"				: self._cmd_led,
+			b"Lock:"			: self._cmd_lock,
+			b"Observe:"			: self._cmd_observe,
+			b"OSD:"				: self._cmd_osd,
+			b"Profile:"			: self._cmd_profile,
+			b"Reconfigure."		: self._cmd_reconfigure,
+			b"Record:"			: self._cmd_record,
+			b"Register:"		: self._cmd_register,
+			b"Replace:"			: self._cmd_replace,
+			b"Rescan."			: self._cmd_rescan,
+			b"Restart."			: self._cmd_restart,
+			b"Selected:"		: self._cmd_selected,
+			b"State."			: self._cmd_state,
+			b"Stats."			: self._cmd_stats,
+			b"Turnoff."			: self._cmd_turnoff,
+			b"Unlock."			: self._cmd_unlock,
+		}
 	
 	
 	def init_drivers(self):
@@ -86,7 +123,10 @@ class SCCDaemon(Daemon):
 			if not ispkg and modname != "driver":
 				if modname == "usb" or cfg["drivers"].get(modname):
 					# 'usb' driver has to be always active
-					mod = getattr(__import__('scc.drivers.%s' % (modname,)).drivers, modname)
+					if modname in drivers.DRIVER_MANIFEST:
+						self._add_lazy_driver(modname, cfg)
+						continue
+					mod = self._import_driver(modname)
 					if hasattr(mod, "init"):
 						to_init.append(mod)
 				else:
@@ -102,6 +142,31 @@ class SCCDaemon(Daemon):
 					self._to_start.add(getattr(mod, "start"))
 	
 	
+	@staticmethod
+	def _import_driver(modname):
+		return getattr(__import__('scc.drivers.%s' % (modname,)).drivers, modname)
+	
+	
+	def _add_lazy_driver(self, modname, cfg):
+		"""
+		Registers driver listed in DRIVER_MANIFEST so it's imported
+		and initialized only once device it can handle is connected.
+		"""
+		def load():
+			log.debug("Loading driver '%s'", modname)
+			mod = self._import_driver(modname)
+			if hasattr(mod, "init") and mod.init(self, cfg):
+				if hasattr(mod, "start"):
+					if hasattr(self, "_to_start"):
+						self._to_start.add(mod.start)
+					else:
+						mod.start(self)
+		
+		for subsystem, vendor_id, product_id in drivers.DRIVER_MANIFEST[modname]:
+			self.dev_monitor.add_lazy_callback(subsystem,
+				vendor_id, product_id, load)
+	
+	
 	def init_default_mapper(self):
 		"""
 		default_mapper is persistent mapper assigned to first Controller instance.
@@ -151,6 +216,10 @@ class SCCDaemon(Daemon):
 	def add_mainloop(self, fn):
 		"""
 		Adds function that is called in every mainloop iteration.
+		Mainloop iterates only when there is something to do, that is when
+		any descriptor registered in poller is ready, scheduled task is due
+		or poller.wakeup() was called.
+		
 		Can be called only durring initialization, in driver 'init' method.
 		"""
 		if fn not in self.mainloops:
@@ -182,11 +251,32 @@ class SCCDaemon(Daemon):
 			self.rescan_cbs.append(fn)
 	
 	
-	def _set_profile(self, mapper, filename):
-		# Called from socket server thread
-		p = Profile(TalkingActionParser())
-		p.load(filename).compress()
+	def _set_profile(self, mapper, filename, callback=None):
+		"""
+		Loads profile in background thread and switches mapper to it
+		at start of next mainloop iteration.
+		
+		If set, callback(error) is called from mainloop after that, with
+		error being None on success or formatted traceback.
+		"""
+		def loaded(p, error):
+			if p is not None:
+				try:
+					self._switch_profile(mapper, filename, p)
+				except Exception:
+					# Callback has to be called anyway, as client
+					# may be waiting for reply
+					error = traceback.format_exc()
+			if callback:
+				callback(error)
+		
+		self.profile_loader.load(filename, loaded)
+	
+	
+	def _switch_profile(self, mapper, filename, p):
+		""" Switches mapper to already loaded profile. Called from mainloop """
 		self.profile_file = filename
+		log.debug("Profile LRU: %s hits, %s misses", *self.profile_lru.get_stats())
 		
 		if mapper.profile.gyro and not p.gyro:
 			# Turn off gyro sensor that was enabled but is no longer needed
@@ -200,13 +290,15 @@ class SCCDaemon(Daemon):
 				mapper.get_controller().set_gyro_enabled(True)
 		# Cancel everything
 		mapper.cancel_all()
-		# Release all buttons
+		# Release all buttons. Sent out right away, as next input,
+		# which would normally sync them, may come much later
 		mapper.release_virtual_buttons()
+		mapper.sync()
 		# Reset mouse (issue #222)
 		mapper.mouse.reset()
 		
-		# This last line kinda depends on GIL...
 		mapper.profile = p
+		mapper.reset_gyros()
 		# Re-apply all locks
 		for c in self.clients:
 			c.reaply_locks(self, mapper)
@@ -305,7 +397,6 @@ class SCCDaemon(Daemon):
 		# Send request
 		try:
 			self.osd_daemon.wfile.write(data)
-			self.osd_daemon.wfile.flush()
 		except Exception as e:
 			log.error("Failed to display OSD: %s", e)
 			self.osd_daemon = None
@@ -388,12 +479,13 @@ class SCCDaemon(Daemon):
 			return
 		path = find_profile(name)
 		if path:
-			with self.lock:
-				try:
-					self._set_profile(mapper, path)
+			def cb(error):
+				if error:
+					log.error("Failed to load profile '%s':\n%s", name, error)
+				else:
 					log.info("Loaded profile '%s'", name)
-				except Exception as e:
-					log.exception(e)
+			
+			self._set_profile(mapper, path, cb)
 			return
 		log.error("Cannot load profile: Profile '%s' not found", name)
 	
@@ -419,6 +511,9 @@ class SCCDaemon(Daemon):
 		for p in self.subprocs:
 			p.kill()
 		self.subprocs = []
+		for page in self.state_pages.values():
+			page.close()
+		self.state_pages = {}
 		sys.exit(0)
 	
 	
@@ -437,11 +532,11 @@ class SCCDaemon(Daemon):
 					return
 			except (ImportError, ValueError):
 				pass
-
+			
 			log.warning("Wayland detected. Disabling X11 support, some functionality will be unavailable")
 			self.xdisplay = None
 			return
-
+		
 		if "DISPLAY" not in os.environ:
 			log.warning("DISPLAY env variable not set. Some functionality will be unavailable")
 			self.xdisplay = None
@@ -450,6 +545,9 @@ class SCCDaemon(Daemon):
 		self.xdisplay = X.open_display(os.environ["DISPLAY"].encode("utf-8"))
 		if self.xdisplay:
 			log.debug("Connected to XServer %s", os.environ["DISPLAY"])
+			geometry = X.watch_geometry(self.xdisplay)
+			self.poller.register(geometry.fileno(), self.poller.POLLIN,
+				geometry.process_events)
 			
 			for c in self.controllers:
 				if c.get_mapper():
@@ -470,8 +568,9 @@ class SCCDaemon(Daemon):
 		"""
 		Setups new mapper instance.
 		"""
+		cls = WorkerMapper if Config()["mapper_workers"] else Mapper
 		try:
-			mapper = Mapper(Profile(TalkingActionParser()),
+			mapper = cls(Profile(TalkingActionParser()),
 					self.scheduler, poller=self.poller)
 		except CannotCreateUInputException as e:
 			# Most likely UInput is not available
@@ -481,9 +580,13 @@ class SCCDaemon(Daemon):
 			mapper = Mapper(Profile(TalkingActionParser()),
 				self.scheduler, keyboard=None, mouse=None, gamepad=False)
 		
+		if isinstance(mapper, WorkerMapper):
+			# Errors from worker process are reported same way as above
+			mapper.on_error = self.add_error
 		mapper.set_special_actions_handler(self)
 		mapper.set_xdisplay(self.xdisplay)
-		mapper.schedule(1.0, self.fix_xinput)
+		mapper.recorder = self.recorder
+		self.scheduler.schedule(1.0, self.fix_xinput, mapper)
 		return mapper
 	
 	
@@ -512,7 +615,11 @@ class SCCDaemon(Daemon):
 				# Broken config is not reason to fail here
 				pass
 		try:
-			mapper.profile.load(self.default_profile).compress()
+			# Assigned, not loaded in place, so WorkerMapper can tell
+			# worker to load same profile
+			profile = Profile(TalkingActionParser())
+			profile.load(self.default_profile).compress()
+			mapper.profile = profile
 		except Exception as e:
 			log.warning("Failed to load profile. Starting with no mappings.")
 			log.warning("Reason: %s", e)
@@ -537,7 +644,7 @@ class SCCDaemon(Daemon):
 			log.debug("Turning gyrosensor ON")
 			c.set_gyro_enabled(True)
 		
-		c.apply_config(Config().get_controller_config(c.get_id()))
+		self._apply_controller_config(c, Config())
 		self.controllers.append(c)
 		log.debug("Controller added: %s", c)
 		with self.lock:
@@ -545,11 +652,44 @@ class SCCDaemon(Daemon):
 			self.send_all_profiles(self._send_to_all)
 	
 	
+	def _apply_controller_config(self, c, cfg):
+		ccfg = cfg.get_controller_config(c.get_id())
+		c.apply_config(ccfg)
+		if c.get_mapper():
+			c.get_mapper().set_input_rate(ccfg["input_rate"])
+		self._set_state_page(c, cfg["enable_sniffing"])
+	
+	
+	def _set_state_page(self, c, enabled):
+		"""
+		Creates or removes state page of controller, see scc.state_page,
+		and assigns it to its mapper.
+		"""
+		page = self.state_pages.pop(c, None)
+		if enabled:
+			if page is None:
+				try:
+					page = StatePage(get_state_page_path(c.get_id()))
+				except (OSError, ValueError) as e:
+					log.warning("Failed to create state page for %s: %s", c, e)
+			if page is not None:
+				self.state_pages[c] = page
+		elif page is not None:
+			page.close()
+			page = None
+		if c.get_mapper():
+			c.get_mapper().state_page = page
+	
+	
 	def remove_controller(self, c):
 		mapper = c.mapper
 		if mapper:
+			# Synced right away, as there will be no more input from 'c'
 			mapper.release_virtual_buttons()
+			mapper.sync()
+		self._set_state_page(c, False)
 		c.disconnected()
+		swap_c = None
 		
 		with self.lock:
 			while c in self.controllers:
@@ -563,8 +703,10 @@ class SCCDaemon(Daemon):
 				swap_c = self.controllers[0]
 				swap_mapper = swap_c.get_mapper()
 				swap_mapper.set_controller(None)
+				swap_mapper.state_page = None
 				swap_c.set_mapper(mapper)
 				mapper.set_controller(swap_c)
+				mapper.state_page = self.state_pages.get(swap_c)
 				self.free_mappers.append(swap_mapper)
 				log.debug("Reassigned default_mapper to %s", swap_c)
 			else:
@@ -573,6 +715,10 @@ class SCCDaemon(Daemon):
 					mapper.set_controller(None)
 					self.free_mappers.append(mapper)
 			self.send_controller_list(self._send_to_all)
+		
+		if swap_c is not None:
+			# Input rate of default_mapper has to match its new controller
+			self._apply_controller_config(swap_c, Config())
 	
 	
 	def get_active_ids(self):
@@ -657,8 +803,11 @@ class SCCDaemon(Daemon):
 		self.init_drivers()
 		self.dev_monitor.start()
 		load_custom_module(log)
+		# Only daemon writes profile cache, everything else just reads it
+		profile_cache.writable = True
 		self.default_mapper = self.init_default_mapper()
 		self.free_mappers.append(self.default_mapper)
+		self.profile_lru.start_watching(self.poller)
 		self.load_default_profile()
 		self.lock.acquire()
 		self.start_listening()
@@ -666,25 +815,48 @@ class SCCDaemon(Daemon):
 		self.lock.release()
 		self.start_drivers()
 		self.dev_monitor.rescan()
+		startup_profile.mark("daemon started")
+		startup_profile.report()
 		
 		while True:
+			ready = self.poller.wait(self.scheduler.get_timeout())
+			# Tasks scheduled by input callbacks are counted from now,
+			# not from moment when mainloop went to sleep
+			self.scheduler.update_time()
+			# Profiles are switched before any input is processed
+			self.profile_loader.switch_loaded()
+			self.poller.dispatch(ready)
+			if self.scheduler.run():
+				self._flush_scheduled_events()
 			for fn in self.mainloops:
 				fn()
+			# Events are sent only once per iteration, see event_stream.py
+			for client in list(self.clients):
+				client.wfile.flush_queue()
+	
+	
+	def _flush_scheduled_events(self):
+		"""
+		Called after scheduled tasks were executed from mainloop.
+		Tasks such as macros or rolling 'ball' may generate events without
+		any input being received, so those are sent out here.
+		"""
+		for c in self.controllers:
+			mapper = c.get_mapper()
+			if mapper:
+				mapper.generate_events()
+				mapper.generate_feedback()
 	
 	
 	def start_listening(self):
 		if os.path.exists(self.socket_file):
 			os.unlink(self.socket_file)
-		instance = self
-		
-		class SSHandler(StreamRequestHandler):
-			def handle(self):
-				instance._sshandler(self.connection, self.rfile, self.wfile)
-		
-		self.sserver = ThreadingUnixStreamServer(self.socket_file, SSHandler)
-		t = threading.Thread(target=self.sserver.serve_forever)
-		t.daemon = True
-		t.start()
+		# Clients are served from mainloop, same as input devices
+		self.sserver = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sserver.bind(self.socket_file)
+		self.sserver.listen(16)
+		self.sserver.setblocking(False)
+		self.poller.register(self.sserver.fileno(), self.poller.POLLIN, self._on_new_client)
 		os.chmod(self.socket_file, stat.S_IRUSR | stat.S_IWUSR)
 		log.debug("Created control socket %s", self.socket_file)
 	
@@ -720,286 +892,416 @@ class SCCDaemon(Daemon):
 		return gd	
 	
 	
-	def _sshandler(self, connection, rfile, wfile):
-		with self.lock:
-			client = Client(connection, self.default_mapper, rfile, wfile)
-			self.clients.add(client)
-			wfile.write(b"SCCDaemon\n")
-			wfile.write(("Version: %s\n" % (DAEMON_VERSION,)).encode("utf-8"))
-			wfile.write(("PID: %s\n" % (os.getpid(),)).encode("utf-8"))
-			self.send_controller_list(wfile.write)
-			self.send_all_profiles(wfile.write)
-			if len(self.errors) == 0:
-				wfile.write(b"Ready.\n")
-			else:
-				for id, error in self.errors:
-					wfile.write(("Error: %s\n" % (error,)).encode("utf-8"))
-		
-		while True:
-			try:
-				line = rfile.readline()
-			except Exception:
-				# Connection terminated
-				break
-			if len(line) == 0: break
-			if len(line.strip(b"\t\n ")) > 0:
-				self._handle_message(client, line.strip(b"\n"))
-		
+	def _on_new_client(self, *a):
+		try:
+			connection, address = self.sserver.accept()
+		except (BlockingIOError, InterruptedError):
+			return
+		connection.setblocking(False)
+		wfile = ClientWriter(connection, self.poller,
+			lambda: self._on_client_data(client))
+		client = Client(connection, self.default_mapper, wfile)
+		self.clients.add(client)
+		wfile.write(b"SCCDaemon\n")
+		wfile.write(("Version: %s\n" % (DAEMON_VERSION,)).encode("utf-8"))
+		wfile.write(("PID: %s\n" % (os.getpid(),)).encode("utf-8"))
+		self.send_controller_list(wfile.write)
+		self.send_all_profiles(wfile.write)
+		if len(self.errors) == 0:
+			wfile.write(b"Ready.\n")
+		else:
+			for id, error in self.errors:
+				wfile.write(("Error: %s\n" % (error,)).encode("utf-8"))
+	
+	
+	def _on_client_data(self, client):
+		try:
+			data = client.connection.recv(65536)
+		except (BlockingIOError, InterruptedError):
+			return
+		except OSError:
+			data = b""
+		if len(data) == 0:
+			# Connection terminated
+			self._on_client_disconnected(client)
+			return
+		client.buffer += data
+		while b"\n" in client.buffer and client in self.clients:
+			line, client.buffer = client.buffer.split(b"\n", 1)
+			if len(line.strip(b"\t\r ")) > 0:
+				self._handle_message(client, line)
+	
+	
+	def _on_client_disconnected(self, client):
 		with self.lock:
 			client.unlock_actions(self)
-			if self.osd_daemon == client:
-				log.info("scc-osd-daemon lost")
-				self.osd_daemon = None
-			if self.autoswitch_daemon == client:
-				log.info("scc-autoswitch-daemon lost")
-				self.autoswitch_daemon = None
-			self.clients.remove(client)
+			if client.recorder:
+				self._set_recorder(None)
+		if client.recorder:
+			client.recorder.close()
+			client.recorder = None
+		if self.osd_daemon == client:
+			log.info("scc-osd-daemon lost")
+			self.osd_daemon = None
+		if self.autoswitch_daemon == client:
+			log.info("scc-autoswitch-daemon lost")
+			self.autoswitch_daemon = None
+		self.clients.discard(client)
+		client.wfile.close()
+		client.connection.close()
+	
+	
+	def _set_recorder(self, recorder):
+		"""
+		Sets (or, with None, unsets) recorder on every mapper.
+		Should be called while lock is acquired.
+		"""
+		self.recorder = recorder
+		mappers = set(self.free_mappers)
+		mappers.add(self.default_mapper)
+		for c in self.controllers:
+			if c.get_mapper():
+				mappers.add(c.get_mapper())
+		for mapper in mappers:
+			mapper.recorder = recorder
 	
 	
 	def _handle_message(self, client, message):
 		"""
 		Handles message recieved from client.
+		Called from main thread.
 		"""
-		if message.startswith(b"Profile:"):
-			with self.lock:
-				try:
-					filename = message[8:].decode("utf-8").strip("\t ")
-					self._set_profile(client.mapper, filename)
-					log.info("Loaded profile '%s'", filename)
-					client.wfile.write(b"OK.\n")
-				except Exception as e:
-					exc = traceback.format_exc()
-					log.exception(e)
-					tb = str(exc).encode("utf-8").decode('unicode_escape').encode("latin1")
-					client.wfile.write(b"Fail: " + tb + b"\n")
-		elif message.startswith(b"OSD:"):
-			if not self.osd_daemon:
-				client.wfile.write(b"Fail: Cannot show OSD; there is no scc-osd-daemon registered\n")
+		match = RE_COMMAND.match(message)
+		handler = self.commands.get(match.group(0)) if match else None
+		if handler is None:
+			client.wfile.write(b"Fail: Unknown command\n")
+			return
+		try:
+			handler(client, message[match.end():])
+		except Exception as e:
+			log.exception(e)
+			client.wfile.write(("Fail: %s\n" % (e,)).encode("utf-8"))
+	
+	
+	def _cmd_profile(self, client, args):
+		filename = args.decode("utf-8").strip("\t ")
+		# Profile is loaded in background and replies to commands received
+		# in meanwhile have to wait for this one
+		reply = client.wfile.reserve()
+		def cb(error):
+			if error:
+				log.error(error)
+				tb = error.encode("utf-8").decode('unicode_escape').encode("latin1")
+				client.wfile.fill(reply, b"Fail: " + tb + b"\n")
 			else:
-				try:
-					text = message[5:].decode("utf-8").strip("\t ")
-					with self.lock:
-						if not self._osd("message", text):
-							raise Exception()
-					client.wfile.write(b"OK.\n")
-				except Exception:
-					client.wfile.write(b"Fail: cannot display OSD\n")
-		elif message.startswith(b"Feedback:"):
+				log.info("Loaded profile '%s'", filename)
+				client.wfile.fill(reply, b"OK.\n")
+		
+		self._set_profile(client.mapper, filename, cb)
+	
+	
+	def _cmd_osd(self, client, args):
+		if not self.osd_daemon:
+			client.wfile.write(b"Fail: Cannot show OSD; there is no scc-osd-daemon registered\n")
+		else:
 			try:
-				position, amplitude = message[9:].strip().split(b" ", 2)
-				data = HapticData(
-					getattr(HapticPos, position.strip(" \t\r")),
-					int(amplitude)
-				)
-				if client.mapper.get_controller():
-					client.mapper.get_controller().feedback(data)
+				text = args.decode("utf-8").strip("\t ")
+				with self.lock:
+					if not self._osd("message", text):
+						raise Exception()
 				client.wfile.write(b"OK.\n")
-			except Exception as e:
-				log.exception(e)
-				client.wfile.write(b"Fail: %s\n" % (e,))
-		elif message.startswith(b"Controller."):
-			with self.lock:
-				client.mapper = self.default_mapper
+			except Exception:
+				client.wfile.write(b"Fail: cannot display OSD\n")
+	
+	
+	def _cmd_feedback(self, client, args):
+		try:
+			position, amplitude = args.decode("utf-8").strip().split(" ", 2)
+			data = HapticData(
+				getattr(HapticPos, position.strip(" \t\r")),
+				int(amplitude)
+			)
+			if client.mapper.get_controller():
+				client.mapper.get_controller().feedback(data)
+			client.wfile.write(b"OK.\n")
+		except Exception as e:
+			log.exception(e)
+			client.wfile.write(("Fail: %s\n" % (e,)).encode("utf-8"))
+	
+	
+	def _cmd_default_controller(self, client, args):
+		client.mapper = self.default_mapper
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_controller(self, client, args):
+		controller_id = args.decode("utf-8").strip()
+		for c in self.controllers:
+			if c.get_id() == controller_id:
+				client.mapper = c.get_mapper()
 				client.wfile.write(b"OK.\n")
-		elif message.startswith(b"Controller:"):
+				break
+		else:
+			client.wfile.write(b"Fail: no such controller\n")
+	
+	
+	def _cmd_state(self, client, args):
+		if Config()["enable_sniffing"]:
+			client.wfile.write(("State: %s\n" % (client.mapper.state, )).encode("utf-8"))
+		else:
+			log.warning("Refused 'State' request: Sniffing disabled")
+			client.wfile.write(b"Fail: Sniffing disabled.\n")
+	
+	
+	def _cmd_record(self, client, args):
+		if not Config()["enable_sniffing"]:
+			log.warning("Refused 'Record' request: Sniffing disabled")
+			client.wfile.write(b"Fail: Sniffing disabled.\n")
+			return
+		filename = args.decode("utf-8").strip("\t ")
+		if self.recorder:
+			client.wfile.write(b"Fail: Already recording\n")
+			return
+		try:
+			client.recorder = Recorder(filename)
+		except Exception as e:
+			client.wfile.write(("Fail: %s\n" % (e,)).encode("utf-8"))
+			return
+		with self.lock:
+			self._set_recorder(client.recorder)
+		log.info("Recording input into '%s'", filename)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_stats(self, client, args):
+		if tracer.enabled:
+			for stats in tracer.get_stats():
+				client.wfile.write(("Stats: %s %s %i %i %i %i\n" % stats).encode("utf-8"))
 			with self.lock:
-				try:
-					controller_id = message[11:].strip()
-					for c in self.controllers:
-						if c.get_id() == controller_id:
-							client.mapper = c.get_mapper()
-							client.wfile.write(b"OK.\n")
-							break
-					else:
-						raise Exception("goto fail")
-				except Exception as e:
-					client.wfile.write(b"Fail: no such controller\n")
-		elif message.startswith(b"State."):
-			if Config()["enable_sniffing"]:
-				client.wfile.write(b"State: %s\n" % (str(client.mapper.state), ))
-			else:
-				log.warning("Refused 'State' request: Sniffing disabled")
-				client.wfile.write(b"Fail: Sniffing disabled.\n")
-		elif message.startswith(b"Led:"):
+				# Counters are updated from main thread
+				dropped = tracer.get_dropped()
+			for d in dropped:
+				client.wfile.write(("Dropped: %s %s %i\n" % d).encode("utf-8"))
+			client.wfile.write(b"OK.\n")
+		else:
+			client.wfile.write(b"Fail: Latency tracing disabled.\n")
+	
+	
+	def _cmd_led(self, client, args):
+		try:
+			number = int(args)
+			number = clamp(0, number, 100)
+		except Exception as e:
+			client.wfile.write(("Fail: %s\n" % (e,)).encode("utf-8"))
+			return
+		if client.mapper.get_controller():
+			client.mapper.get_controller().set_led_level(number)
+	
+	
+	def _cmd_observe(self, client, args):
+		if Config()["enable_sniffing"]:
+			to_observe = [ x for x in args.strip(b" \t\r").split(b" ") ]
+			with self.lock:
+				for l in to_observe:
+					client.observe_action(self, SCCDaemon.source_to_constant(l))
+			client.wfile.write(b"OK.\n")
+		else:
+			log.warning("Refused 'Observe' request: Sniffing disabled")
+			client.wfile.write(b"Fail: Sniffing disabled.\n")
+	
+	
+	def _cmd_replace(self, client, args):
+		try:
+			l, actionstr = args.strip(b" \t\r").split(b" ", 1)
+			action = TalkingActionParser().restart(actionstr).parse().compress()
+		except Exception as e:
+			e = str(e).encode("utf-8").decode('unicode_escape').encode("latin1")
+			client.wfile.write(b"Fail: failed to parse: " + e + b"\n")
+			return
+		with self.lock:
 			try:
-				number = int(message[4:])
-				number = clamp(0, number, 100)
-			except Exception as e:
-				client.wfile.write(b"Fail: %s\n" % (e,))
+				if not self._can_lock_action(client.mapper, SCCDaemon.source_to_constant(l)):
+					client.wfile.write(b"Fail: Cannot lock " + l + b"\n")
+					return
+			except ValueError as e:
+				tb = str(traceback.format_exc()).encode("utf-8").decode('unicode_escape').encode("latin1")
+				client.wfile.write(b"Fail: " + tb + b"\n")
 				return
-			if client.mapper.get_controller():
-				client.mapper.get_controller().set_led_level(number)
-		elif message.startswith(b"Observe:"):
-			if Config()["enable_sniffing"]:
-				to_observe = [ x for x in message.split(b":", 1)[1].strip(b" \t\r").split(b" ") ]
-				with self.lock:
-					for l in to_observe:
-						client.observe_action(self, SCCDaemon.source_to_constant(l))
-					client.wfile.write(b"OK.\n")
-			else:
-				log.warning("Refused 'Observe' request: Sniffing disabled")
-				client.wfile.write(b"Fail: Sniffing disabled.\n")
-		elif message.startswith(b"Replace:"):
+			client.replace_action(self, SCCDaemon.source_to_constant(l), action)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_lock(self, client, args):
+		to_lock = [ x for x in args.strip(b" \t\r").split(b" ") ]
+		with self.lock:
 			try:
-				l, actionstr = message.split(b":", 1)[1].strip(b" \t\r").split(b" ", 1)
-				action = TalkingActionParser().restart(actionstr).parse().compress()
-			except Exception as e:
-				e = str(e).encode("utf-8").decode('unicode_escape').encode("latin1")
-				client.wfile.write(b"Fail: failed to parse: " + e + b"\n")
-				return
-			with self.lock:
-				try:
+				for l in to_lock:
 					if not self._can_lock_action(client.mapper, SCCDaemon.source_to_constant(l)):
-						client.wfile.write(b"Fail: Cannot lock " + l.encode("utf-8") + b"\n")
+						client.wfile.write(b"Fail: Cannot lock " + l + b"\n")
 						return
-				except ValueError as e:
-					tb = str(traceback.format_exc()).encode("utf-8").decode('unicode_escape').encode("latin1")
-					client.wfile.write(b"Fail: " + tb + b"\n")
-					return
-				client.replace_action(self, SCCDaemon.source_to_constant(l), action)
-				client.wfile.write(b"OK.\n")
-		elif message.startswith(b"Lock:"):
-			to_lock = [ x for x in message.split(b":", 1)[1].strip(b" \t\r").split(b" ") ]
-			with self.lock:
-				try:
-					for l in to_lock:
-						if not self._can_lock_action(client.mapper, SCCDaemon.source_to_constant(l)):
-							client.wfile.write(b"Fail: Cannot lock " + l.encode("utf-8") + b"\n")
-							return
-				except ValueError as e:
-					tb = str(traceback.format_exc()).encode("utf-8").decode('unicode_escape').encode("latin1")
-					client.wfile.write(b"Fail: " + tb + b"\n")
-					return
-				for l in to_lock:
-					client.lock_action(self, SCCDaemon.source_to_constant(l))
-				client.wfile.write(b"OK.\n")
-		elif message.startswith(b"Unlock."):
-			with self.lock:
-				client.unlock_actions(self)
-				client.wfile.write(b"OK.\n")
-		elif message.startswith(b"Reconfigure."):
-			with self.lock:
-				# Load config
-				cfg = Config()
-				# Reconfigure connected controllers
-				for c in self.controllers:
-					c.apply_config(cfg.get_controller_config(c.get_id()))
-				# Start or stop scc-autoswitch-daemon as needed
-				need_autoswitch_daemon = len(cfg["autoswitch"]) > 0
-				if need_autoswitch_daemon and self.xdisplay and not self.autoswitch_daemon:
-					self.subprocs.append(Subprocess("scc-autoswitch-daemon", True))
-				elif not need_autoswitch_daemon and self.autoswitch_daemon:
-					self._remove_subproccess("scc-autoswitch-daemon")
-					self.autoswitch_daemon.close()
-					self.autoswitch_daemon = None
-				# Respond
-				try:
-					client.wfile.write(b"OK.\n")
-					self._send_to_all("Reconfigured.\n".encode("utf-8"))
-				except:
-					pass
-		elif message.startswith(b"Rescan."):
-			cbs = []
-			with self.lock:
-				cbs += self.rescan_cbs
-				# Respond first
-				try:
-					client.wfile.write(b"OK.\n")
-				except:
-					pass
-			# Do stuff later
-			# (this cannot be done while self.lock is held, as creating new
-			# controller would create race condition)
-			for cb in self.rescan_cbs:
-				try:
-					cb()
-				except Exception as e:
-					log.exception(e)
-			# dev_monitor rescan has to be last to run
+			except ValueError as e:
+				tb = str(traceback.format_exc()).encode("utf-8").decode('unicode_escape').encode("latin1")
+				client.wfile.write(b"Fail: " + tb + b"\n")
+				return
+			for l in to_lock:
+				client.lock_action(self, SCCDaemon.source_to_constant(l))
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_event_format(self, client, args):
+		format = args.strip(b"\t\r ")
+		if format == b"binary":
+			client.event_slots = {}
+			client.wfile.write(b"OK.\n")
+		elif format == b"text":
+			client.event_slots = None
+			client.wfile.write(b"OK.\n")
+		else:
+			client.wfile.write(b"Fail: Unknown event format\n")
+	
+	
+	def _cmd_unlock(self, client, args):
+		with self.lock:
+			client.unlock_actions(self)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_reconfigure(self, client, args):
+		# Reloading calls _on_config_changed, which takes self.lock.
+		# This has to be only place where daemon reloads config.
+		Config().reload()
+		client.wfile.write(b"OK.\n")
+		self._send_to_all("Reconfigured.\n".encode("utf-8"))
+	
+	
+	def _on_config_changed(self, cfg):
+		""" Called every time when config file is reloaded """
+		# Reconfigure connected controllers
+		with self.lock:
+			for c in self.controllers:
+				self._apply_controller_config(c, cfg)
+		tracer.enabled = cfg["latency_tracing"]
+		# Start or stop scc-autoswitch-daemon as needed
+		need_autoswitch_daemon = len(cfg["autoswitch"]) > 0
+		if need_autoswitch_daemon and self.xdisplay and not self.autoswitch_daemon:
+			self.subprocs.append(Subprocess("scc-autoswitch-daemon", True))
+		elif not need_autoswitch_daemon and self.autoswitch_daemon:
+			self._remove_subproccess("scc-autoswitch-daemon")
+			self.autoswitch_daemon.close()
+			self.autoswitch_daemon = None
+	
+	
+	def _cmd_rescan(self, client, args):
+		# Respond first
+		client.wfile.write(b"OK.\n")
+		for cb in self.rescan_cbs:
 			try:
-				self.dev_monitor.rescan()
+				cb()
 			except Exception as e:
 				log.exception(e)
-
-		elif message.startswith(b"Turnoff."):
-			to_turn_off = []
-			with self.lock:
-				if client.mapper.get_controller():
-					to_turn_off.append(client.mapper.get_controller())
-				else:
-					to_turn_off += [ c for c in self.controllers ]
-			for c in to_turn_off:
-				c.turnoff()
-			client.wfile.write(b"OK.\n")
-		elif message.startswith(b"Gesture:"):
+		# dev_monitor rescan has to be last to run
+		try:
+			self.dev_monitor.rescan()
+		except Exception as e:
+			log.exception(e)
+	
+	
+	def _cmd_turnoff(self, client, args):
+		if client.mapper.get_controller():
+			to_turn_off = [ client.mapper.get_controller() ]
+		else:
+			to_turn_off = [ c for c in self.controllers ]
+		for c in to_turn_off:
+			c.turnoff()
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_gesture(self, client, args):
+		try:
+			what, up_angle = args.decode("utf-8").strip().split(" ", 2)
+			up_angle = int(up_angle)
+		except Exception as  e:
+			tb = str(traceback.format_exc()).encode("utf-8").decode('unicode_escape').encode("latin1")
+			client.wfile.write(b"Fail: " + tb + b"\n")
+			return
+		with self.lock:
+			client.request_gesture(self, what, up_angle)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_restart(self, client, args):
+		self.on_sa_restart()
+	
+	
+	def _cmd_gestured(self, client, args):
+		gstr = args.decode("utf-8").strip()
+		client.gesture_action.gesture(client.mapper, gstr)
+		client.wfile.write(b"OK.\n")
+	
+	
+	def _cmd_selected(self, client, args):
+		menuaction = None
+		def press(mapper):
 			try:
-				what, up_angle = message[8:].strip().split(b" ", 2)
-				up_angle = int(up_angle)
-			except Exception as  e:
-				tb = str(traceback.format_exc()).encode("utf-8").decode('unicode_escape').encode("latin1")
-				client.wfile.write(b"Fail: " + tb + b"\n")
-				return
-			with self.lock:
-				client.request_gesture(self, what, up_angle)
-				client.wfile.write(b"OK.\n")
-		elif message.startswith(b"Restart."):
-			self.on_sa_restart()
-		elif message.startswith(b"Gestured:"):
-			gstr = message[9:].strip()
-			client.gesture_action.gesture(client.mapper, gstr)
-			with self.lock:
-				client.wfile.write(b"OK.\n")
-		elif message.startswith(b"Selected:"):
-			menuaction = None
-			def press(mapper):
-				try:
-					menuaction.button_press(mapper)
-					client.mapper.schedule(0.1, release)
-				except Exception as e:
-					log.error("Error while processing menu action")
-					log.exception(e)
-			def release(mapper):
-				try:
-					menuaction.button_release(mapper)
-				except Exception as e:
-					log.error("Error while processing menu action")
-					log.exception(e)
-			
-			with self.lock:
-				try:
-					#menu_id, item_id = shsplit(message)[1:]
-					#print(message)
-					tmp = shsplit(str(message, "utf-8"))
-					menu_id, item_id = tmp[1:]
-					menuaction = None
-					if menu_id in (None, "None"):
-						menuaction = self.osd_ids[item_id]
-					elif "." in menu_id:
-						# TODO: Move this common place
-						data = json.loads(open(menu_id, "r").read())
-						menudata = MenuData.from_json_data(data, TalkingActionParser())
-						menuaction = menudata.get_by_id(item_id).action
-					else:
-						menuaction = client.mapper.profile.menus[menu_id].get_by_id(item_id).action
-					client.wfile.write(b"OK.\n")
-				except:
-					log.warning("Selected menu item is no longer valid.")
-					client.wfile.write(b"Fail: Selected menu item is no longer valid\n")
-				if menuaction:
-					client.mapper.schedule(0, press)
-		elif message.startswith(b"Register:"):
-			with self.lock:
-				if message.strip().endswith(b"osd"):
-					if self.osd_daemon: self.osd_daemon.close()
-					self.osd_daemon = client
-					log.info("Registered scc-osd-daemon")
-				elif message.strip().endswith(b"autoswitch"):
-					if self.autoswitch_daemon: self.autoswitch_daemon.close()
-					self.autoswitch_daemon = client
-					log.info("Registered scc-autoswitch-daemon")
+				menuaction.button_press(mapper)
+				self.scheduler.schedule(0.1, release, mapper)
+			except Exception as e:
+				log.error("Error while processing menu action")
+				log.exception(e)
+		def release(mapper):
+			try:
+				menuaction.button_release(mapper)
+			except Exception as e:
+				log.error("Error while processing menu action")
+				log.exception(e)
+		
+		with self.lock:
+			try:
+				menu_id, item_id = shsplit(str(args, "utf-8"))
+				menuaction = None
+				if menu_id in (None, "None"):
+					menuaction = self.osd_ids[item_id]
+				elif "." in menu_id:
+					menuaction = self._get_menu(menu_id).get_by_id(item_id).action
+				else:
+					menuaction = client.mapper.profile.menus[menu_id].get_by_id(item_id).action
 				client.wfile.write(b"OK.\n")
-		else:
-			client.wfile.write(b"Fail: Unknown command\n")
+			except:
+				log.warning("Selected menu item is no longer valid.")
+				client.wfile.write(b"Fail: Selected menu item is no longer valid\n")
+			if menuaction:
+				# Not owned by mapper, so release is not lost if profile
+				# is changed by selected item
+				self.scheduler.schedule(0, press, client.mapper)
+	
+	
+	def _get_menu(self, filename):
+		"""
+		Returns MenuData loaded from menu file. Parsed menus are cached
+		until file is changed, so selecting item doesn't stall mainloop
+		by parsing same file every time.
+		"""
+		st = os.stat(filename)
+		key = st.st_mtime_ns, st.st_size
+		cached = self.menu_cache.get(filename)
+		if cached is None or cached[0] != key:
+			with open(filename, "r") as f:
+				data = json.loads(f.read())
+			cached = key, MenuData.from_json_data(data, TalkingActionParser())
+			self.menu_cache[filename] = cached
+		return cached[1]
+	
+	
+	def _cmd_register(self, client, args):
+		if args.strip().endswith(b"osd"):
+			if self.osd_daemon: self.osd_daemon.close()
+			self.osd_daemon = client
+			log.info("Registered scc-osd-daemon")
+		elif args.strip().endswith(b"autoswitch"):
+			if self.autoswitch_daemon: self.autoswitch_daemon.close()
+			self.autoswitch_daemon = client
+			log.info("Registered scc-autoswitch-daemon")
+		client.wfile.write(b"OK.\n")
 	
 	
 	def _remove_subproccess(self, binary_name):
@@ -1078,6 +1380,7 @@ class SCCDaemon(Daemon):
 			mapper.profile.pads[what] = a
 		else:
 			raise ValueError("Unknown source: %s" % (what,))
+		mapper.profile_changed()
 	
 	
 	@staticmethod
@@ -1102,7 +1405,8 @@ class SCCDaemon(Daemon):
 	
 	
 	def _remove_socket(self):
-		self.sserver.shutdown()
+		self.poller.unregister(self.sserver.fileno())
+		self.sserver.close()
 		if os.path.exists(self.socket_file):
 			os.unlink(self.socket_file)
 		log.debug("Control socket removed")
@@ -1120,13 +1424,16 @@ class SCCDaemon(Daemon):
 
 
 class Client(object):
-	def __init__(self, connection, mapper, rfile, wfile):
+	def __init__(self, connection, mapper, wfile):
 		self.connection = connection
-		self.rfile = rfile
 		self.wfile = wfile
+		self.buffer = b""			# Received, but not yet handled data
 		self.mapper = mapper
 		self.gesture_action = None
 		self.locked_actions = {}
+		self.recorder = None
+		self.event_slots = None		# Set to dict when binary events are used
+		self.first_old = {}			# Old trigger positions of queued events
 	
 	
 	def close(self):
@@ -1137,6 +1444,33 @@ class Client(object):
 			pass
 	
 	
+	def send_event(self, controller, source, values, coalesce=False, keep_old=False):
+		"""
+		Queues event from locked or observed source to be sent to client.
+		With 'coalesce' set, event replaces previous event from same source
+		that was not sent yet.
+		With 'keep_old' set as well, second value is treated as old position
+		and merged event carries old position of first replaced event.
+		"""
+		key = controller.get_id(), source
+		if keep_old:
+			if coalesce and self.wfile.is_queued(key):
+				values = values[0], self.first_old[key]
+			else:
+				self.first_old[key] = values[1]
+		if self.event_slots is None:
+			data = ("Event: %s %s %s\n" % (key[0], source,
+				" ".join([ str(x) for x in values ]))).encode("utf-8")
+		else:
+			if key not in self.event_slots:
+				self.event_slots[key] = len(self.event_slots)
+				self.wfile.write(("Event source: %s %s %s\n" % (
+					self.event_slots[key], key[0], source)).encode("utf-8"))
+			data = EVENT.pack(EVENT_MARKER, len(values), self.event_slots[key],
+				*[ int(x) for x in (list(values) + [ 0, 0 ])[0:2] ])
+		self.wfile.queue(data, key if coalesce else None)
+	
+	
 	def request_gesture(self, daemon, what, up_angle):
 		"""
 		Handler used when client requested gesture detection with
@@ -1147,7 +1481,7 @@ class Client(object):
 		def cb(gesture):
 			# Called while lock is being held
 			try:
-				self.wfile.write(b"Gesture: %s %s\n" % (what, gesture))
+				self.wfile.write(("Gesture: %s %s\n" % (what, gesture)).encode("utf-8"))
 			except:
 				pass
 		
@@ -1238,36 +1572,18 @@ class ReportingAction(Action):
 	__str__ = __repr__
 	
 	
-	def _report(self, message):
-		try:
-			self.client.wfile.write(message.encode("utf-8"))
-		except Exception as e:
-			# May fail when client dies
-			self.client.rfile.close()
-			self.client.wfile.close()
-	
-	
 	def trigger(self, mapper, position, old_position):
 		if mapper.get_controller():
-			self._report("Event: %s %s %s %s\n" % (
-				mapper.get_controller().get_id(),
-				nameof(self.what), position, old_position
-			))
+			self.client.send_event(mapper.get_controller(), nameof(self.what),
+				( position, old_position ), coalesce=True, keep_old=True)
 	
 	
 	def button_press(self, mapper, number=1):
 		if mapper.get_controller():
 			if self.what == SCButtons.STICKPRESS:
-				self._report("Event: %s STICKPRESS %s\n" % (
-					mapper.get_controller().get_id(),
-					number
-				))
+				self.client.send_event(mapper.get_controller(), "STICKPRESS", ( number, ))
 			else:
-				self._report("Event: %s %s %s\n" % (
-					mapper.get_controller().get_id(),
-					nameof(self.what),
-					number
-				))
+				self.client.send_event(mapper.get_controller(), nameof(self.what), ( number, ))
 	
 	
 	def button_release(self, mapper):
@@ -1281,10 +1597,8 @@ class ReportingAction(Action):
 							or abs(y - self.old_pos[1] > min_difference)):
 			self.old_pos = x, y
 			if mapper.get_controller():
-				self._report("Event: %s %s %s %s\n" % (
-					mapper.get_controller().get_id(),
-					what, x, y
-				))
+				self.client.send_event(mapper.get_controller(), what,
+					( x, y ), coalesce=True)
 
 
 class LockedAction(ReportingAction):
@@ -1401,6 +1715,64 @@ class ObservingAction(ReportingAction):
 		self.original_action.whole(mapper, x, y, what)
 
 
+class ProfileLoader(object):
+	"""
+	Loads profiles in background thread, so parsing doesn't block mainloop.
+	Loaded profile is handed back to mainloop, which calls callback
+	at start of next iteration.
+	"""
+	
+	def __init__(self, daemon):
+		self.daemon = daemon
+		self._requests = queue.Queue()
+		self._lock = threading.Lock()
+		self._loaded = []
+		self._thread = None
+	
+	
+	def load(self, filename, callback):
+		"""
+		Requests profile to be loaded. callback(profile, error) is called
+		from mainloop when done. On failure, profile is None and error is
+		formatted traceback.
+		"""
+		if self._thread is None:
+			self._thread = threading.Thread(target=self._threaded)
+			self._thread.daemon = True
+			self._thread.start()
+		self._requests.put(( filename, callback ))
+	
+	
+	def _threaded(self):
+		lru = self.daemon.profile_lru
+		while True:
+			filename, callback = self._requests.get()
+			profile, error = None, None
+			try:
+				profile = lru.get(filename, Profile(TalkingActionParser()))
+				if profile is None:
+					profile = lru.load(filename, Profile(TalkingActionParser()))
+					log.debug("Profile cache: %s hits, %s misses", *profile_cache.get_stats())
+			except Exception:
+				error = traceback.format_exc()
+			with self._lock:
+				self._loaded.append(( callback, profile, error ))
+			self.daemon.poller.wakeup()
+	
+	
+	def switch_loaded(self):
+		""" Called from mainloop """
+		if not self._loaded:
+			return
+		with self._lock:
+			loaded, self._loaded = self._loaded, []
+		for callback, profile, error in loaded:
+			try:
+				callback(profile, error)
+			except Exception as e:
+				log.exception(e)
+
+
 class Subprocess(object):
 	"""
 	Part of scc-daemon executed as another process, killed along with scc-daemon.
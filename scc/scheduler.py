@@ -7,83 +7,227 @@ Runs in SCCDaemon's (single-threaded) mainloop. That means all callbacks are
 also called on main thread.
 
 Use schedule(delay, callback, *data) to register one-time task.
+
+Tasks are kept in binary heap. Canceling task only marks it as canceled and
+it's thrown away once it gets on top of heap, so both scheduling and
+canceling is cheap. New tasks are first put into inbox deque that is drained
+by main thread.
+
+Scheduling and canceling is safe from any thread, as all bookkeeping is
+done with lock held; callbacks are called without it. Task scheduled from
+thread other than one that created scheduler is timed from current time
+instead of time of last mainloop wakeup and wakes up mainloop using
+'wakeup' function passed to constructor.
 """
-import time, queue, logging
+from collections import deque
+import time, heapq, itertools, threading, logging
 log = logging.getLogger("Scheduler")
 
-# TODO: Maybe create actual thread for this? Use poler? Scrap everything and rewrite it in GO?
 
 class Scheduler(object):
+	# Task executed later than this (in seconds) is counted as late
+	LATE_THRESHOLD = 0.005
+	# Heap is rebuilt once there is more than this many canceled tasks
+	# and those are taking more than half of it
+	COMPACT_THRESHOLD = 64
 	
-	def __init__(self):
-		self._scheduled = queue.PriorityQueue()
-		self._next = None
+	def __init__(self, wakeup=None):
+		self._wakeup = wakeup
+		self._thread = threading.get_ident()
+		self._lock = threading.Lock()
+		self._heap = []
+		self._inbox = deque()
+		self._owned = {}
+		self._seq = itertools.count()
+		self._canceled = 0
 		self._now = time.time()
+		# Counters, see get_stats
+		self._executed = 0
+		self._late = 0
+		self._max_late = 0.0
+		self._max_depth = 0
 	
 	
-	def schedule(self, delay, callback, *data):
+	def schedule(self, delay, callback, *data, owner=None):
 		"""
 		Schedules one-time task to be executed no sooner than after 'delay' of
 		seconds. Delay may be float number.
 		'callback' is called as callback(*data).
 		
+		If 'owner' is set, task can be canceled along with every other
+		task of same owner using cancel_owned method.
+		
 		Returned Task instance can be used to cancel task once scheduled.
 		"""
-		task = Task(self._now + delay, callback, data)
-		if self._next is None or task.time < self._next.time:
-			if self._next:
-				self._scheduled.put(self._next)
-			self._next = task
-		else:
-			self._scheduled.put(task)
+		main_thread = threading.get_ident() == self._thread
+		now = self._now if main_thread else time.time()
+		task = Task(self, now + delay, callback, data, owner)
+		with self._lock:
+			if owner is not None:
+				owned = self._owned.get(owner)
+				if owned is None:
+					owned = self._owned[owner] = set()
+				owned.add(task)
+			self._inbox.append(task)
+		if not main_thread and self._wakeup is not None:
+			# Mainloop may be sleeping with timeout computed before task
+			# was scheduled
+			self._wakeup()
 		return task
 	
 	
 	def cancel_task(self, task):
 		"""
 		Returns True if task was sucessfully removed or False if task was
-		already executed or not known at all.
+		already executed, canceled or not known at all.
 		
-		Note that this is slow as hell and completly thread-unsafe,
-		so it _has_ to be called on main thread.
+		Task is not removed from queue immediately, only marked as canceled.
 		"""
-		if task == self._next:
-			self._next = None if self._scheduled.empty() else self._scheduled.get()
+		with self._lock:
+			if task.canceled or task.executed:
+				return False
+			task.canceled = True
+			self._canceled += 1
+			if task.owner is not None:
+				owned = self._owned.get(task.owner)
+				if owned is not None:
+					owned.discard(task)
 			return True
-		# Fun part: All tasks are removed from PriorityQueue
-		# until correct is found. Then everything is put back
-		tasks, found = [], False
-		while not self._scheduled.empty():
-			t = self._scheduled.get()
-			if t == task:
-				found = True
-				break
-			tasks.append(t)
-		for t in tasks:
-			self._scheduled.put(t)
-		return found
 	
 	
-	def run(self):
+	def cancel_owned(self, owner):
+		"""
+		Cancels all not yet executed tasks scheduled with specified owner.
+		Returns number of canceled tasks.
+		"""
+		with self._lock:
+			owned = self._owned.pop(owner, None)
+			if not owned:
+				return 0
+			count = 0
+			for task in owned:
+				if not task.canceled and not task.executed:
+					task.canceled = True
+					count += 1
+			self._canceled += count
+			return count
+	
+	
+	def _drain_inbox(self):
+		""" Moves tasks scheduled since last run into heap. Has to be called with lock held """
+		while self._inbox:
+			task = self._inbox.popleft()
+			heapq.heappush(self._heap, (task.time, next(self._seq), task))
+		if len(self._heap) > self._max_depth:
+			self._max_depth = len(self._heap)
+		if self._canceled > Scheduler.COMPACT_THRESHOLD and self._canceled * 2 > len(self._heap):
+			self._heap = [ x for x in self._heap if not x[2].canceled ]
+			heapq.heapify(self._heap)
+			self._canceled = 0
+	
+	
+	def _next_task(self):
+		""" Returns first task that is not canceled or None. Has to be called with lock held """
+		heap = self._heap
+		while heap and heap[0][2].canceled:
+			heapq.heappop(heap)
+			self._canceled -= 1
+		return heap[0][2] if heap else None
+	
+	
+	def update_time(self):
+		"""
+		Updates time used as base for newly scheduled tasks.
+		Called by daemon after its mainloop wakes up from sleep.
+		"""
 		self._now = time.time()
-		while self._next and self._now >= self._next.time:
-			callback, data = self._next.callback, self._next.data
-			self._next = None if self._scheduled.empty() else self._scheduled.get()
-			callback(*data)
+	
+	
+	def get_timeout(self):
+		"""
+		Returns number of seconds until next task should be executed, 0 if
+		there is task that should be executed already or None if there is
+		nothing scheduled.
+		
+		Used by daemon mainloop to determine how long it can sleep.
+		"""
+		with self._lock:
+			self._drain_inbox()
+			task = self._next_task()
+		if task is None:
+			return None
+		return max(0.0, task.time - time.time())
+	
+	
+	def run(self):
+		"""
+		Executes all tasks that are due.
+		Returns True if at least one task was executed.
+		"""
+		self._now = now = time.time()
+		rv = False
+		while True:
+			with self._lock:
+				# Callback may have scheduled another task that is due already
+				self._drain_inbox()
+				task = self._next_task()
+				if task is None or task.time > now:
+					break
+				heapq.heappop(self._heap)
+				task.executed = True
+				if task.owner is not None:
+					owned = self._owned.get(task.owner)
+					if owned is not None:
+						owned.discard(task)
+						if not owned:
+							del self._owned[task.owner]
+				late = now - task.time
+				if late > Scheduler.LATE_THRESHOLD:
+					self._late += 1
+					self._max_late = max(self._max_late, late)
+				self._executed += 1
+			task.callback(*task.data)
+			rv = True
+		return rv
+	
+	
+	def get_stats(self):
+		"""
+		Returns dict with counters describing scheduler state:
+		 - depth		number of tasks waiting to be executed
+		 - max_depth	maximum size of queue since scheduler was created
+		 - executed		number of executed tasks
+		 - late			number of tasks executed later than LATE_THRESHOLD
+		 - max_late		biggest delay of late task, in seconds
+		"""
+		with self._lock:
+			return {
+				"depth" : len(self._inbox) + len(self._heap) - self._canceled,
+				"max_depth" : self._max_depth,
+				"executed" : self._executed,
+				"late" : self._late,
+				"max_late" : self._max_late,
+			}
 
 
 class Task(object):
+	__slots__ = ("scheduler", "time", "callback", "data", "owner",
+		"canceled", "executed")
 	
-	def __init__(self, time, callback, data):
+	def __init__(self, scheduler, time, callback, data, owner=None):
+		self.scheduler = scheduler
 		self.time = time
 		self.callback = callback
 		self.data = data
+		self.owner = owner
+		self.canceled = False
+		self.executed = False
 	
 	
 	def cancel(self):
 		""" Marks task as canceled, without actually removing it from scheduler """
-		self.callback = lambda *a, **b: False
-		self.data = ()
-
+		return self.scheduler.cancel_task(self)
+	
+	
 	def __lt__(self, other):
-		self.time < other.time
+		return self.time < other.time
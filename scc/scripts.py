@@ -170,6 +170,149 @@ def cmd_info(argv0, argv):
 	return 0
 
 
+def cmd_stats(argv0, argv):
+	"""
+	Displays input latency statistics
+
+	Prints how long it takes to turn input from controller into emulated
+	events. Requires 'latency_tracing' to be enabled in config file.
+	All times are in microseconds. Messages dropped by devices since
+	last check are listed as well.
+	"""
+	s = connect_to_daemon()
+	if s is None: return -1
+	print("Stats.", file=s)
+	s.flush()
+	fmt = "%-20s %-6s %8s %8s %8s %8s"
+	print(fmt % ("Controller", "Stage", "Count", "p50", "p99", "max"))
+	while True:
+		line = s.readline()
+		if len(line) == 0:
+			print("Connection closed", file=sys.stderr)
+			return 1
+		line = line.strip("\r\n\t ")
+		if line == "OK.":
+			break
+		elif line.startswith("Fail:"):
+			print(line, file=sys.stderr)
+			return 1
+		elif line.startswith("Stats:"):
+			print(fmt % tuple(line.split(" ")[1:]))
+		elif line.startswith("Dropped:"):
+			source, what, count = line.split(" ")[1:]
+			print("%s: %s %s message(s) dropped since last check" % (source, count, what))
+	return 0
+
+
+def cmd_record(argv0, argv):
+	"""
+	Records controller inputs into file
+
+	Records every input received by daemon until interrupted by Ctrl+C.
+	Requires 'enable_sniffing' to be enabled in config file.
+	Recorded file can be replayed with 'scc replay'.
+
+	Usage: scc record filename
+	"""
+	if len(argv) != 1:
+		raise InvalidArguments()
+	s = connect_to_daemon()
+	if s is None: return -1
+	# Path is opened by daemon, which may run in different directory
+	print("Record: %s" % (os.path.abspath(argv[0]),), file=s)
+	if not check_error(s): return 1
+	print("Recording, press Ctrl+C to stop...", file=sys.stderr)
+	try:
+		while len(s.readline()) > 0:
+			pass
+	finally:
+		s.close()
+	print("Connection closed", file=sys.stderr)
+	return 1
+
+
+def cmd_replay(argv0, argv):
+	"""
+	Replays recorded controller inputs
+
+	Passes inputs recorded by 'scc record' through given profile, without
+	creating any virtual device, then prints how fast it was done and
+	digest of generated events.
+
+	Usage: scc replay [-r] [-o file] [-c file] recording "profile name"
+
+	Arguments:
+	  -r        Replay in real time instead of as fast as possible
+	  -o file   Save generated events into file
+	  -c file   Compare generated events with ones saved using -o
+
+	Return codes:
+	  0 - normal exit
+	  1 - invalid arguments or other error
+	  2 - generated events differ from ones in file given by -c
+	"""
+	from scc.replay import Replayer, load_recording
+	from scc.parser import ActionParser
+	from scc.tools import find_profile
+	from scc.profile import Profile
+
+	realtime, output, golden, args = False, None, None, []
+	argv = list(argv)
+	while len(argv):
+		x = argv.pop(0)
+		if x == "-r":
+			realtime = True
+		elif x in ("-o", "-c") and len(argv):
+			if x == "-o":
+				output = argv.pop(0)
+			else:
+				golden = argv.pop(0)
+		else:
+			args.append(x)
+	if len(args) != 2:
+		raise InvalidArguments()
+
+	profile_file = args[1] if os.path.exists(args[1]) else find_profile(args[1])
+	if profile_file is None:
+		print("Unknown profile:", args[1], file=sys.stderr)
+		return 1
+	try:
+		records = load_recording(args[0])
+		profile = Profile(ActionParser()).load(profile_file)
+	except Exception as e:
+		print(e, file=sys.stderr)
+		return 1
+
+	replayer = Replayer(profile)
+	stats = replayer.replay(records, realtime=realtime)
+	h = stats.histogram
+	print("Reports:     %s" % (stats.count,))
+	print("Time:        %.3fs" % (stats.wall_time,))
+	print("Throughput:  %.1f reports/s" % (stats.get_throughput(),))
+	print("CPU/report:  %.1fus" % (stats.get_cpu_per_report(),))
+	print("p50/p99/max: %.1fus %.1fus %.1fus" % (
+		h.percentile(50), h.percentile(99), h.max))
+	print("Events:      %s" % (len(replayer.events),))
+	print("Digest:      %s" % (replayer.get_digest(),))
+
+	lines = replayer.dump()
+	if output:
+		with open(output, "w") as f:
+			f.write("".join([ "%s\n" % (x,) for x in lines ]))
+	if golden:
+		expected = open(golden, "r").read().split("\n")[:-1]
+		for i in range(max(len(lines), len(expected))):
+			a = lines[i] if i < len(lines) else "(nothing)"
+			b = expected[i] if i < len(expected) else "(nothing)"
+			if a != b:
+				print("Output differs from %s at event %s:" % (golden, i + 1), file=sys.stderr)
+				print(" expected: %s" % (b,), file=sys.stderr)
+				print(" got:      %s" % (a,), file=sys.stderr)
+				return 2
+		print("Output matches %s" % (golden,))
+	return 0
+
+
 def cmd_dependency_check(argv0, argv):
 	""" Checks if all required libraries are installed on this system """
 	try:
@@ -642,6 +642,8 @@ class GesturesAction(Action, OSDEnabledAction, SpecialAction):
 		Action.__init__(self, *stuff)
 		self.gestures = {}
 		self.precision = self.DEFAULT_PRECISION
+		self._release_task = None
+		self._pressed = None
 		gstr = None
 		
 		if len(stuff) > 0 and type(stuff[0]) in (int, float):
@@ -745,8 +747,20 @@ class GesturesAction(Action, OSDEnabledAction, SpecialAction):
 	def gesture(self, mapper, gesture_string):
 		action = self.find_gesture_action(gesture_string)
 		if action:
+			self.cancel(mapper)
 			action.button_press(mapper)
-			mapper.schedule(0, action.button_release)
+			self._pressed = action
+			self._release_task = mapper.schedule(0, self._release)
+
+	def _release(self, mapper):
+		action, self._pressed, self._release_task = self._pressed, None, None
+		action.button_release(mapper)
+
+	def cancel(self, mapper):
+		if self._release_task:
+			# Gesture action is still pressed
+			mapper.cancel_task(self._release_task)
+			self._release(mapper)
 
 	def whole(self, mapper, x, y, what):
 		if (x, y) != (0, 0):
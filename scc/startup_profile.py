@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+SC-Controller - Startup profiling
+
+Optional measuring of how long it takes to import every module and, for
+OSD windows, how long it takes until first frame is drawn.
+
+Enabled by --profile-startup argument accepted by every entry point. Option
+is passed to child processes in SCC_PROFILE_STARTUP environment variable,
+so scc-osd-daemon and scc-autoswitch-daemon started by profiled scc-daemon
+are profiled as well.
+
+Times are counted from moment when entry point called init(), what is done
+before anything else is imported. Report is logged when process finishes
+starting (first OSD frame, daemon entering mainloop) or on exit.
+"""
+import os, sys, time, atexit, logging
+log = logging.getLogger("StartupProf")
+
+OPTION = "--profile-startup"
+ENV_VAR = "SCC_PROFILE_STARTUP"
+REPORT_LIMIT = 30		# Number of slowest modules listed in report
+
+
+class _TimingLoader(object):
+	""" Wraps loader found by other finder, timing exec_module calls """
+	
+	def __init__(self, profile, loader):
+		self._profile = profile
+		self._loader = loader
+	
+	
+	def create_module(self, spec):
+		return self._loader.create_module(spec)
+	
+	
+	def exec_module(self, module):
+		self._profile._import_started()
+		try:
+			self._loader.exec_module(module)
+		finally:
+			self._profile._import_finished(module.__name__)
+	
+	
+	def __getattr__(self, name):
+		# get_data, get_filename, is_package and everything else
+		return getattr(self._loader, name)
+
+
+class _TimingFinder(object):
+	""" Meta path finder that finds nothing on its own """
+	
+	def __init__(self, profile):
+		self._profile = profile
+	
+	
+	def find_spec(self, fullname, path, target=None):
+		for finder in sys.meta_path:
+			if finder is self or not hasattr(finder, "find_spec"):
+				continue
+			spec = finder.find_spec(fullname, path, target)
+			if spec is not None:
+				if hasattr(spec.loader, "exec_module"):
+					spec.loader = _TimingLoader(self._profile, spec.loader)
+				return spec
+		return None
+
+
+class StartupProfile(object):
+	
+	def __init__(self):
+		self.enabled = False
+		self._t0 = None
+		self._stack = []			# [ start, time spent in nested imports ]
+		self._imports = []			# (name, self time, total time)
+		self._marks = []			# (name, time since start)
+		self._request = None
+		self._reported = False
+		self._parent = False
+	
+	
+	def init(self, argv):
+		"""
+		Called by entry points before anything else is imported.
+		Removes --profile-startup from argv and enables profiling if it
+		was there or if parent process was profiled.
+		"""
+		if OPTION in argv:
+			while OPTION in argv:
+				argv.remove(OPTION)
+			self.enable()
+		elif os.environ.get(ENV_VAR):
+			self.enable()
+	
+	
+	def enable(self):
+		if self.enabled:
+			return
+		self.enabled = True
+		self._t0 = time.perf_counter()
+		# Report is wanted even if process doesn't show INFO messages
+		log.setLevel(logging.INFO)
+		os.environ[ENV_VAR] = "1"
+		sys.meta_path.insert(0, _TimingFinder(self))
+		atexit.register(self._at_exit)
+		os.register_at_fork(after_in_parent=self._forked)
+	
+	
+	def _forked(self):
+		self._parent = True
+	
+	
+	def _at_exit(self):
+		# Parent that exits right after forking, as scc-daemon does while
+		# daemonizing, would only log report of incomplete startup
+		if not self._parent:
+			self.report()
+	
+	
+	def _import_started(self):
+		self._stack.append([ time.perf_counter(), 0.0 ])
+	
+	
+	def _import_finished(self, name):
+		start, nested = self._stack.pop()
+		total = time.perf_counter() - start
+		if self._stack:
+			self._stack[-1][1] += total
+		self._imports.append(( name, total - nested, total ))
+	
+	
+	def mark(self, name, since=None):
+		"""
+		Records time elapsed since start or since 'since', which is
+		value returned by time.perf_counter().
+		"""
+		if self.enabled:
+			t = time.perf_counter() - (self._t0 if since is None else since)
+			self._marks.append(( name, t ))
+	
+	
+	def request_received(self):
+		"""
+		Called by scc-osd-daemon when it's asked to show OSD window, so
+		first frame of that window is measured from this moment and not
+		from start of process.
+		"""
+		if self.enabled:
+			self._request = time.perf_counter()
+	
+	
+	def watch_first_frame(self, window):
+		"""
+		Marks moment when first frame of Gtk window is drawn and logs
+		report, if it wasn't logged already.
+		"""
+		if not self.enabled:
+			return
+		name = "first frame of %s" % (window.__class__.__name__,)
+		since, self._request = self._request, None
+		def on_draw(*a):
+			window.disconnect(handler)
+			self.mark(name, since)
+			if self._reported:
+				log.info("%-40s %8.1fms", name, self._marks[-1][1] * 1000.0)
+			else:
+				self.report()
+			return False
+		handler = window.connect("draw", on_draw)
+	
+	
+	def get_imports(self):
+		"""
+		Returns list of (module, self time, total time) tuples, slowest
+		first, times being in seconds. Total time includes nested imports.
+		"""
+		return sorted(self._imports, key=lambda x: -x[1])
+	
+	
+	def report(self):
+		""" Logs slowest imports and all marks. Done only once """
+		if not self.enabled or self._reported:
+			return
+		self._reported = True
+		imports = self.get_imports()
+		log.info("Imported %s modules in %.1fms", len(imports),
+			sum([ x[1] for x in imports ]) * 1000.0)
+		log.info("%-40s %8s %8s", "module", "self", "total")
+		for name, self_time, total in imports[0:REPORT_LIMIT]:
+			log.info("%-40s %6.1fms %6.1fms", name,
+				self_time * 1000.0, total * 1000.0)
+		for name, t in self._marks:
+			log.info("%-40s %8.1fms", name, t * 1000.0)
+
+
+startup_profile = StartupProfile()
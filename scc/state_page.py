@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+SC-Controller - State Page
+
+Memory-mapped file with last state of one controller, updated by daemon
+for every input report, so client can read it as often as needed without
+asking daemon and so without any syscall after page is opened.
+
+Page starts with sequence number, which writer increments before and
+after it changes anything else. Reader that sees odd number, or number
+changed while it was reading, retries.
+
+Pages are created only while 'enable_sniffing' is enabled.
+"""
+from scc.constants import SCButtons
+from scc.paths import get_runtime_path
+
+import os, mmap, struct, logging
+log = logging.getLogger("StatePage")
+
+FIELDS = ( "buttons", "ltrig", "rtrig", "stick_x", "stick_y",
+	"lpad_x", "lpad_y", "rpad_x", "rpad_y", "cpad_x", "cpad_y",
+	"gpitch", "groll", "gyaw", "q1", "q2", "q3", "q4" )
+# Sequence number, report counter, flags, buttons and rest of FIELDS
+PAGE = struct.Struct("<QQII" + "i" * (len(FIELDS) - 1))
+SEQ = struct.Struct("<Q")
+
+FLAG_LPADTOUCH		= 1 << 0
+FLAG_RPADTOUCH		= 1 << 1
+FLAG_CPADTOUCH		= 1 << 2
+FLAG_GYRO_ENABLED	= 1 << 3
+
+RETRIES = 1000
+
+
+def get_state_page_path(controller_id):
+	"""
+	Returns path to state page of controller.
+	$XDG_RUNTIME_DIR/scc/state-<controller_id> under normal conditions.
+	Page is rewritten with every input report, so it's kept in tmpfs.
+	"""
+	return os.path.join(get_runtime_path(), "state-%s" % (
+		controller_id.replace("/", "_"), ))
+
+
+def get_flags(controller, state):
+	""" Returns FLAG_* bits describing state """
+	buttons = state.buttons
+	flags = 0
+	if buttons & SCButtons.LPADTOUCH: flags |= FLAG_LPADTOUCH
+	if buttons & SCButtons.RPADTOUCH: flags |= FLAG_RPADTOUCH
+	if buttons & SCButtons.CPADTOUCH: flags |= FLAG_CPADTOUCH
+	if controller and controller.get_gyro_enabled():
+		flags |= FLAG_GYRO_ENABLED
+	return flags
+
+
+class StatePage(object):
+	"""
+	Writer side, owned by daemon. File is created when instance is
+	created and removed by close().
+	"""
+	
+	def __init__(self, filename):
+		self.filename = filename
+		os.makedirs(os.path.dirname(filename), 0o700, exist_ok=True)
+		fd = os.open(filename + ".tmp", os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+		try:
+			os.ftruncate(fd, PAGE.size)
+			self._mem = mmap.mmap(fd, PAGE.size)
+		finally:
+			os.close(fd)
+		# Renamed only once it has correct size, so reader never maps
+		# truncated file
+		os.rename(filename + ".tmp", filename)
+		self._seq = 0
+		self._counter = 0
+	
+	
+	def update(self, controller, state):
+		""" Stores state. Called by mapper for every input report """
+		mem, seq = self._mem, self._seq
+		self._counter += 1
+		SEQ.pack_into(mem, 0, seq + 1)
+		PAGE.pack_into(mem, 0, seq + 1, self._counter,
+			get_flags(controller, state),
+			*( getattr(state, x, 0) for x in FIELDS ))
+		SEQ.pack_into(mem, 0, seq + 2)
+		self._seq = seq + 2
+	
+	
+	def close(self):
+		try:
+			os.unlink(self.filename)
+		except OSError:
+			pass
+		self._mem.close()
+
+
+class StatePageReader(object):
+	"""
+	Client side. Raises OSError if page doesn't exists, what usually means
+	that controller is not connected or sniffing is disabled.
+	"""
+	
+	def __init__(self, filename):
+		fd = os.open(filename, os.O_RDONLY)
+		try:
+			self._mem = mmap.mmap(fd, PAGE.size, prot=mmap.PROT_READ)
+		finally:
+			os.close(fd)
+	
+	
+	def read(self):
+		"""
+		Returns (counter, flags, state) tuple, where 'state' is dict with
+		all FIELDS and 'counter' is number of reports received so far.
+		Returns None if consistent copy was not obtained, what may
+		happen only if daemon dies while writing.
+		"""
+		mem = self._mem
+		for i in range(RETRIES):
+			data = PAGE.unpack_from(mem, 0)
+			if data[0] & 1 == 0 and SEQ.unpack_from(mem, 0)[0] == data[0]:
+				return data[1], data[2], dict(zip(FIELDS, data[3:]))
+		return None
+	
+	
+	def close(self):
+		self._mem.close()
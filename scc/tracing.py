@@ -0,0 +1,148 @@
+#!/usr/bin/env python2
+"""
+SC-Controller - Latency tracing
+
+Optional measuring of how long it takes from input report being read from
+device to emulated events being sent out through uinput.
+
+Drivers call tracer.report_received() as soon as report is read, Mapper then
+marks moment when it starts processing input and moment when events are
+synced. Time elapsed since report was received is collected in histogram,
+one for each controller and stage.
+
+Disabled by default, enabled by 'latency_tracing' option in config.
+
+Messages and reports dropped because device or daemon couldn't keep up are
+counted always and reported along with latency statistics.
+"""
+import math, time, logging
+log = logging.getLogger("Tracing")
+
+
+class Histogram(object):
+	"""
+	Logarithmic histogram of durations. Every bucket is 2^(1/8) times wider
+	than previous one, so reported percentiles are off by 9% at most.
+	"""
+	BUCKETS_PER_OCTAVE = 8
+	BUCKET_COUNT = 8 * 24			# Up to 2^24 us (~16s)
+	
+	def __init__(self):
+		self.reset()
+	
+	
+	def reset(self):
+		self.buckets = [ 0 ] * Histogram.BUCKET_COUNT
+		self.count = 0
+		self.max = 0.0
+	
+	
+	def add(self, us):
+		""" Adds sample, in microseconds """
+		if us < 1.0:
+			index = 0
+		else:
+			index = min(Histogram.BUCKET_COUNT - 1,
+				int(math.log(us, 2) * Histogram.BUCKETS_PER_OCTAVE))
+		self.buckets[index] += 1
+		self.count += 1
+		if us > self.max:
+			self.max = us
+	
+	
+	def percentile(self, p):
+		"""
+		Returns upper bound of bucket containing p-th percentile
+		(p being in 0 to 100 range) or 0 if there are no samples.
+		"""
+		if self.count == 0:
+			return 0.0
+		target = self.count * p / 100.0
+		seen = 0
+		for index, c in enumerate(self.buckets):
+			seen += c
+			if c and seen >= target:
+				upper = 2.0 ** (float(index + 1) / Histogram.BUCKETS_PER_OCTAVE)
+				return min(upper, self.max)
+		return self.max
+
+
+class Tracer(object):
+	
+	def __init__(self):
+		self.enabled = False
+		self._t0 = None
+		self._histograms = {}
+		self._dropped = {}
+	
+	
+	def report_received(self, t=None):
+		"""
+		Called by drivers right after input report is read. 't' is time
+		when report was received, if driver knows it better.
+		"""
+		if self.enabled:
+			self._t0 = time.perf_counter() if t is None else t
+	
+	
+	def mark(self, controller, stage):
+		"""
+		Records time elapsed since last report was received.
+		Does nothing if there is no report being processed.
+		"""
+		if self._t0 is None or controller is None:
+			return
+		us = (time.perf_counter() - self._t0) * 1000000.0
+		key = (controller.get_id(), stage)
+		h = self._histograms.get(key)
+		if h is None:
+			h = self._histograms[key] = Histogram()
+		h.add(us)
+	
+	
+	def done(self):
+		"""
+		Called by Mapper once report is processed, so events generated
+		later by scheduled tasks are not counted.
+		"""
+		self._t0 = None
+	
+	
+	def get_stats(self):
+		"""
+		Returns list of (controller_id, stage, count, p50, p99, max) tuples,
+		times being in microseconds.
+		"""
+		rv = []
+		# Copied, as histograms are updated from main thread
+		for (controller_id, stage), h in sorted(list(self._histograms.items())):
+			rv.append(( controller_id, stage, h.count,
+				h.percentile(50), h.percentile(99), h.max ))
+		return rv
+	
+	
+	def report_dropped(self, source, what):
+		"""
+		Counts message of kind 'what' dropped by 'source', which is
+		usually id of device. Counted even while tracing is disabled.
+		Returns number of such drops since they were last reported.
+		"""
+		key = (source, what)
+		self._dropped[key] = self._dropped.get(key, 0) + 1
+		return self._dropped[key]
+	
+	
+	def get_dropped(self):
+		"""
+		Returns list of (source, what, count) tuples and resets counters,
+		so every drop is reported only once.
+		"""
+		dropped, self._dropped = self._dropped, {}
+		return [ (source, what, count) for (source, what), count in sorted(dropped.items()) ]
+	
+	
+	def reset(self):
+		self._histograms = {}
+
+
+tracer = Tracer()
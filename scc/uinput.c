@@ -34,7 +34,7 @@
 #include <unistd.h>
 
 #pragma GCC diagnostic ignored "-Wunused-result"
-#define UNPUT_MODULE_VERSION 9
+#define UNPUT_MODULE_VERSION 10
 #define MAX_FF_EVENTS 4
 
 #define INFINITE_RUMBLE		10000		// Not really infinite, but longer than controller can handle
@@ -247,6 +247,25 @@ void uinput_syn(int fd)
 	write(fd, &ev, sizeof(ev));
 }
 
+/**
+ * Writes 'count' events buffered by python side with single syscall.
+ * Returns number of events written or -1 on error.
+ */
+int uinput_write_events(int fd, struct input_event* events, int count)
+{
+	ssize_t written;
+	size_t size = (size_t)count * sizeof(struct input_event);
+	size_t done = 0;
+
+	while (done < size) {
+		written = write(fd, (char*)events + done, size - done);
+		if (written < 0)
+			return -1;
+		done += written;
+	}
+	return count;
+}
+
 // #define RUMBLE_DEBUG(...) do { printf(__VA_ARGS__); } while (0)
 #define RUMBLE_DEBUG(...) do { } while (0)
 
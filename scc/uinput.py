@@ -25,28 +25,37 @@
 import os, ctypes, time
 from ctypes import Structure, POINTER, c_bool, c_int16, c_uint16, c_int32, byref
 from math import pi, copysign, sqrt
-from scc.lib.libusb1 import timeval
 from scc.tools import find_library
-from scc.cheader import defines
+from scc.cheader import cached_defines
+from scc.paths import get_cache_path
 from scc.lib import IntEnum
 
-UNPUT_MODULE_VERSION = 9
+UNPUT_MODULE_VERSION = 10
 
-# Get All defines from linux headers
+# Get All defines from linux headers. Parsed values are cached, as this
+# module is imported by nearly every process
+CHEAD_CACHE = os.path.join(get_cache_path(), "input-event-codes.json")
 if os.path.exists('/usr/include/linux/input-event-codes.h'):
-	CHEAD = defines('/usr/include', 'linux/input-event-codes.h')
+	CHEAD = cached_defines('/usr/include', 'linux/input-event-codes.h', CHEAD_CACHE)
 elif os.path.exists(os.path.split(__file__)[0] + '/input-event-codes.h'):
-	CHEAD = defines(os.path.split(__file__)[0], 'input-event-codes.h')
+	CHEAD = cached_defines(os.path.split(__file__)[0], 'input-event-codes.h', CHEAD_CACHE)
 else:
-	CHEAD = defines('/usr/include', 'linux/input.h')
+	CHEAD = cached_defines('/usr/include', 'linux/input.h', CHEAD_CACHE)
 
 MAX_FEEDBACK_EFFECTS = 4
+# Number of events that can be buffered before they are written to device.
+# Buffer is normally flushed by Mapper.sync, once per processed input.
+EVENT_BUFFER_SIZE = 64
+
+# Event types and codes used by UInput, taken from parsed header as well
+EV_SYN, EV_KEY, EV_REL, EV_ABS, EV_MSC = ( CHEAD[x] for x in
+	("EV_SYN", "EV_KEY", "EV_REL", "EV_ABS", "EV_MSC") )
+SYN_REPORT = CHEAD["SYN_REPORT"]
+MSC_SCAN = CHEAD["MSC_SCAN"]
 
 # Keys enum contains all keys and button from linux/uinput.h (KEY_* BTN_*)
 Keys = IntEnum('Keys', {i: CHEAD[i] for i in CHEAD.keys() if (i.startswith('KEY_') or
 															i.startswith('BTN_'))})
-# Keys enum contains all keys and button from linux/uinput.h (KEY_* BTN_*)
-KeysOnly = IntEnum('KeysOnly', {i: CHEAD[i] for i in CHEAD.keys() if i.startswith('KEY_')})
 
 # Axes enum contains all axes from linux/uinput.h (ABS_*)
 Axes = IntEnum('Axes', {i: CHEAD[i] for i in CHEAD.keys() if i.startswith('ABS_')})
@@ -175,6 +184,13 @@ Scans = {
 	Keys.KEY_FORWARD: 0xc00f3,
 }
 
+class timeval(ctypes.Structure):
+	# Same as one in scc.lib.libusb1, which is not imported just for this
+	_fields_ = [
+		('tv_sec', ctypes.c_long),
+		('tv_usec', ctypes.c_long)
+	]
+
 class InputEvent(ctypes.Structure):
 	_fields_ = [
 		('time', timeval),
@@ -218,6 +234,9 @@ class UInput(object):
 		self._r = rels
 
 		self._lib = find_library("libuinput")
+		self._events = (InputEvent * EVENT_BUFFER_SIZE)()
+		self._event_count = 0
+		self._need_syn = False
 		self._ff_events = None
 		if rumble:
 			self._ff_events = (POINTER(FeedbackEvent) * MAX_FEEDBACK_EFFECTS)()
@@ -272,6 +291,32 @@ class UInput(object):
 		return self._fd
 
 
+	def _queue(self, type, code, val):
+		"""
+		Stores event in buffer. Buffered events are written to device
+		by flush(). If buffer is full, it's flushed right away.
+		"""
+		if self._event_count >= EVENT_BUFFER_SIZE:
+			self.flush()
+		ev = self._events[self._event_count]
+		ev.type, ev.code, ev.value = type, code, val
+		self._event_count += 1
+		self._need_syn = True
+
+
+	def flush(self):
+		"""
+		Writes all buffered events to device at once.
+		Returns True if there was anything to write.
+		"""
+		if self._event_count:
+			self._lib.uinput_write_events(self._fd, self._events,
+										  ctypes.c_int(self._event_count))
+			self._event_count = 0
+			return True
+		return False
+
+
 	def keyEvent(self, key, val):
 		"""
 		Generate a key or btn event
@@ -279,9 +324,7 @@ class UInput(object):
 		@param int axis		 key or btn event (KEY_* or BTN_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_key(self._fd,
-							 ctypes.c_uint16(key),
-							 ctypes.c_int32(val))
+		self._queue(EV_KEY, key, val)
 
 
 	def axisEvent(self, axis, val):
@@ -291,9 +334,7 @@ class UInput(object):
 		@param int axis		 abs event (ABS_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_abs(self._fd,
-							 ctypes.c_uint16(axis),
-							 ctypes.c_int32(val))
+		self._queue(EV_ABS, axis, val)
 
 	def relEvent(self, rel, val):
 		"""
@@ -302,9 +343,7 @@ class UInput(object):
 		@param int rel		  rel event (REL_*)
 		@param int val		  event value
 		"""
-		self._lib.uinput_rel(self._fd,
-							 ctypes.c_uint16(rel),
-							 ctypes.c_int32(val))
+		self._queue(EV_REL, rel, val)
 
 	def scanEvent(self, val):
 		"""
@@ -312,14 +351,17 @@ class UInput(object):
 
 		@param int val		  scan event value (scancode)
 		"""
-		self._lib.uinput_scan(self._fd,
-							  ctypes.c_int32(val))
+		self._queue(EV_MSC, MSC_SCAN, val)
 
 	def synEvent(self):
 		"""
-		Generate a syn event
+		Generate a syn event.
+		Event is only buffered, nothing is sent to device until flush().
+		Does nothing if there was no event since last syn.
 		"""
-		self._lib.uinput_syn(self._fd)
+		if self._need_syn:
+			self._queue(EV_SYN, SYN_REPORT, 0)
+			self._need_syn = False
 
 
 	def setDelayPeriod(self, delay, period):
@@ -355,6 +397,7 @@ class UInput(object):
 
 	def __del__(self):
 		if self._lib:
+			self.flush()
 			self._lib.uinput_destroy(self._fd)
 
 
@@ -598,6 +641,9 @@ class Dummy(object):
 	releaseEvent = keyEvent
 	reset = keyEvent
 
+	def flush(self):
+		return False
+
 	def keyManaged(self, ev):
 		return False
 
@@ -608,3 +654,15 @@ class Dummy(object):
 class CannotCreateUInputException(Exception):
 	# Special case when message should be displayed in UI
 	pass
+
+
+def __getattr__(name):
+	"""
+	KeysOnly enum contains all keys from linux/uinput.h (KEY_*).
+	It's used only rarely, so it's created only when asked for.
+	"""
+	if name == "KeysOnly":
+		global KeysOnly
+		KeysOnly = IntEnum('KeysOnly', {i: CHEAD[i] for i in CHEAD.keys() if i.startswith('KEY_')})
+		return KeysOnly
+	raise AttributeError("module %r has no attribute %r" % (__name__, name))
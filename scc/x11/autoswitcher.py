@@ -3,6 +3,9 @@
 SC-Controller - Autoswitch Daemon
 
 Observes active window and commands scc-daemon to change profiles as needed.
+
+Active window and its title are checked only when XServer reports change
+of _NET_ACTIVE_WINDOW property on root window or of title of active window.
 """
 from __future__ import unicode_literals
 from scc.tools import _
@@ -11,23 +14,31 @@ from scc.menu_data import MenuGenerator, MenuItem, Separator, MENU_GENERATORS
 from scc.special_actions import ChangeProfileAction
 from scc.parser import TalkingActionParser
 from scc.paths import get_daemon_socket
+from scc.lib.ahocorasick import Automaton
 from scc.lib import xwrappers as X
 from scc.tools import find_profile
 from scc.actions import Action
+from scc.poller import Poller
 from scc.mapper import Mapper
 from scc.config import Config
+from ctypes import byref
 
 import os, sys, re, time, socket, traceback, threading, logging
 log = logging.getLogger("AutoSwitcher")
 
 class AutoSwitcher(object):
-	INTERVAL = 1
 	
 	def __init__(self):
 		self.dpy = X.open_display(os.environ["DISPLAY"].encode("utf-8"))
+		self.poller = Poller()
+		self.event = X.XEvent()
+		self.atoms = set([ X.intern_atom(self.dpy, name, False) for name in
+			(b"_NET_ACTIVE_WINDOW", b"_NET_WM_NAME", b"WM_NAME") ])
+		self.dirty = True			# Set when window should be checked
 		self.lock = threading.Lock()
 		self.thread = threading.Thread(target=self.connect_daemon)
 		self.config = Config()
+		self.config.subscribe(self.on_config_changed)
 		self.mapper = Mapper(None, None, keyboard=None, mouse=None, gamepad=None)
 		self.mapper.set_special_actions_handler(self)
 		self.enabled = False
@@ -36,7 +47,9 @@ class AutoSwitcher(object):
 		self.exit_code = None
 		self.current_profile = None
 		self.current_window = None
+		self.current_pars = None
 		self.conds = AutoSwitcher.parse_conditions(self.config)
+		self.index = ConditionIndex(self.conds)
 	
 	
 	@staticmethod
@@ -77,8 +90,9 @@ class AutoSwitcher(object):
 		if action is not None:
 			cmpwith = action.to_string()
 		for c in conds.copy().keys():
-			if action is None or conds[c].to_string() == cmpwith:
-				if c.matches(title, wm_class):
+			# Matching first, as to_string is much slower
+			if c.matches(title, wm_class):
+				if action is None or conds[c].to_string() == cmpwith:
 					del conds[c]
 					count += 1
 		log.debug("Removed %s autoswitcher conditions", count)
@@ -111,25 +125,63 @@ class AutoSwitcher(object):
 				elif line.startswith("Current profile:"):
 					profile = line.split(":", 1)[-1].strip()
 					log.debug("Daemon reported profile change: %s", profile)
-					self.current_profile = profile
+					known, self.current_profile = self.current_profile, profile
+					if known is None:
+						# Window was not checked until profile is known.
+						# Woken up only after profile is set, so main
+						# thread doesn't see it unset and skip checking
+						self.wakeup()
 				elif line.startswith("Reconfigured."):
-					log.debug("Reloading config...")
-					self.config = Config()
-					self.conds = AutoSwitcher.parse_conditions(self.config)
+					# Calls on_config_changed if file was really changed
+					self.config.check()
 				elif line.startswith("Controller Count:"):
-					self.enabled = int(line.split(":")[-1]) > 0
+					enabled = int(line.split(":")[-1]) > 0
+					was_enabled, self.enabled = self.enabled, enabled
+					if enabled and not was_enabled:
+						self.wakeup()
 					log.debug("Enabled: %s", self.enabled)
 			
 			self.lock.release()
 	
 	
+	def on_config_changed(self, config):
+		""" Called with self.lock held """
+		log.debug("Config reloaded")
+		self.conds = AutoSwitcher.parse_conditions(config)
+		self.index = ConditionIndex(self.conds)
+	
+	
+	def wakeup(self):
+		""" Makes main thread check active window. Safe to call from any thread """
+		self.dirty = True
+		self.poller.wakeup()
+	
+	
+	def on_x_event(self, *a):
+		""" Reads events from XServer and sets 'dirty' if window should be checked """
+		ev = self.event
+		while X.pending(self.dpy):
+			X.next_event(self.dpy, byref(ev))
+			if ev.type == X.PROPERTYNOTIFY and ev.xproperty.atom in self.atoms:
+				self.dirty = True
+	
+	
 	def check(self, *a):
-		w = X.get_current_window(self.dpy)
-		if w == self.current_window or not self.current_profile:
-			# Window not switched or profile is not known yet
+		if not self.current_profile:
+			# Profile is not known yet
 			return
-		self.current_window = w
-		log.debug("Window switched: %s", w)
+		w = X.get_current_window(self.dpy)
+		if w != self.current_window:
+			self.current_window = w
+			# Profile may have been changed by user since last match, so
+			# new window is matched even if it has same title and class
+			self.current_pars = None
+			log.debug("Window switched: %s", w)
+			# To get notified when title changes. Window may be closed
+			# at any time, what would be reported as error
+			X.ignore_window_errors(w)
+			X.select_input(self.dpy, w, X.PROPERTYCHANGEMASK)
+			X.flush(self.dpy)
 		pars = X.get_window_title(self.dpy, w), X.get_window_class(self.dpy, w)
 
 		if pars[0] is None:
@@ -137,12 +189,15 @@ class AutoSwitcher(object):
 
 		if pars[1] is None:
 			pars = (pars[0], ("",""))
+		
+		if pars == self.current_pars:
+			# Neither window nor its title or class changed
+			return
+		self.current_pars = pars
 
-		for c in self.conds:
-			if c.matches(*pars):
-				action = self.conds[c]
-				action.button_press(self.mapper)
-				action.button_release(self.mapper)
+		for action in self.index.match(*pars):
+			action.button_press(self.mapper)
+			action.button_release(self.mapper)
 	
 	
 	def on_sa_profile(self, mapper, action):
@@ -190,12 +245,19 @@ class AutoSwitcher(object):
 	
 	
 	def run(self):
+		X.select_input(self.dpy, X.get_default_root_window(self.dpy), X.PROPERTYCHANGEMASK)
+		X.flush(self.dpy)
+		self.poller.register(X.connection_number(self.dpy), self.poller.POLLIN, self.on_x_event)
 		self.thread.start()
 		log.debug("AutoSwitcher started")
 		while self.exit_code is None:
-			if self.enabled:
+			self.poller.poll(None)
+			# Events may be read by Xlib while waiting for reply to
+			# something else and those don't wake up poller
+			self.on_x_event()
+			if self.dirty and self.enabled:
+				self.dirty = False
 				self.check()
-			time.sleep(self.INTERVAL)
 		return 1
 
 
@@ -221,7 +283,7 @@ class Condition(object):
 		if type(self.regexp) is str:
 			self.regexp = re.compile(self.regexp)
 		self.wm_class = wm_class
-		self.empty = not ( title or title or regexp or wm_class )
+		self.empty = not ( exact_title or title or regexp or wm_class )
 	
 	
 	def __str__(self):
@@ -301,6 +363,91 @@ class Condition(object):
 		return True
 
 
+class ConditionIndex(object):
+	"""
+	Conditions from dict created by AutoSwitcher.parse_conditions, compiled
+	so only few of them have to be tested when window changes.
+	
+	Every condition is indexed by one of its parts, in this order of
+	preference: by window class in dict, by exact title in another dict,
+	by part of title in Aho-Corasick automaton or by regexp, all regexps
+	being combined into one used to quickly reject windows no regexp
+	matches. Conditions found this way are then fully tested.
+	"""
+	
+	def __init__(self, conds):
+		self.by_class = {}
+		self.by_exact_title = {}
+		titles, self.regexps = [], []
+		self.by_title_position = {}
+		self.positions = {}
+		for position, c in enumerate(conds):
+			if c.empty:
+				continue
+			self.positions[c] = position
+			item = position, c, conds[c]
+			if c.wm_class:
+				self.by_class.setdefault(c.wm_class, []).append(item)
+			elif c.exact_title:
+				self.by_exact_title.setdefault(c.exact_title, []).append(item)
+			elif c.title:
+				titles.append(( c.title, position ))
+				self.by_title_position[position] = item
+			else:
+				self.regexps.append(item)
+		self.titles = Automaton(titles)
+		self.combined = None
+		if self.regexps and all([ c.regexp.groups == 0 for p, c, a in self.regexps ]):
+			# Groups and backreferences would be broken by combining
+			try:
+				self.combined = re.compile("|".join([ "(?:%s)" % (c.regexp.pattern,)
+					for p, c, a in self.regexps ]))
+			except re.error:
+				pass
+	
+	
+	def _candidates(self, window_title, wm_class):
+		candidates = [ self.by_title_position[position]
+			for position in self.titles.find_all(window_title) ]
+		for cls in set(wm_class):
+			candidates += self.by_class.get(cls, [])
+		candidates += self.by_exact_title.get(window_title, [])
+		if self.regexps and (self.combined is None or self.combined.match(window_title)):
+			candidates += self.regexps
+		candidates.sort(key=lambda item: item[0])
+		return [ item for item in candidates if item[1].matches(window_title, wm_class) ]
+	
+	
+	def match(self, window_title, wm_class):
+		"""
+		Returns actions assigned to all conditions matching window,
+		in same order as conditions are defined.
+		"""
+		return [ action for position, c, action in self._candidates(window_title, wm_class) ]
+	
+	
+	def matching(self, window_title, wm_class):
+		""" Returns all conditions matching window, in order of definition """
+		return [ c for position, c, action in self._candidates(window_title, wm_class) ]
+	
+	
+	def winner(self, window_title, wm_class):
+		"""
+		Returns condition that decides what happens with window or None if
+		no condition matches. As actions of all matching conditions are
+		executed in order, that's the last one.
+		"""
+		candidates = self._candidates(window_title, wm_class)
+		if candidates:
+			return candidates[-1][1]
+		return None
+	
+	
+	def position(self, condition):
+		""" Returns position of condition in dict index was created from """
+		return self.positions.get(condition)
+
+
 class AutoswitchOptsMenuGenerator(MenuGenerator):
 	""" Generates entire Autoswich Options submenu """
 	GENERATOR_NAME = "autoswitch"
@@ -348,13 +495,14 @@ class AutoswitchOptsMenuGenerator(MenuGenerator):
 		self.title = X.get_window_title(menuhandler.xdisplay, win)
 		self.wm_class = X.get_window_class(menuhandler.xdisplay, win)
 		self.assigned_prof = None
-		self.conds = AutoSwitcher.parse_conditions(Config())
+		cfg = Config()
+		cfg.check()		# Conditions are saved back, so they have to be fresh
+		self.conds = AutoSwitcher.parse_conditions(cfg)
 		if self.title and "-" in self.title:
 			self.title = self.title.split("-")[-1]
-		for c in self.conds:
-			if c.matches(self.title, self.wm_class):
-				self.assigned_prof = self.conds[c]
-				break
+		winner = ConditionIndex(self.conds).winner(self.title or "", self.wm_class)
+		if winner is not None:
+			self.assigned_prof = self.conds[winner]
 		if win:
 			display_title = self.title or _("No Title")
 			rv.append(self.mk_item(None, _("Current Window: %s") % (self.title[0:25],)))
@@ -5,6 +5,9 @@ SC-Controller - Autoswitch Daemon
 Observes active window and commands scc-daemon to change profiles as needed.
 """
 from __future__ import unicode_literals
+from scc.startup_profile import startup_profile
+import sys
+startup_profile.init(sys.argv)
 
 from scc.x11.autoswitcher import AutoSwitcher
 from scc.lib import xwrappers as X
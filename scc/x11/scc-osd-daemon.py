@@ -6,6 +6,9 @@ SC-Controller - OSD Daemon
 Controls stuff displayed as OSD.
 """
 from __future__ import unicode_literals
+from scc.startup_profile import startup_profile
+import sys
+startup_profile.init(sys.argv)
 from scc.tools import _, set_logging_level
 
 import gi
@@ -58,8 +61,12 @@ class OSDDaemon(object):
 	
 	
 	def on_daemon_reconfigured(self, *a):
-		log.debug("Reloading config...")
-		self.config.reload()
+		# Calls on_config_changed if file was really changed
+		self.config.check()
+	
+	
+	def on_config_changed(self, config):
+		log.debug("Config reloaded")
 		self._check_colorconfig_change()
 	
 	
@@ -162,6 +169,7 @@ class OSDDaemon(object):
 	def on_unknown_message(self, daemon, message):
 		if not message.startswith("OSD:"):
 			return
+		startup_profile.request_received()
 		if message.startswith("OSD: message"):
 			args = shsplit(message)[1:]
 			m = Message()
@@ -292,12 +300,14 @@ class OSDDaemon(object):
 	def run(self):
 		self.daemon = DaemonManager()
 		self.config = Config()
+		self.config.subscribe(self.on_config_changed)
 		self._check_colorconfig_change()
 		self.daemon.connect('alive', self.on_daemon_connected)
 		self.daemon.connect('dead', self.on_daemon_died)
 		self.daemon.connect('profile-changed', self.on_profile_changed)
 		self.daemon.connect('reconfigured', self.on_daemon_reconfigured)
 		self.daemon.connect('unknown-msg', self.on_unknown_message)
+		startup_profile.mark("osd daemon started")
 		self.mainloop.run()
 
 
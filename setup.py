@@ -68,8 +68,13 @@ if __name__ == "__main__":
 				Extension('libuinput', sources = ['scc/uinput.c']),
 				Extension('libcemuhook', define_macros = [('PYTHON', 1)],
 							sources = ['scc/cemuhook_server.c'], libraries = ["z"]),
+				Extension('libgyro', sources = ['scc/gyro.c']),
 				Extension('libhiddrv', sources = ['scc/drivers/hiddrv.c']),
+				Extension('libevdevdrv', sources = ['scc/drivers/evdevdrv.c']),
 				Extension('libsc_by_bt', sources = ['scc/drivers/sc_by_bt.c']),
+				Extension('libsc_dongle', sources = ['scc/drivers/sc_dongle.c']),
+				Extension('libusb_ring', sources = ['scc/drivers/usb_ring.c'],
+							include_dirs = ['/usr/include/libusb-1.0'], libraries = ['usb-1.0']),
 				Extension('libremotepad', sources = ['scc/drivers/remotepad_controller.c']),
 			]
 	)
@@ -0,0 +1,10 @@
+"""
+Redirects everything that tests may write into ~/.cache/scc, such as
+cached input-event-codes.h, into temporary directory. Done when conftest
+is imported, before any test module imports scc.uinput.
+"""
+import os, atexit, shutil, tempfile
+
+_cache = tempfile.mkdtemp(prefix="scc-tests-")
+os.environ["XDG_CACHE_HOME"] = _cache
+atexit.register(shutil.rmtree, _cache, True)
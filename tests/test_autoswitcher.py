@@ -0,0 +1,66 @@
+from scc.x11.autoswitcher import Condition, ConditionIndex
+from collections import OrderedDict
+
+
+class TestAutoswitcher(object):
+	
+	def test_index_order(self):
+		"""
+		Tests if ConditionIndex returns actions of all matching conditions
+		in order in which conditions are defined.
+		"""
+		conds = OrderedDict()
+		conds[Condition(title="Steam")] = "a"
+		conds[Condition(wm_class="steam")] = "b"
+		conds[Condition(wm_class="firefox")] = "c"
+		conds[Condition(regexp="^Ste.*")] = "d"
+		conds[Condition(wm_class="Steam", title="Library")] = "e"
+		conds[Condition()] = "f"
+		index = ConditionIndex(conds)
+		
+		assert index.match("Steam Library", ("steam", "Steam")) == [ "a", "b", "d", "e" ]
+		assert index.match("Steam", ("steam", "steam")) == [ "a", "b", "d" ]
+		assert index.match("Mozilla Firefox", ("Navigator", "firefox")) == [ "c" ]
+		assert index.match("", ("", "")) == [ ]
+		
+		# Same result as testing every condition
+		for pars in (("Steam Library", ("steam", "Steam")), ("Library", ("x", "Steam"))):
+			assert index.match(*pars) == [ conds[c] for c in conds if c.matches(*pars) ]
+	
+	
+	def test_index_same_as_conditions(self):
+		"""
+		Tests if every kind of condition is found by index exactly when
+		it matches window.
+		"""
+		conds = OrderedDict()
+		conds[Condition(exact_title="Steam")] = "a"
+		conds[Condition(title="team")] = "b"
+		conds[Condition(title="Library", exact_title="Library")] = "c"
+		conds[Condition(regexp="^Ste.*")] = "d"
+		conds[Condition(regexp="(Li|Fr)[a-z]+")] = "e"
+		conds[Condition(title="Friends", wm_class="steam")] = "f"
+		conds[Condition(title="a")] = "g"
+		index = ConditionIndex(conds)
+		
+		for title in ("Steam", "Library", "Friends List", "Steam Library", "", "Lib"):
+			for wm_class in (("steam", "Steam"), ("x", "y")):
+				expected = [ conds[c] for c in conds if c.matches(title, wm_class) ]
+				assert index.match(title, wm_class) == expected
+	
+	
+	def test_winner(self):
+		""" Tests if last matching condition is reported as one that won """
+		conds = OrderedDict()
+		first = Condition(wm_class="steam")
+		last = Condition(title="Library")
+		conds[first] = "a"
+		conds[Condition(wm_class="firefox")] = "b"
+		conds[last] = "c"
+		index = ConditionIndex(conds)
+		
+		assert index.winner("Steam Library", ("steam", "Steam")) is last
+		assert index.winner("Steam", ("steam", "Steam")) is first
+		assert index.matching("Steam Library", ("steam", "Steam")) == [ first, last ]
+		assert index.winner("Steam", ("x", "y")) is None
+		assert index.position(last) == 2
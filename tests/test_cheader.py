@@ -0,0 +1,23 @@
+from scc.cheader import defines, cached_defines
+import os
+
+
+class TestCHeader(object):
+	
+	def test_cached_defines(self, tmpdir):
+		"""
+		Tests if cached defines match parsed ones and if cache is
+		invalidated when included header changes.
+		"""
+		tmpdir.join("main.h").write("/* test */\n#define KEY_A 30\n#include \"other.h\"\n")
+		tmpdir.join("other.h").write("\n#define KEY_B (KEY_A + 1)\n")
+		cache = str(tmpdir.join("cache", "defines.json"))
+		
+		parsed = cached_defines(str(tmpdir), "main.h", cache)
+		assert parsed == defines(str(tmpdir), "main.h")
+		assert parsed["KEY_B"] == 31
+		assert os.path.exists(cache)
+		assert cached_defines(str(tmpdir), "main.h", cache) == parsed
+		
+		tmpdir.join("other.h").write("\n#define KEY_B (KEY_A + 2)  \n")
+		assert cached_defines(str(tmpdir), "main.h", cache)["KEY_B"] == 32
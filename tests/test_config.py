@@ -0,0 +1,38 @@
+from scc.config import Config
+import os, json
+
+
+class TestConfig(object):
+	
+	def test_shared_instance(self, tmpdir, monkeypatch):
+		"""
+		Tests if Config() returns same instance, doesn't reload it on its
+		own and check() reloads it only when file is changed.
+		"""
+		monkeypatch.setenv("XDG_CONFIG_HOME", str(tmpdir))
+		changes = []
+		cfg = Config()
+		cfg.subscribe(changes.append)
+		assert Config() is cfg
+		assert changes == []
+		
+		cfg["recent_max"] = 5
+		cfg.save()
+		# Own save is not a change
+		assert not cfg.check()
+		assert not os.path.exists(cfg.filename + ".%s.tmp" % (os.getpid(),))
+		
+		with open(cfg.filename, "r") as f:
+			data = json.loads(f.read())
+		data["recent_max"] = 7
+		with open(cfg.filename, "w") as f:
+			f.write(json.dumps(data) + "\n")
+		assert Config() is cfg
+		assert cfg["recent_max"] == 5
+		assert changes == []
+		
+		assert cfg.check()
+		assert cfg["recent_max"] == 7
+		assert changes == [ cfg ]
+		assert not cfg.check()
+		assert changes == [ cfg ]
@@ -0,0 +1,33 @@
+from scc.drivers import DRIVER_MANIFEST
+from scc import drivers
+import os, re
+
+RE_ID = re.compile(r"^(VENDOR_ID|PRODUCT_ID)\s*=\s*(0x[0-9a-fA-F]+)", re.MULTILINE)
+
+
+class TestDrivers(object):
+	"""
+	Tests static driver manifest, which has to be kept in sync with drivers
+	without importing them.
+	"""
+	
+	def test_manifest_modules(self):
+		"""
+		Tests if every driver listed in manifest exists
+		"""
+		for modname in DRIVER_MANIFEST:
+			filename = os.path.join(drivers.__path__[0], modname + ".py")
+			assert os.path.exists(filename), "Unknown driver '%s'" % (modname,)
+	
+	
+	def test_manifest_ids(self):
+		"""
+		Tests if ids listed in manifest match ids driver registers
+		"""
+		for modname, keys in DRIVER_MANIFEST.items():
+			filename = os.path.join(drivers.__path__[0], modname + ".py")
+			ids = dict(( k, int(v, 16) ) for k, v in RE_ID.findall(open(filename).read()))
+			for subsystem, vendor_id, product_id in keys:
+				assert subsystem in ("usb", "bluetooth")
+				assert (vendor_id, product_id) == (ids["VENDOR_ID"], ids["PRODUCT_ID"]), (
+					"Manifest doesn't match ids of driver '%s'" % (modname,))
@@ -0,0 +1,104 @@
+from scc.event_stream import ClientWriter, EVENT, EVENT_MARKER
+from scc.drivers.fake import FakeController
+from scc.sccdaemon import Client
+from scc.poller import Poller
+import socket, pytest
+
+
+class TestEventStream(object):
+	
+	def test_coalescing(self):
+		"""
+		Tests if queued positions are replaced by newer ones in place,
+		while button events are all sent in order.
+		"""
+		a, b = socket.socketpair()
+		w = ClientWriter(a, Poller())
+		w.queue(EVENT.pack(EVENT_MARKER, 2, 0, 1, 1), "pad")
+		w.queue(EVENT.pack(EVENT_MARKER, 1, 1, 1, 0))
+		w.queue(EVENT.pack(EVENT_MARKER, 1, 1, 0, 0))
+		w.queue(EVENT.pack(EVENT_MARKER, 2, 0, 5, 5), "pad")
+		w.flush_queue()
+		data = b.recv(1024)
+		assert [ tuple(x) for x in EVENT.iter_unpack(data) ] == [
+			( EVENT_MARKER, 2, 0, 5, 5 ),
+			( EVENT_MARKER, 1, 1, 1, 0 ),
+			( EVENT_MARKER, 1, 1, 0, 0 ),
+		]
+	
+	
+	def test_trigger_coalescing(self):
+		"""
+		Tests if merged trigger event carries old position of first
+		replaced event.
+		"""
+		a, b = socket.socketpair()
+		client = Client(a, None, ClientWriter(a, Poller()))
+		controller = FakeController(0)
+		client.send_event(controller, "LT", ( 10, 0 ), coalesce=True, keep_old=True)
+		client.send_event(controller, "LT", ( 20, 10 ), coalesce=True, keep_old=True)
+		client.send_event(controller, "LT", ( 30, 20 ), coalesce=True, keep_old=True)
+		client.wfile.flush_queue()
+		assert b.recv(1024) == b"Event: fake0 LT 30 0\n"
+		client.send_event(controller, "LT", ( 40, 30 ), coalesce=True, keep_old=True)
+		client.wfile.flush_queue()
+		assert b.recv(1024) == b"Event: fake0 LT 40 30\n"
+	
+	
+	def test_slow_client(self):
+		"""
+		Tests if writing to client that doesn't read never blocks and
+		only latest position is sent once client catches up.
+		"""
+		a, b = socket.socketpair()
+		a.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+		poller = Poller()
+		w = ClientWriter(a, poller)
+		w.write(b"x" * 65536)
+		assert not w.closed
+		for i in range(100):
+			w.queue(EVENT.pack(EVENT_MARKER, 2, 0, i, i), "pad")
+			w.flush_queue()
+		
+		received = b""
+		while len(received) < 65536 + EVENT.size:
+			received += b.recv(65536)
+			poller.poll(0)
+			w.flush_queue()
+		assert received[65536:] == EVENT.pack(EVENT_MARKER, 2, 0, 99, 99)
+	
+	
+	def test_dead_client(self):
+		""" Tests if writing to closed socket closes writer """
+		a, b = socket.socketpair()
+		w = ClientWriter(a, Poller())
+		b.close()
+		w.write(b"OK.\n")
+		assert w.closed
+		# Further writes are ignored
+		w.write(b"OK.\n")
+	
+	
+	def test_reserved_reply(self):
+		"""
+		Tests if data written after reserved reply are held back until
+		reply is filled, along with queued events.
+		"""
+		a, b = socket.socketpair()
+		b.setblocking(False)
+		w = ClientWriter(a, Poller())
+		w.write(b"OK.\n")
+		first = w.reserve()
+		w.write(b"Controller: 1\n")
+		second = w.reserve()
+		w.write(b"OK.\n")
+		w.queue(b"Event: A 1\n")
+		w.flush_queue()
+		assert b.recv(1024) == b"OK.\n"
+		w.fill(second, b"Fail: second\n")
+		with pytest.raises(BlockingIOError):
+			b.recv(1024)
+		w.fill(first, b"OK.\n")
+		assert b.recv(1024) == b"OK.\nController: 1\nFail: second\nOK.\n"
+		w.flush_queue()
+		assert b.recv(1024) == b"Event: A 1\n"
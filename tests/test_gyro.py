@@ -0,0 +1,66 @@
+from scc.gyro import GyroReport, GyroAbsState, _get_lib
+from scc.tools import quat2euler, anglediff
+from scc.constants import STICK_PAD_MAX
+from scc.uinput import Axes, Rels
+from math import pi as PI
+import pytest
+
+try:
+	_get_lib()
+except OSError:
+	pytestmark = pytest.mark.skip(reason="libgyro is not compiled")
+
+QUATERNIONS = [
+	( 32767, 0, 0, 0 ),
+	( 23170, 23170, 0, 0 ),
+	( 30000, 5000, 8000, 10000 ),
+	( 1000, 20000, -25000, 4000 ),
+]
+
+
+class TestGyro(object):
+	
+	def test_decode(self):
+		""" Tests if native conversion matches tools.quat2euler """
+		r = GyroReport()
+		for q in QUATERNIONS:
+			expected = quat2euler(*[ x / 32768.0 for x in q ])
+			assert list(r.decode(*q)) == pytest.approx(expected)
+		assert list(r.decode(1000, -2000, 3000, 0, True)) == pytest.approx(
+			[ 1000 / 10430.37, -2000 / 10430.37, 3000 / 10430.37 ])
+	
+	
+	def test_gyroabs(self):
+		"""
+		Tests if initial rotation is determined from first report and
+		values are clamped to range of each axis.
+		"""
+		r = GyroReport()
+		state = GyroAbsState([ Axes.ABS_X, Axes.ABS_Z, Rels.REL_X ], (0.5, 1.0, 0.5))
+		r.decode(*QUATERNIONS[2])
+		assert list(state.compute(r)) == [ 0, 0, 0 ]
+		assert not state.oor
+		
+		pyr = quat2euler(*[ x / 32768.0 for x in QUATERNIONS[3] ])
+		ir = quat2euler(*[ x / 32768.0 for x in QUATERNIONS[2] ])
+		expected = [ int(anglediff(ir[i], pyr[i]) * 2**15 * 0.5 * 2 / PI)
+			for i in (0, 1, 2) ]
+		r.decode(*QUATERNIONS[3])
+		out = state.compute(r)
+		assert out[0] == int(expected[0] * 0.5)
+		assert out[1] == max(0, min(255, expected[1]))
+		assert out[2] == int(expected[2] * 0.01 * 0.5)
+		
+		state.reset()
+		assert list(state.compute(r)) == [ 0, 0, 0 ]
+	
+	
+	def test_deadzone(self):
+		""" Tests if deadzone is applied after rest of math """
+		r = GyroReport()
+		state = GyroAbsState([ Axes.ABS_X, None, None ], (1.0, 1.0, 1.0),
+			( "ROUND", 0, 1000 ))
+		r.decode(*QUATERNIONS[2])
+		state.compute(r)
+		r.decode(*QUATERNIONS[3])
+		assert abs(state.compute(r)[0]) == STICK_PAD_MAX
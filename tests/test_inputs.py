@@ -243,7 +243,110 @@ class TestInputs(object):
 		mapper.input(mapper.controller, _state, state)
 		assert Keys.KEY_V not in mapper.keyboard.pressed
 		assert Keys.KEY_Y not in mapper.keyboard.pressed
-
+		
 		_state, state = state, state._replace(buttons=SCButtons.A)
 		mapper.input(mapper.controller, _state, state)
 		assert Keys.KEY_Y in mapper.keyboard.pressed
+	
+	
+	@input_test
+	def test_input_rate(self, mapper):
+		"""
+		Tests if states received faster than allowed input rate are
+		merged, but no button press is lost.
+		"""
+		mapper.profile.buttons[SCButtons.A] = (parser
+			.restart("button(Keys.KEY_ENTER)")).parse()
+		mapper.profile.stick = parser.restart("XY(axis(Axes.ABS_X), axis(Axes.ABS_Y))").parse()
+		mapper.set_input_rate(10)
+		pressed = []
+		_press = mapper.keyboard.pressEvent
+		def press(keys):
+			pressed.extend(keys)
+			_press(keys)
+		mapper.keyboard.pressEvent = press
+		
+		mapper.input(mapper.controller, ZERO_STATE, ZERO_STATE)
+		# Quick click and stick movement, all within same tick
+		state = ZERO_STATE._replace(buttons=SCButtons.A, lpad_x=1000)
+		mapper.input(mapper.controller, ZERO_STATE, state)
+		mapper.input(mapper.controller, state, ZERO_STATE._replace(lpad_x=2000))
+		mapper.input(mapper.controller, ZERO_STATE, ZERO_STATE._replace(lpad_x=3000))
+		assert pressed == []
+		assert Axes.ABS_X not in mapper.gamepad.axes
+		# Wait for tick
+		for x in range(8):
+			mapper.input(mapper.controller, ZERO_STATE, ZERO_STATE._replace(lpad_x=3000))
+		assert pressed == [ Keys.KEY_ENTER ]
+		assert mapper.gamepad.axes[Axes.ABS_X] == 3000
+		# Wait for next tick, button should be released
+		for x in range(10):
+			mapper.input(mapper.controller, ZERO_STATE, ZERO_STATE._replace(lpad_x=3000))
+		assert Keys.KEY_ENTER not in mapper.keyboard.pressed
+	
+	
+	@input_test
+	def test_cancel_all(self, mapper):
+		"""
+		Tests if actions interrupted by profile change by middle of
+		execution work normally after profile is switched back.
+		"""
+		profile = mapper.profile
+		profile.buttons[SCButtons.A] = (parser.restart(
+			"button(Keys.KEY_A) ; button(Keys.KEY_B)"
+		)).parse()
+		profile.buttons[SCButtons.A].hold_time = 0.05
+		profile.buttons[SCButtons.B] = (parser.restart(
+			"doubleclick(button(Keys.KEY_X), button(Keys.KEY_Y))"
+		)).parse()
+		
+		# Tasks are scheduled relative to time of last update, as in daemon
+		_input = mapper.input
+		def input(*a):
+			mapper.scheduler.update_time()
+			_input(*a)
+		mapper.input = input
+		
+		def switch_away_and_back(state):
+			mapper.cancel_all()
+			mapper.release_virtual_buttons()
+			mapper.profile = Profile(parser)
+			mapper.input(mapper.controller, state, ZERO_STATE)
+			mapper.profile = profile
+		
+		# Start macro and switch profile while 1st key is pressed
+		state = ZERO_STATE._replace(buttons=SCButtons.A)
+		mapper.input(mapper.controller, ZERO_STATE, state)
+		assert Keys.KEY_A in mapper.keyboard.pressed
+		switch_away_and_back(state)
+		assert Keys.KEY_A not in mapper.keyboard.pressed
+		
+		# Macro should start again from beginning
+		mapper.input(mapper.controller, ZERO_STATE, state)
+		assert Keys.KEY_A in mapper.keyboard.pressed
+		pressed = []
+		_press = mapper.keyboard.pressEvent
+		def press(keys):
+			pressed.extend(keys)
+			_press(keys)
+		mapper.keyboard.pressEvent = press
+		mapper.input(mapper.controller, state, ZERO_STATE)
+		for x in range(10):
+			mapper.input(mapper.controller, ZERO_STATE, ZERO_STATE)
+		assert pressed == [ Keys.KEY_B ]
+		assert not mapper.keyboard.pressed
+		
+		# Click once and switch profile before doubleclick timeouts
+		state = ZERO_STATE._replace(buttons=SCButtons.B)
+		mapper.input(mapper.controller, ZERO_STATE, state)
+		mapper.input(mapper.controller, state, ZERO_STATE)
+		switch_away_and_back(ZERO_STATE)
+		
+		# Next click should be single click, not double
+		del pressed[:]
+		mapper.input(mapper.controller, ZERO_STATE, state)
+		mapper.input(mapper.controller, state, ZERO_STATE)
+		for x in range(100):
+			mapper.input(mapper.controller, ZERO_STATE, ZERO_STATE)
+		assert pressed == [ Keys.KEY_Y ]
+		assert not mapper.keyboard.pressed
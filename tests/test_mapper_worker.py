@@ -0,0 +1,186 @@
+from scc.mapper_worker import Ring, ControllerState, STATE_FIELDS, WorkerMapper
+from scc.mapper_worker import FLAG_GYRO_ENABLED, get_sources, set_source
+from scc.parser import ActionParser, TalkingActionParser
+from scc.drivers.fake import FakeController
+from scc.constants import SCButtons
+from scc.scheduler import Scheduler
+from scc.sccdaemon import SCCDaemon
+from scc.profile import Profile
+from scc.actions import NoAction
+from scc.poller import Poller
+from types import SimpleNamespace
+import os, time, select, ctypes
+
+
+class DriverState(ctypes.Structure):
+	_fields_ = [
+		('buttons', ctypes.c_uint32),
+		('lpad_x', ctypes.c_int32),
+		('lpad_y', ctypes.c_int32),
+	]
+
+
+class TestMapperWorker(object):
+	
+	def test_ring(self):
+		""" Tests if states are read in order they were written """
+		writer = Ring()
+		reader = Ring(writer.fd)
+		state = DriverState()
+		state.buttons = SCButtons.A
+		state.lpad_x = -1000
+		assert writer.push(FLAG_GYRO_ENABLED, state)
+		state.lpad_x = 2000
+		assert writer.push(0, state)
+		flags, s = reader.pop()
+		assert flags == FLAG_GYRO_ENABLED
+		assert s.buttons == SCButtons.A and s.lpad_x == -1000
+		# Fields missing in driver state are zeroed
+		assert s.stick_x == 0
+		assert reader.pop()[1].lpad_x == 2000
+		assert reader.pop() is None
+		assert writer.push(0, state)
+	
+	
+	def test_full_ring(self):
+		""" Tests if ring drops new states instead of overwriting old """
+		writer = Ring()
+		reader = Ring(writer.fd)
+		zero = ControllerState(*[ 0 ] * len(STATE_FIELDS))
+		for i in range(Ring.SIZE + 10):
+			assert writer.push(0, zero._replace(ltrig=i)) == (i < Ring.SIZE)
+		for i in range(Ring.SIZE):
+			assert reader.pop()[1].ltrig == i
+		assert reader.pop() is None
+	
+	
+	def test_ring_processes(self):
+		"""
+		Tests if reader in another process, woken up by eventfd as worker
+		is, receives every state without stalling.
+		"""
+		COUNT = 50000
+		writer = Ring()
+		wakeup = os.eventfd(0, os.EFD_NONBLOCK)
+		zero = ControllerState(*[ 0 ] * len(STATE_FIELDS))
+		pid = os.fork()
+		if pid == 0:
+			try:
+				for i in range(COUNT):
+					while not writer.push(0, zero._replace(ltrig=i)):
+						# Ring is full, wait for reader
+						time.sleep(0.0001)
+					os.eventfd_write(wakeup, 1)
+			finally:
+				os._exit(0)
+		
+		reader = Ring(writer.fd)
+		received = 0
+		try:
+			while received < COUNT:
+				ready, _, _ = select.select([ wakeup ], [], [], 5.0)
+				assert ready, "Reader stalled after %s states" % (received,)
+				for i in range(os.eventfd_read(wakeup)):
+					flags, state = reader.pop()
+					assert state.ltrig == received
+					received += 1
+			assert reader.pop() is None
+		finally:
+			os.waitpid(pid, 0)
+	
+	
+	def test_sources(self):
+		""" Tests if every input in profile is covered by get_sources """
+		profile = Profile(ActionParser())
+		sources = get_sources(profile)
+		assert len(sources) == len(SCButtons) + 2 + 3 + 2
+		a = ActionParser().restart("button(Keys.KEY_A)").parse()
+		set_source(profile, ("buttons", SCButtons.B), a)
+		set_source(profile, ("stick",), a)
+		assert profile.buttons[SCButtons.B] is a
+		assert profile.stick is a
+		assert get_sources(profile)["pads", Profile.LEFT] is NoAction()
+	
+	
+	def test_worker(self, tmpdir, monkeypatch):
+		"""
+		Tests if default profile loaded by daemon is sent to worker process
+		and if special action executed there comes back to daemon.
+		"""
+		monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+		filename = os.path.join(str(tmpdir), "test.sccprofile")
+		profile = Profile(TalkingActionParser())
+		profile.buttons[SCButtons.A] = (TalkingActionParser()
+			.restart("profile('Other')").parse())
+		profile.save(filename)
+		
+		executed = []
+		class Handler(object):
+			def on_sa_profile(self, mapper, action):
+				executed.append(action.profile)
+		
+		poller = Poller()
+		mapper = WorkerMapper(Profile(TalkingActionParser()), Scheduler(),
+			keyboard=None, mouse=None, gamepad=False, poller=poller)
+		try:
+			mapper.set_special_actions_handler(Handler())
+			daemon = SimpleNamespace(default_profile=filename, default_mapper=mapper)
+			SCCDaemon.load_default_profile(daemon)
+			controller = FakeController(0)
+			mapper.set_controller(controller)
+			zero = ControllerState(*[ 0 ] * len(STATE_FIELDS))
+			pressed = zero._replace(buttons=SCButtons.A)
+			mapper.input(controller, zero, pressed)
+			mapper.input(controller, pressed, zero)
+			deadline = time.time() + 10
+			while not executed and time.time() < deadline:
+				poller.poll(0.1)
+			assert executed == [ "Other" ]
+		finally:
+			mapper._process.kill()
+			mapper._process.wait()
+	
+	
+	def test_worker_restart(self, tmpdir, monkeypatch):
+		"""
+		Tests if worker that died is reaped and replaced by new one
+		that still gets profile and controller.
+		"""
+		monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+		filename = os.path.join(str(tmpdir), "test.sccprofile")
+		profile = Profile(TalkingActionParser())
+		profile.buttons[SCButtons.A] = (TalkingActionParser()
+			.restart("profile('Other')").parse())
+		profile.save(filename)
+		
+		executed = []
+		class Handler(object):
+			def on_sa_profile(self, mapper, action):
+				executed.append(action.profile)
+		
+		poller = Poller()
+		mapper = WorkerMapper(Profile(TalkingActionParser()), Scheduler(),
+			keyboard=None, mouse=None, gamepad=False, poller=poller)
+		try:
+			mapper.set_special_actions_handler(Handler())
+			mapper.profile = Profile(TalkingActionParser()).load(filename)
+			controller = FakeController(0)
+			mapper.set_controller(controller)
+			dead = mapper._process
+			dead.kill()
+			deadline = time.time() + 10
+			while mapper._process is dead and time.time() < deadline:
+				poller.poll(0.1)
+			assert dead.returncode is not None
+			assert mapper._process is not dead
+			
+			zero = ControllerState(*[ 0 ] * len(STATE_FIELDS))
+			pressed = zero._replace(buttons=SCButtons.A)
+			mapper.input(controller, zero, pressed)
+			mapper.input(controller, pressed, zero)
+			while not executed and time.time() < deadline:
+				poller.poll(0.1)
+			assert executed == [ "Other" ]
+		finally:
+			mapper._process.kill()
+			mapper._process.wait()
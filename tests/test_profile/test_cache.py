@@ -0,0 +1,116 @@
+from scc.profile_cache import profile_cache, ProfileCache, ProfileLRU
+from scc.constants import SCButtons
+from scc.profile import Profile
+from scc.actions import ButtonAction
+from scc.uinput import Keys
+from . import parser
+from scc.poller import Poller
+import os
+
+
+class TestProfileCache(object):
+	
+	def test_cache(self, tmpdir, monkeypatch):
+		"""
+		Tests if profile is loaded from cache when unchanged and parsed
+		again when file is modified.
+		"""
+		monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+		monkeypatch.setattr(profile_cache, "writable", True)
+		filename = os.path.join(str(tmpdir), "test.sccprofile")
+		profile = Profile(parser)
+		profile.buttons[SCButtons.A] = ButtonAction(Keys.KEY_A)
+		profile.save(filename)
+		hits, misses = profile_cache.get_stats()
+		
+		p1 = Profile(parser).load(filename)
+		assert profile_cache.get_stats() == (hits, misses + 1)
+		p2 = Profile(parser).load(filename)
+		assert profile_cache.get_stats() == (hits + 1, misses + 1)
+		assert p2.buttons[SCButtons.A].button == Keys.KEY_A
+		assert p2.buttons[SCButtons.A] is not p1.buttons[SCButtons.A]
+		assert p2.get_filename() == filename
+		
+		profile.buttons[SCButtons.A] = ButtonAction(Keys.KEY_B)
+		profile.save(filename)
+		os.utime(filename, ns=(0, 0))
+		p3 = Profile(parser).load(filename)
+		assert profile_cache.get_stats() == (hits + 1, misses + 2)
+		assert p3.buttons[SCButtons.A].button == Keys.KEY_B
+
+	
+	
+	def test_read_only(self, tmpdir, monkeypatch):
+		""" Tests if cache is not written unless it's made writable """
+		monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+		filename = os.path.join(str(tmpdir), "test.sccprofile")
+		Profile(parser).save(filename)
+		Profile(parser).load(filename)
+		assert not os.path.exists(ProfileCache.get_cache_filename(filename, parser))
+	
+	
+	def test_source_change(self, monkeypatch):
+		"""
+		Tests if cache key changes when source of module defining
+		actions changes.
+		"""
+		signature = ProfileCache.get_action_set_signature()
+		assert signature == ProfileCache.get_action_set_signature()
+		assert ProfileCache._sources["scc.modifiers"]
+		monkeypatch.setitem(ProfileCache._sources, "scc.modifiers", "changed")
+		assert signature != ProfileCache.get_action_set_signature()
+	
+	
+	def test_lru(self, tmpdir, monkeypatch):
+		"""
+		Tests if profile is reused only when its file wasn't changed and
+		that every reused profile has its own, fresh actions.
+		"""
+		monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+		filename = os.path.join(str(tmpdir), "test.sccprofile")
+		profile = Profile(parser)
+		profile.buttons[SCButtons.A] = parser.restart(
+			"mode(B, button(Keys.KEY_V), button(Keys.KEY_Y))").parse()
+		profile.save(filename)
+		lru = ProfileLRU(size=1)
+		
+		assert lru.get(filename, Profile(parser)) is None
+		p1 = lru.load(filename, Profile(parser))
+		p2 = lru.get(filename, Profile(parser))
+		assert p2 is not None and p2 is not p1
+		assert p2.buttons[SCButtons.A] is not p1.buttons[SCButtons.A]
+		assert len(p2.buttons[SCButtons.A].checks) == 1
+		assert p2.get_filename() == filename
+		# Changes done to profile in use are not reused
+		p2.buttons[SCButtons.B] = ButtonAction(Keys.KEY_B)
+		p3 = lru.get(filename, Profile(parser))
+		assert p3.buttons[SCButtons.B] is not p2.buttons[SCButtons.B]
+		
+		os.utime(filename, ns=(0, 0))
+		assert lru.get(filename, Profile(parser)) is None
+		
+		# Size limit
+		other = os.path.join(str(tmpdir), "other.sccprofile")
+		Profile(parser).save(other)
+		lru.load(filename, Profile(parser))
+		lru.load(other, Profile(parser))
+		assert lru.get(filename, Profile(parser)) is None
+		assert lru.get(other, Profile(parser)) is not None
+	
+	
+	def test_lru_inotify(self, tmpdir, monkeypatch):
+		""" Tests if profile is dropped from LRU when its file is written """
+		monkeypatch.setenv("XDG_CACHE_HOME", str(tmpdir))
+		filename = os.path.join(str(tmpdir), "test.sccprofile")
+		Profile(parser).save(filename)
+		poller = Poller()
+		lru = ProfileLRU()
+		lru.start_watching(poller)
+		
+		lru.load(filename, Profile(parser))
+		st = os.stat(filename)
+		Profile(parser).save(filename)
+		# Keep mtime, so only inotify can notice the change
+		os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns))
+		poller.poll(0.1)
+		assert lru.get(filename, Profile(parser)) is None
@@ -0,0 +1,44 @@
+from scc.replay import Recorder, Replayer, load_recording
+from scc.drivers.fake import FakeController
+from scc.constants import SCButtons
+from scc.parser import ActionParser
+from scc.profile import Profile
+from scc.uinput import Keys
+from collections import namedtuple
+import os
+
+State = namedtuple('State', 'buttons ltrig rtrig lpad_x lpad_y')
+parser = ActionParser()
+
+
+class TestReplay(object):
+	
+	def test_record_and_replay(self, tmpdir):
+		"""
+		Tests if recorded inputs are replayed through profile and if
+		replaying same recording twice generates same events.
+		"""
+		filename = os.path.join(str(tmpdir), "test.sccrec")
+		controller = FakeController(0)
+		recorder = Recorder(filename)
+		for buttons in (0, SCButtons.A, 0, SCButtons.A, 0):
+			recorder.record(controller, State(buttons, 0, 0, 0, 0))
+		recorder.close()
+		
+		records = load_recording(filename)
+		assert len(records) == 5
+		assert records[0].type == "fake"
+		assert records[1].state.buttons == SCButtons.A
+		assert records[1].state.stick_x == 0
+		
+		digests = []
+		for x in (0, 1):
+			profile = Profile(parser)
+			profile.buttons[SCButtons.A] = parser.restart("button(KEY_A)").parse()
+			replayer = Replayer(profile)
+			stats = replayer.replay(records)
+			assert stats.count == 5
+			assert ("keyboard", "press", (Keys.KEY_A,)) in replayer.events
+			assert ("keyboard", "release", (Keys.KEY_A,)) in replayer.events
+			digests.append(replayer.get_digest())
+		assert digests[0] == digests[1]
@@ -0,0 +1,105 @@
+from scc.scheduler import Scheduler
+import threading, time
+
+
+class TestScheduler(object):
+	
+	def test_order(self, monkeypatch):
+		"""
+		Tests if tasks are executed in order, no matter in which
+		order they were scheduled.
+		"""
+		now = [ 100.0 ]
+		monkeypatch.setattr(time, "time", lambda: now[0])
+		s, executed = Scheduler(), []
+		s.schedule(0.3, executed.append, 3)
+		s.schedule(0.1, executed.append, 1)
+		s.schedule(0.2, executed.append, 2)
+		assert abs(s.get_timeout() - 0.1) < 0.0001
+		now[0] += 0.25
+		assert s.run()
+		assert executed == [ 1, 2 ]
+		now[0] += 0.1
+		assert s.run()
+		assert executed == [ 1, 2, 3 ]
+		assert not s.run()
+		assert s.get_timeout() is None
+	
+	
+	def test_cancel(self, monkeypatch):
+		"""
+		Tests if canceled task is not executed and canceling
+		executed task fails.
+		"""
+		now = [ 100.0 ]
+		monkeypatch.setattr(time, "time", lambda: now[0])
+		s, executed = Scheduler(), []
+		a = s.schedule(0.1, executed.append, "a")
+		b = s.schedule(0.2, executed.append, "b")
+		assert s.cancel_task(a)
+		assert not a.cancel()
+		assert abs(s.get_timeout() - 0.2) < 0.0001
+		now[0] += 1
+		s.run()
+		assert executed == [ "b" ]
+		assert not s.cancel_task(b)
+		assert s.get_stats()["depth"] == 0
+	
+	
+	def test_cancel_owned(self, monkeypatch):
+		"""
+		Tests if all tasks of one owner can be canceled at once.
+		"""
+		now = [ 100.0 ]
+		monkeypatch.setattr(time, "time", lambda: now[0])
+		s, executed = Scheduler(), []
+		s.schedule(0.1, executed.append, "a", owner="x")
+		s.schedule(0.1, executed.append, "b", owner="y")
+		s.schedule(0.1, executed.append, "c", owner="x")
+		assert s.cancel_owned("x") == 2
+		assert s.get_stats()["depth"] == 1
+		now[0] += 1
+		s.run()
+		assert executed == [ "b" ]
+	
+	
+	def test_late(self, monkeypatch):
+		"""
+		Tests if late executed tasks are counted.
+		"""
+		now = [ 100.0 ]
+		monkeypatch.setattr(time, "time", lambda: now[0])
+		s = Scheduler()
+		s.schedule(0.1, lambda: None)
+		s.schedule(0.5, lambda: None)
+		now[0] += 0.1
+		s.run()
+		now[0] += 1
+		s.run()
+		stats = s.get_stats()
+		assert stats["executed"] == 2
+		assert stats["late"] == 1
+	
+	
+	def test_other_thread(self, monkeypatch):
+		"""
+		Tests if task scheduled from another thread is timed from current
+		time, not from last run, and wakes up mainloop.
+		"""
+		now = [ 100.0 ]
+		monkeypatch.setattr(time, "time", lambda: now[0])
+		wakeups, executed = [], []
+		s = Scheduler(wakeup=lambda: wakeups.append(1))
+		s.schedule(0.1, executed.append, "main")
+		assert wakeups == []
+		now[0] += 1.0
+		t = threading.Thread(target=s.schedule, args=(0.1, executed.append, "thread"))
+		t.start()
+		t.join()
+		assert wakeups == [ 1 ]
+		assert abs(s.get_timeout()) < 0.0001
+		s.run()
+		assert executed == [ "main" ]
+		now[0] += 0.1
+		s.run()
+		assert executed == [ "main", "thread" ]
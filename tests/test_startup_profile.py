@@ -0,0 +1,45 @@
+from scc.startup_profile import StartupProfile, _TimingFinder, OPTION, ENV_VAR
+import os, sys
+
+
+class TestStartupProfile(object):
+	
+	def test_import_times(self, tmpdir, monkeypatch):
+		"""
+		Tests if option is removed from argv and if imports done after
+		it's enabled are recorded, including nested ones.
+		"""
+		monkeypatch.setenv(ENV_VAR, "")
+		monkeypatch.setattr(sys, "meta_path", list(sys.meta_path))
+		monkeypatch.syspath_prepend(str(tmpdir))
+		tmpdir.join("sp_test_outer.py").write("import sp_test_inner\n")
+		tmpdir.join("sp_test_inner.py").write("x = 1\n")
+		
+		p = StartupProfile()
+		argv = [ "scc-osd-menu", OPTION, "-x", "10" ]
+		p.init(argv)
+		assert argv == [ "scc-osd-menu", "-x", "10" ]
+		assert p.enabled
+		assert os.environ[ENV_VAR] == "1"
+		assert isinstance(sys.meta_path[0], _TimingFinder)
+		
+		import sp_test_outer
+		assert sp_test_outer.sp_test_inner.x == 1
+		imports = { name : (self_time, total) for name, self_time, total in p.get_imports() }
+		assert "sp_test_outer" in imports
+		assert "sp_test_inner" in imports
+		assert imports["sp_test_outer"][1] >= imports["sp_test_inner"][1]
+		del sys.modules["sp_test_outer"], sys.modules["sp_test_inner"]
+	
+	
+	def test_disabled(self, monkeypatch):
+		"""
+		Tests if profiling stays disabled without option or env variable
+		"""
+		monkeypatch.setenv(ENV_VAR, "")
+		p = StartupProfile()
+		argv = [ "scc-osd-menu" ]
+		p.init(argv)
+		assert not p.enabled
+		p.mark("nothing")
+		assert p.get_imports() == []
@@ -0,0 +1,63 @@
+from scc.state_page import StatePage, StatePageReader, SEQ, get_state_page_path
+from scc.state_page import FLAG_LPADTOUCH, FLAG_GYRO_ENABLED
+from scc.constants import SCButtons
+from collections import namedtuple
+import os, stat, pytest
+
+State = namedtuple("State", "buttons lpad_x lpad_y")
+
+
+class FakeController(object):
+	def get_gyro_enabled(self):
+		return True
+
+
+class TestStatePage(object):
+	
+	def test_read_write(self, tmpdir):
+		"""
+		Tests if reader sees last written state and report counter.
+		"""
+		filename = str(tmpdir.join("state-test"))
+		page = StatePage(filename)
+		assert stat.S_IMODE(os.stat(filename).st_mode) == 0o600
+		reader = StatePageReader(filename)
+		page.update(None, State(SCButtons.A, 100, -100))
+		page.update(FakeController(), State(SCButtons.LPADTOUCH, 200, -200))
+		counter, flags, state = reader.read()
+		assert counter == 2
+		assert flags == FLAG_LPADTOUCH | FLAG_GYRO_ENABLED
+		assert state["buttons"] == SCButtons.LPADTOUCH
+		assert state["lpad_x"] == 200 and state["lpad_y"] == -200
+		# Fields missing in driver state are zeroed
+		assert state["stick_x"] == 0
+		
+		page.close()
+		assert not os.path.exists(filename)
+		reader.close()
+	
+	
+	def test_write_in_progress(self, tmpdir):
+		"""
+		Tests if reader gives up on page that is being written.
+		"""
+		filename = str(tmpdir.join("state-test"))
+		page = StatePage(filename)
+		reader = StatePageReader(filename)
+		page.update(None, State(0, 0, 0))
+		SEQ.pack_into(page._mem, 0, 3)
+		assert reader.read() is None
+		reader.close()
+		page.close()
+	
+	
+	def test_runtime_path(self, tmpdir, monkeypatch):
+		"""
+		Tests if page is created in XDG_RUNTIME_DIR, not on disk with config.
+		"""
+		monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmpdir))
+		filename = get_state_page_path("usb:28de/1142")
+		assert filename == str(tmpdir.join("scc", "state-usb:28de_1142"))
+		page = StatePage(filename)
+		assert stat.S_IMODE(os.stat(str(tmpdir.join("scc"))).st_mode) == 0o700
+		page.close()
@@ -0,0 +1,37 @@
+from scc.tracing import Histogram, Tracer
+
+
+class TestTracing(object):
+	
+	def test_histogram(self):
+		"""
+		Tests if percentiles computed by histogram are close enough
+		to real values.
+		"""
+		h = Histogram()
+		assert h.percentile(50) == 0
+		for x in range(1, 1001):
+			h.add(x)
+		assert h.count == 1000
+		assert h.max == 1000
+		assert 500 <= h.percentile(50) < 500 * 1.1
+		assert 990 <= h.percentile(99) <= 1000
+		assert h.percentile(100) == 1000
+	
+	
+	def test_dropped(self):
+		"""
+		Tests if dropped messages are counted even with tracing disabled
+		and reported only once.
+		"""
+		t = Tracer()
+		assert t.get_dropped() == []
+		assert t.report_dropped("usb:28de:1142", "control") == 1
+		assert t.report_dropped("usb:28de:1142", "control") == 2
+		assert t.report_dropped("usb:28de:1102", "control") == 1
+		assert t.get_dropped() == [
+			("usb:28de:1102", "control", 1),
+			("usb:28de:1142", "control", 2),
+		]
+		assert t.get_dropped() == []
+		assert t.report_dropped("usb:28de:1142", "control") == 1